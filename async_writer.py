@@ -0,0 +1,99 @@
+"""
+contiene el escritor en segundo plano: recibe copias de los datos a guardar
+por una cola acotada y los escribe en disco desde un hilo propio, para que
+la simulación no se detenga en la entrada/salida
+"""
+
+import queue
+import threading
+
+import matplotlib.image as mpimg
+import numpy as np
+
+
+class BackgroundWriter:
+    """Hilo que ejecuta en orden las escrituras que se le envían
+
+    submit pone en la cola una función con sus argumentos; los argumentos
+    deben ser copias que la simulación ya no modifica (por ejemplo
+    Population.copy()). Si la cola está llena submit espera a que el hilo
+    libere un lugar, así la memoria usada por los datos pendientes queda
+    acotada. Un error en el hilo se vuelve a lanzar en el siguiente submit,
+    flush o close.
+
+    Keyword arguments
+    -----------------
+    max_pending : int
+        escrituras que pueden estar en la cola
+    """
+
+    def __init__(self, max_pending=8):
+        self._queue = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._work, name="simulation-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                if self._error is None:
+                    function, args, kwargs = task
+                    function(*args, **kwargs)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    @property
+    def pending(self):
+        """Escrituras en la cola"""
+        return self._queue.qsize()
+
+    def submit(self, function, *args, **kwargs):
+        """Encola function(*args, **kwargs), espera si la cola está llena"""
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("el escritor en segundo plano ya está cerrado")
+        self._queue.put((function, args, kwargs))
+
+    def flush(self):
+        """Espera a que terminen todas las escrituras encoladas"""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Termina las escrituras pendientes y detiene el hilo"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+
+def save_figure(fig, path, writer=None, redraw=True):
+    """Guarda la figura como imagen, en segundo plano si hay escritor
+
+    Se copia en el hilo actual el búfer RGBA del lienzo (redibujándolo
+    antes si redraw) y con writer solo la codificación y la escritura pasan
+    al hilo; los lienzos sin búfer RGBA se guardan con savefig.
+    """
+    if not hasattr(fig.canvas, "buffer_rgba"):
+        fig.savefig(path)
+        return
+
+    if redraw:
+        fig.canvas.draw()
+    image = np.array(fig.canvas.buffer_rgba())
+    if writer is None:
+        mpimg.imsave(path, image)
+    else:
+        writer.submit(mpimg.imsave, path, image)
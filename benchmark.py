@@ -0,0 +1,237 @@
+"""
+contiene el banco de pruebas de rendimiento: mide Simulation.tstep y sus
+etapas para varios tamaños de población y escenarios, guarda los
+resultados en JSON y los compara con una línea base guardada
+
+Uso: python benchmark.py --sizes 1000 10000 --output bench.json --baseline base.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from ensemble import SCENARIOS, build_simulation
+
+# tamaño de población con el que el mundo por defecto (2 x 2) tiene su densidad normal
+REFERENCE_POP = 2000
+REFERENCE_WORLD = 2.0
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_SCENARIOS = ("baseline",) + tuple(SCENARIOS)
+SCALINGS = ("density", "world")
+
+
+def world_size(pop_size, scaling):
+    """Tamaño del mundo: fijo, o escalado para mantener la densidad"""
+    if scaling == "world":
+        return [REFERENCE_WORLD, REFERENCE_WORLD]
+    side = REFERENCE_WORLD * np.sqrt(pop_size / REFERENCE_POP)
+    return [float(side), float(side)]
+
+
+def scenario_kwargs(scenario, pop_size, scaling):
+    """Argumentos del escenario escalados con la densidad
+
+    El autoaislamiento fija su propio mundo (unos 1.1 x 1); con
+    scaling='density' ese mundo y el área aislada se agrandan en la misma
+    proporción que world_size. Los demás escenarios no cambian el mundo.
+    """
+    if scenario != "self_isolation" or scaling == "world":
+        return None
+    k = float(np.sqrt(pop_size / REFERENCE_POP))
+    return {
+        "isolation_bounds": [b * k for b in (0.02, 0.02, 0.09, 0.98)],
+        "xbounds": [0.1 * k, 1.1 * k],
+        "ybounds": [0.02 * k, 0.98 * k],
+    }
+
+
+def run_case(
+    pop_size, scenario="baseline", scaling="density", steps=50, warmup=60, seed=0
+):
+    """Mide un caso: tiempos por paso de tstep y tiempo medio por etapa
+
+    Los primeros warmup pasos no se miden; con el valor por defecto ya se
+    pasó el paso 50, en el que se infecta al paciente cero.
+    """
+
+    config_kwargs = dict(
+        pop_size=pop_size,
+        world_size=world_size(pop_size, scaling),
+        seed=seed,
+        save_pop=False,
+        save_data=False,
+    )
+    sim = build_simulation(
+        config_kwargs,
+        None if scenario == "baseline" else scenario,
+        scenario_kwargs(scenario, pop_size, scaling),
+    )
+
+    for _ in range(warmup):
+        sim.tstep()
+
+    # la instrumentación mide cada etapa solo durante los pasos medidos
+    instruments = sim.set_instrumentation(True)
+    times = np.zeros(steps)
+    for k in range(steps):
+        start = time.perf_counter()
+        sim.tstep()
+        times[k] = time.perf_counter() - start
+    summary = instruments.summary()
+
+    return {
+        "scenario": scenario,
+        "scaling": scaling,
+        "pop_size": pop_size,
+        # el mundo efectivo, que el escenario puede haber cambiado
+        "world_size": [sim.Config.x_plot[1], sim.Config.y_plot[1]],
+        "steps": steps,
+        "warmup": warmup,
+        "seed": seed,
+        "tick_backend": sim.tick_backend,
+        "tstep": {
+            "mean": float(times.mean()),
+            "median": float(np.median(times)),
+            "min": float(times.min()),
+            "p95": float(np.quantile(times, 0.95)),
+        },
+        "phases": {
+            phase: s["mean"]
+            for phase, s in sorted(summary["phases"].items())
+            if phase != "tick"
+        },
+        "counters": summary["counters"],
+        "infectious": int(sim.pop_tracker.infectious[-1]),
+    }
+
+
+def run_benchmarks(
+    sizes=DEFAULT_SIZES,
+    scenarios=DEFAULT_SCENARIOS,
+    scalings=SCALINGS,
+    steps=50,
+    warmup=60,
+    seed=0,
+    verbose=True,
+):
+    """Corre todos los casos y devuelve el informe como diccionario"""
+    results = []
+    for scaling in scalings:
+        for scenario in scenarios:
+            for pop_size in sizes:
+                result = run_case(pop_size, scenario, scaling, steps, warmup, seed)
+                results.append(result)
+                if verbose:
+                    median = result["tstep"]["median"] * 1e3
+                    print(
+                        "%-20s %-8s %8i: %.3f ms/paso"
+                        % (scenario, scaling, pop_size, median)
+                    )
+
+    return {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+
+
+def _case_key(result):
+    return (result["scenario"], result["scaling"], result["pop_size"])
+
+
+def compare(report, baseline, tolerance=0.1):
+    """Compara la mediana de tstep y de cada etapa con una línea base
+
+    Retorna una fila por caso presente en ambos informes con la razón
+    actual / base; regression es verdadero si la razón de tstep supera
+    1 + tolerance.
+    """
+
+    base = {_case_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        reference = base.get(_case_key(result))
+        if reference is None:
+            continue
+        ratio = result["tstep"]["median"] / reference["tstep"]["median"]
+        phases = {
+            phase: value / reference["phases"][phase]
+            for phase, value in result["phases"].items()
+            if reference["phases"].get(phase)
+        }
+        rows.append(
+            {
+                "scenario": result["scenario"],
+                "scaling": result["scaling"],
+                "pop_size": result["pop_size"],
+                "ratio": ratio,
+                "phases": phases,
+                "regression": ratio > 1 + tolerance,
+            }
+        )
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Banco de pruebas de Simulation.tstep"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=list(DEFAULT_SCENARIOS),
+        choices=DEFAULT_SCENARIOS,
+    )
+    parser.add_argument(
+        "--scaling", nargs="+", default=list(SCALINGS), choices=SCALINGS
+    )
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="archivo JSON con los resultados")
+    parser.add_argument("--baseline", help="archivo JSON con la línea base")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.sizes, args.scenarios, args.scaling, args.steps, args.warmup, args.seed
+    )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows = compare(report, json.load(f), args.tolerance)
+        report["comparison"] = rows
+        for row in rows:
+            print(
+                "%-20s %-8s %8i: %.2fx%s"
+                % (
+                    row["scenario"],
+                    row["scaling"],
+                    row["pop_size"],
+                    row["ratio"],
+                    "  REGRESION" if row["regression"] else "",
+                )
+            )
+        regressions = [row for row in rows if row["regression"]]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
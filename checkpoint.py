@@ -0,0 +1,276 @@
+"""
+contiene los puntos de control de la simulación: guardan la población, los
+destinos, los contadores, el paso actual, la configuración y el estado del
+generador aleatorio para retomar una corrida o bifurcarla en varios
+escenarios de intervención
+"""
+
+import copy
+import os
+import pickle
+
+import numpy as np
+
+from config import config_error
+from event_log import EventLog
+from population import (
+    POPULATION_COLUMNS,
+    TRACKER_SERIES,
+    Population,
+    Population_trackers,
+)
+from random_streams import RandomBlock
+from utils import check_folder
+
+# archivo con el estado que no es la población ni los destinos
+STATE_FILE = "state.pkl"
+DESTINATIONS_FILE = "destinations.npy"
+
+
+def _column_file(index):
+    return "population_%02i_%s.npy" % (index, POPULATION_COLUMNS[index][0])
+
+
+class Checkpoint:
+    """Estado completo de una simulación en un paso dado
+
+    Guarda las columnas de la población, la matriz de destinos y un
+    diccionario con el resto del estado (paso, Configuration, series de
+    Population_trackers, horario, registro de eventos, semilla y estado del
+    generador). En disco es una carpeta con un .npy por columna, la matriz
+    de destinos y state.pkl; al cargarla los .npy se abren con memoria
+    mapeada en modo copia-al-escribir, de modo que restaurar no lee la
+    población completa y cada simulación restaurada escribe sobre su propia
+    copia.
+
+    Keyword arguments
+    -----------------
+    columns : list
+        columnas de la población en el orden de POPULATION_COLUMNS
+
+    destinations : ndarray
+        matriz de destinos
+
+    state : dict
+        resto del estado de la simulación
+    """
+
+    def __init__(self, columns, destinations, state):
+        self.columns = columns
+        self.destinations = destinations
+        self.state = state
+        # carpeta mapeada en memoria de la que se restaura, la fija load
+        self.path = None
+
+    @property
+    def frame(self):
+        return self.state["frame"]
+
+    @classmethod
+    def capture(cls, sim):
+        """Copia el estado actual de una simulación"""
+        config = copy.copy(sim.Config)
+        # el generador se guarda aparte como estado del PCG64
+        config.rng = None
+
+        state = {
+            "frame": sim.frame,
+            "Config": copy.deepcopy(config),
+            "trackers": copy.deepcopy(vars(sim.pop_tracker)),
+            "schedule": copy.deepcopy(sim.schedule),
+            "seed_sequence": copy.deepcopy(sim.seed_sequence),
+            "rng_state": sim.rng.bit_generator.state,
+            "float_dtype": sim.population.float_dtype.str,
+            "track_indices": sim.population.track_indices,
+            "events": None if sim.events is None else np.array(sim.events.events()),
+        }
+        columns = [
+            np.array(sim.population[:, c]) for c in range(len(POPULATION_COLUMNS))
+        ]
+        return cls(columns, np.array(sim.destinations), state)
+
+    def save(self, path):
+        """Escribe el punto de control en la carpeta path"""
+        check_folder(path)
+        for c, column in enumerate(self.columns):
+            np.save(os.path.join(path, _column_file(c)), column)
+        np.save(os.path.join(path, DESTINATIONS_FILE), self.destinations)
+        with open(os.path.join(path, STATE_FILE), "wb") as f:
+            pickle.dump(self.state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @staticmethod
+    def _load_arrays(path, mmap):
+        mmap_mode = "c" if mmap else None
+        columns = [
+            np.load(os.path.join(path, _column_file(c)), mmap_mode=mmap_mode)
+            for c in range(len(POPULATION_COLUMNS))
+        ]
+        destinations = np.load(
+            os.path.join(path, DESTINATIONS_FILE), mmap_mode=mmap_mode
+        )
+        return columns, destinations
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Lee un punto de control escrito con save
+
+        Con mmap los arreglos quedan mapeados en modo copia-al-escribir y
+        solo se leen del disco las páginas que se usan.
+        """
+        if not os.path.isfile(os.path.join(path, STATE_FILE)):
+            raise config_error("%s no contiene un punto de control" % path)
+
+        columns, destinations = cls._load_arrays(path, mmap)
+        with open(os.path.join(path, STATE_FILE), "rb") as f:
+            state = pickle.load(f)
+        checkpoint = cls(columns, destinations, state)
+        checkpoint.path = path if mmap else None
+        return checkpoint
+
+    def _arrays(self):
+        # arreglos propios para una simulación restaurada: desde disco cada
+        # restauración abre su propio mapa copia-al-escribir, desde memoria
+        # se copian
+        if self.path is not None:
+            columns, destinations = self._load_arrays(self.path, True)
+            return [np.asarray(col) for col in columns], np.asarray(destinations)
+        return [col.copy() for col in self.columns], self.destinations.copy()
+
+    def restore(self, sim):
+        """Deja la simulación sim en el estado del punto de control"""
+        state = copy.deepcopy(self.state)
+        columns, destinations = self._arrays()
+
+        sim.Config = state["Config"]
+        sim.frame = state["frame"]
+
+        sim.seed_sequence = state["seed_sequence"]
+        sim.rng = np.random.Generator(np.random.PCG64(sim.seed_sequence))
+        sim.Config.rng = sim.rng
+        sim.random_block = None
+        if sim.Config.random_block_size > 0:
+            sim.random_block = RandomBlock(sim.rng, sim.Config.random_block_size)
+        # el estado se fija después de crear el bloque, que sortea al iniciarse
+        sim.rng.bit_generator.state = state["rng_state"]
+
+        population = Population(0, state["float_dtype"], state["track_indices"])
+        population.columns = columns
+        population.recount()
+        sim.population = population
+        sim.destinations = destinations
+
+        sim.pop_tracker = Population_trackers()
+        vars(sim.pop_tracker).update(state["trackers"])
+        sim.schedule = state["schedule"]
+
+        # el registro continúa en memoria: varias bifurcaciones no comparten archivo
+        sim.events = None
+        if state.get("events") is not None:
+            sim.events = EventLog.from_events(
+                state["events"], sim.Config.event_log_chunk
+            )
+        return sim
+
+
+def load_checkpoint(checkpoint, mmap=True):
+    """Devuelve un Checkpoint a partir de un Checkpoint o de una carpeta"""
+    if isinstance(checkpoint, Checkpoint):
+        return checkpoint
+    return Checkpoint.load(checkpoint, mmap=mmap)
+
+
+def variant_scenario(variant):
+    """Escenario y argumentos de una variante de fork
+
+    Una variante es None (sin intervención), el nombre de un escenario de
+    ensemble.SCENARIOS o una tupla (escenario, argumentos).
+    """
+    if variant is None or isinstance(variant, str):
+        return variant, None
+    scenario, scenario_kwargs = variant
+    return scenario, scenario_kwargs
+
+
+def isolate_fork(sim, index):
+    """Separa las salidas de la variante index de las de la corrida original
+
+    Las instantáneas y las imágenes de cada variante van a una subcarpeta
+    fork_<index> de save_pop_folder y plot_path, con un almacén nuevo desde
+    el punto de control, así las variantes no reescriben el almacén de la
+    corrida original ni compiten por él al correr en paralelo. save_data
+    se desactiva (numera sus carpetas contando las existentes) y el
+    registro de eventos queda en memoria.
+    """
+    Config = sim.Config
+    Config.save_pop_folder = os.path.join(Config.save_pop_folder, "fork_%02i" % index)
+    Config.plot_path = os.path.join(Config.plot_path, "fork_%02i" % index)
+    Config.save_data = False
+    Config.event_log_path = None
+    sim.resume_store = False
+    return sim
+
+
+def run_fork(task):
+    """Restaura un punto de control en disco, aplica una variante y la corre
+
+    Keyword arguments
+    -----------------
+    task : tuple
+        (carpeta del punto de control, variante, pasos o None, número de la
+        variante para isolate_fork)
+
+    Retorna las series de Population_trackers como run_replicate.
+    """
+
+    # importación local, como en ensemble.build_simulation
+    from ensemble import apply_scenario
+    from simulation import Simulation
+
+    path, variant, steps, index = task
+    sim = isolate_fork(Simulation.from_checkpoint(path), index)
+    sim.Config.headless = True
+    sim.Config.visualise = False
+    sim.Config.save_plot = False
+    if steps is not None:
+        sim.Config.simulation_steps = steps
+
+    scenario, scenario_kwargs = variant_scenario(variant)
+    apply_scenario(sim, scenario, scenario_kwargs, reinitialize=False)
+    sim.run()
+
+    series = {
+        name: np.asarray(getattr(sim.pop_tracker, name), dtype=np.int64)
+        for name in TRACKER_SERIES
+    }
+    series["frames"] = sim.frame
+    return series
+
+
+def run_forks(path, variants, steps=None, processes=None):
+    """Corre varias variantes desde un mismo punto de control en disco
+
+    Cada variante se restaura en su proceso desde la carpeta path, así que
+    el calentamiento común no se repite; sus salidas se separan con
+    isolate_fork.
+
+    Keyword arguments
+    -----------------
+    path : str
+        carpeta escrita con Simulation.checkpoint o Checkpoint.save
+
+    variants : list
+        variantes, ver variant_scenario
+
+    steps : int
+        pasos a correr después del punto de control, por defecto
+        Config.simulation_steps
+
+    processes : int
+        número de procesos, por defecto los núcleos disponibles
+    """
+
+    from ensemble import map_tasks
+
+    tasks = [(path, variant, steps, k) for k, variant in enumerate(variants)]
+    return map_tasks(run_fork, tasks, processes)
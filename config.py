@@ -4,6 +4,8 @@ file that contains all configuration related methods and classes
 
 import numpy as np
 
+from random_streams import get_rng
+
 
 class config_error(Exception):
     pass
@@ -19,6 +21,40 @@ class Configuration:
             "simulation_steps", 10000
         )  # total de pasos de simulación 
         self.tstep = kwargs.get("tstep", 0)  # tiempo de pasos actual en la simulación
+        self.seed = kwargs.get(
+            "seed", None
+        )  # semilla del generador aleatorio de la simulación (None = aleatoria)
+        self.random_block_size = kwargs.get(
+            "random_block_size", 0
+        )  # si es mayor que 0, números aleatorios pre-generados por paso en bloques de este tamaño
+        self.rng = None  # generador de la simulación, lo asigna Simulation
+        self.headless = kwargs.get(
+            "headless", False
+        )  # sin visualización ni reportes por paso, para correr lotes de simulaciones
+        self.progress_interval = kwargs.get(
+            "progress_interval", 0
+        )  # en modo headless, segundos entre reportes de progreso (0 = ninguno)
+        self.instrument = kwargs.get(
+            "instrument", False
+        )  # si se miden los tiempos de cada etapa del paso y los contadores
+        self.instrument_path = kwargs.get(
+            "instrument_path", None
+        )  # archivo .json o .csv donde se exporta la instrumentación al final de run
+        self.event_log = kwargs.get(
+            "event_log", False
+        )  # si se registran contagios, ingresos, recuperaciones y muertes; sin event_log_path el registro queda en memoria, 13 bytes por evento y de 2 a 4 eventos por persona infectada
+        self.event_log_path = kwargs.get(
+            "event_log_path", None
+        )  # archivo binario del registro de eventos (None = solo en memoria)
+        self.event_log_chunk = kwargs.get(
+            "event_log_chunk", 65536
+        )  # eventos en memoria antes de volcarlos al archivo
+        self.tiles = kwargs.get(
+            "tiles", None
+        )  # franjas (procesos) de TiledSimulation (None = núcleos disponibles)
+        self.tile_rebalance = kwargs.get(
+            "tile_rebalance", 50
+        )  # cada cuántos pasos se recalculan los límites de las franjas (0 = nunca)
         self.save_data = kwargs.get(
             "save_data", False
         )  # si el reporte final se imprime en la terminal
@@ -31,6 +67,21 @@ class Configuration:
         self.save_pop_folder = kwargs.get(
             "save_pop_folder", "pop_data/"
         )  # escribe datos de pasos temporales
+        self.save_pop_format = kwargs.get(
+            "save_pop_format", "store"
+        )  # 'store' agrega las instantáneas a un almacén por bloques, 'npy' un archivo por paso
+        self.save_pop_chunk = kwargs.get(
+            "save_pop_chunk", 64
+        )  # instantáneas por bloque del almacén
+        self.save_pop_compress = kwargs.get(
+            "save_pop_compress", False
+        )  # si los bloques del almacén se comprimen
+        self.async_writes = kwargs.get(
+            "async_writes", True
+        )  # si las instantáneas, los datos finales y las imágenes se escriben en un hilo aparte
+        self.max_pending_writes = kwargs.get(
+            "max_pending_writes", 8
+        )  # escrituras en cola antes de que la simulación espere al hilo
         self.endif_no_infections = kwargs.get(
             "endif_no_infections", True
         )  # si se detiene la simulación al no quedar infecciones
@@ -62,6 +113,21 @@ class Configuration:
         self.plot_style = kwargs.get(
             "plot_style", "default"
         )  # estilo del plot, oscuro, por defecto
+        self.render_every = kwargs.get(
+            "render_every", 1
+        )  # en la visualización en vivo se dibuja un cuadro cada este número de pasos
+        self.history_points = kwargs.get(
+            "history_points", 1000
+        )  # puntos máximos de las curvas S-I-R en vivo, la historia se submuestrea
+        self.render_mode = kwargs.get(
+            "render_mode", "auto"
+        )  # población como 'points' (un punto por persona), 'density' (imagen) o 'auto'
+        self.density_threshold = kwargs.get(
+            "density_threshold", 100000
+        )  # en modo 'auto', desde este tamaño de población se dibuja la densidad
+        self.density_resolution = kwargs.get(
+            "density_resolution", 400
+        )  # píxeles en X de la imagen de densidad
         
         # variables del mundo, define donde puede andar la población
         self.xbounds = kwargs.get(
@@ -73,6 +139,12 @@ class Configuration:
 
         # variables de población
         self.pop_size = kwargs.get("pop_size", 2000)
+        self.population_float_dtype = kwargs.get(
+            "population_float_dtype", "float64"
+        )  # tipo de las columnas flotantes de la población, 'float64' o 'float32'
+        self.track_state_indices = kwargs.get(
+            "track_state_indices", False
+        )  # si la población mantiene los índices de cada estado además de los conteos
         self.mean_age = kwargs.get("mean_age", 10)
         self.max_age = kwargs.get("max_age", 105)
         self.age_dependent_risk = kwargs.get(
@@ -100,6 +172,12 @@ class Configuration:
         self.wander_factor_dest = kwargs.get(
             "wander_factor_dest", 1.5
         )  # área que rodea el destino
+        self.total_destinations = kwargs.get(
+            "total_destinations", 1
+        )  # columnas de destinos por persona, el 1 es el del autoaislamiento
+        self.day_length = kwargs.get(
+            "day_length", 100
+        )  # pasos de simulación que dura un día del horario
 
         # variables de infección
         self.infection_range = kwargs.get(
@@ -108,12 +186,21 @@ class Configuration:
         self.infection_chance = kwargs.get(
             "infection_chance", 0.03
         )  # posibilidad de que una infección se propague a personas sanas cercanas cada tick
+        self.pairwise_infection = kwargs.get(
+            "pairwise_infection", True
+        )  # un dado por par en contacto; False = con la mitad o más infectada cada sano tira una vez con p = infection_chance * contactos, como el código original
         self.recovery_duration = kwargs.get(
             "recovery_duration", (200, 500)
         )  # cuántos ticks se requieren para mejorar
         self.mortality_chance = kwargs.get(
             "mortality_chance", 0.02
         )  # posibilidad global de morir a causa de la enfermedad
+        self.contact_backend = kwargs.get(
+            "contact_backend", "auto"
+        )  # búsqueda de contactos: 'brute', 'grid', 'kdtree' o 'auto' (kdtree si hay scipy; con tick_backend numba, la rejilla compilada)
+        self.tick_backend = kwargs.get(
+            "tick_backend", "auto"
+        )  # kernels del paso: 'numpy', 'numba' o 'auto' (numba si está instalado); numba saca otros números aleatorios, así que con la misma semilla el resultado cambia según el backend
 
         # variables sanitarias
         self.healthcare_capacity = kwargs.get(
@@ -138,6 +225,62 @@ class Configuration:
         self.lockdown_percentage = kwargs.get("lockdown_percentage", 0.1)
         self.lockdown_vector = kwargs.get("lockdown_vector", [])
 
+        # tabla de mortalidad por edad, se construye al pedirla
+        self._mortality_table = None
+        self._mortality_table_key = None
+
+    def _mortality_parameters(self):
+        # parámetros de los que depende la tabla de mortalidad
+        return (
+            self.max_age,
+            self.mortality_chance,
+            self.age_dependent_risk,
+            self.risk_age,
+            self.critical_age,
+            self.critical_mortality_chance,
+            self.risk_increase,
+            self.treatment_dependent_risk,
+            self.treatment_factor,
+            self.no_treatment_factor,
+        )
+
+    def get_mortality_table(self):
+        """tabla de mortalidad por edad entera y tratamiento
+
+        Devuelve un arreglo (2, edad máxima + 1) donde la fila 0 es la
+        probabilidad de morir sin tratamiento y la fila 1 en tratamiento.
+        La tabla se guarda y solo se recalcula si cambia alguno de los
+        parámetros de riesgo.
+        """
+
+        key = self._mortality_parameters()
+        if self._mortality_table is None or key != self._mortality_table_key:
+            # importación local: infection depende de config
+            from infection import compute_mortality
+
+            ages = np.arange(max(self.max_age, self.critical_age) + 1)
+            if self.age_dependent_risk:
+                chance = compute_mortality(
+                    ages,
+                    self.mortality_chance,
+                    self.risk_age,
+                    self.critical_age,
+                    self.critical_mortality_chance,
+                    self.risk_increase,
+                )
+            else:
+                chance = np.full(len(ages), self.mortality_chance, dtype=np.float64)
+
+            if self.treatment_dependent_risk:
+                factors = [self.no_treatment_factor, self.treatment_factor]
+            else:
+                factors = [1, 1]
+
+            self._mortality_table = np.stack([chance * f for f in factors])
+            self._mortality_table_key = key
+
+        return self._mortality_table
+
     def get_palette(self):
 
         # los colores son: [sano, infectado, inmune, fallecido]
@@ -151,8 +294,13 @@ class Configuration:
         
         return palettes["regular"][self.plot_style]
 
-    def set_lockdown(self, lockdown_percentage=0.1, lockdown_compliance=0.9):
-        """activa el encierro"""
+    def set_lockdown(self, lockdown_percentage=0.1, lockdown_compliance=0.9, rng=None):
+        """activa el encierro
+
+        el vector de encierro se sortea con rng, o con el generador de la
+        simulación si no se entrega uno
+        """
+        rng = get_rng(self.rng if rng is None else rng)
 
         self.lockdown = True
 
@@ -161,7 +309,7 @@ class Configuration:
         self.lockdown_vector = np.zeros((self.pop_size,))
         # el vector de encierro es 1 para los que no cumplen
         self.lockdown_vector[
-            np.random.uniform(size=(self.pop_size,)) >= lockdown_compliance
+            rng.uniform(size=(self.pop_size,)) >= lockdown_compliance
         ] = 1
 
     def set_self_isolation(
@@ -169,18 +317,24 @@ class Configuration:
         self_isolate_proportion=0.9,
         isolation_bounds=[0.02, 0.02, 0.09, 0.98],
         traveling_infects=True,
+        xbounds=[0.1, 1.1],
+        ybounds=[0.02, 0.98],
     ):
-        """activa el escenario de autoaislamiento"""
+        """activa el escenario de autoaislamiento
+
+        xbounds e ybounds son los límites de itinerancia fuera del área
+        aislada; el plot va desde el origen hasta esos límites.
+        """
 
         self.self_isolate = True
         self.isolation_bounds = isolation_bounds
         self.self_isolate_proportion = self_isolate_proportion
         # límites de itinerancia fuera del área aislada
-        self.xbounds = [0.1, 1.1]
-        self.ybounds = [0.02, 0.98]
+        self.xbounds = xbounds
+        self.ybounds = ybounds
         # límite del plot
-        self.x_plot = [0, 1.1]
-        self.y_plot = [0, 1]
+        self.x_plot = [0, xbounds[1]]
+        self.y_plot = [0, ybounds[1] + 0.02]
         # actualiza si los agentes viajeros también infectan
         self.traveling_infects = traveling_infects
 
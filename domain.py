@@ -0,0 +1,364 @@
+"""
+contiene el motor con descomposición espacial del dominio: el mundo se
+divide en franjas verticales, cada una a cargo de un proceso que mueve a
+sus personas y sortea sus contagios sobre la población guardada en memoria
+compartida, para usar varios núcleos en una sola simulación
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+from types import SimpleNamespace
+import weakref
+
+import numpy as np
+
+from infection import admit_infections, draw_infections, use_per_susceptible_draw
+from motion import update_motion
+from population import Population, count_state, state_indices
+from simulation import Simulation
+
+
+def _attach(specs):
+    # abre los bloques de memoria compartida de las columnas de la población
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    columns = [
+        np.ndarray(length, dtype=np.dtype(dtype), buffer=block.buf)
+        for block, (_, dtype, length) in zip(blocks, specs)
+    ]
+    return blocks, columns
+
+
+def tile_worker(conn, tile, specs, float_dtype, rng):
+    """Bucle de un proceso de franja
+
+    Recibe por conn órdenes ('motion', parámetros), ('infect', parámetros)
+    o ('stop', None). specs son las columnas de la población seguidas de
+    las filas ordenadas por franja, los infectados del halo y sus
+    posiciones en X. El proceso principal ordena las filas una vez por paso
+    antes del movimiento y envía en params['offsets'] dónde empieza cada
+    franja; así cada persona es de una sola franja durante todo el paso
+    aunque cruce un límite al moverse, y quien cruza pasa a la franja
+    vecina en el paso siguiente (migración) sin mover datos. Antes del
+    sorteo deja en el halo, ordenados por X, los params['infectious']
+    infectados que contagian.
+    """
+
+    blocks, columns = _attach(specs)
+    halo_x = columns.pop()
+    halo_rows = columns.pop()
+    tile_rows = columns.pop()
+    population = Population(0, float_dtype)
+    population.columns = columns
+    rows = sorted_x = None
+
+    try:
+        while True:
+            command, params = conn.recv()
+            if command == "stop":
+                break
+
+            offsets = params["offsets"]
+            rows = tile_rows[offsets[tile] : offsets[tile + 1]]
+
+            if command == "motion":
+                update_motion(
+                    population,
+                    params["xbounds"],
+                    params["ybounds"],
+                    speed=params["speed"],
+                    randomize=params["randomize"],
+                    rows=rows,
+                    rng=rng,
+                )
+                conn.send(None)
+
+            elif command == "infect":
+                Config = params["Config"]
+                state = columns[6]
+                x = columns[1]
+                susceptible = rows[state[rows] == 0]
+
+                # halo: infectados a menos de infection_range de algún sano
+                # de la franja, incluidos los de las franjas vecinas, con
+                # una búsqueda binaria en la lista ordenada por X
+                infectious = susceptible[:0]
+                count = params["infectious"]
+                if len(susceptible) > 0 and count > 0:
+                    reach = Config.infection_range
+                    sorted_x = halo_x[:count]
+                    first = np.searchsorted(
+                        sorted_x, x[susceptible].min() - reach, side="right"
+                    )
+                    last = np.searchsorted(
+                        sorted_x, x[susceptible].max() + reach, side="left"
+                    )
+                    infectious = np.sort(halo_rows[first:last])
+
+                conn.send(
+                    draw_infections(
+                        population,
+                        infectious,
+                        susceptible,
+                        Config,
+                        rng,
+                        params["per_susceptible"],
+                    )
+                )
+    finally:
+        # las columnas apuntan al búfer compartido, se sueltan antes de cerrarlo
+        del population, columns, tile_rows, halo_rows, halo_x, rows, sorted_x
+        for block in blocks:
+            block.close()
+
+
+def _shutdown(workers, blocks):
+    # detiene los procesos y libera la memoria compartida
+    for process, conn in workers:
+        try:
+            conn.send(("stop", None))
+        except (BrokenPipeError, OSError):
+            pass
+    for process, conn in workers:
+        process.join()
+        conn.close()
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+class TiledSimulation(Simulation):
+    """Simulación con el mundo dividido en franjas, una por proceso
+
+    Las columnas de la población se guardan en memoria compartida. En cada
+    paso el proceso principal asigna cada persona a la franja vertical que
+    contiene su posición en X, y el movimiento y el sorteo de contagios
+    corren en paralelo, un proceso por franja. Cada proceso sortea los
+    contagios de sus sanos con todos los infectados a menos de
+    infection_range de ellos, también los de las franjas vecinas (el halo).
+    El resto del paso (destinos, camas, recuperaciones, contadores,
+    visualización) corre en el proceso principal como en Simulation.
+
+    Los pares en contacto y el movimiento sin cambios aleatorios son los
+    mismos que en Simulation. Los cambios aleatorios de dirección y
+    velocidad, los rebotes y los dados de contagio usan un generador
+    propio por franja derivado de la semilla, así que la trayectoria no
+    coincide número a número con la de Simulation con la misma semilla.
+    Los límites de las franjas se reparten por cuantiles de X cada
+    Config.tile_rebalance pasos para equilibrar la carga.
+
+    Los argumentos son los de Simulation; Config.tiles fija el número de
+    franjas (por defecto los núcleos disponibles). close libera los
+    procesos y la memoria compartida, y se llama al terminar run.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.workers = []
+        self.shared_blocks = []
+        self._finalizer = None
+        super().__init__(*args, **kwargs)
+        self.tiles = self.Config.tiles or os.cpu_count() or 1
+        self.edges = None
+        self.tiles_frame = None
+        self.tile_offsets = None
+
+    def population_init(self):
+        super().population_init()
+        self.share_population()
+
+    def restore(self, checkpoint, mmap=True):
+        if not hasattr(self, "workers"):
+            # creada con from_checkpoint, sin pasar por __init__
+            self.workers = []
+            self.shared_blocks = []
+            self._finalizer = None
+        super().restore(checkpoint, mmap=mmap)
+        self.tiles = self.Config.tiles or os.cpu_count() or 1
+        self.edges = None
+        self.tiles_frame = None
+        self.share_population()
+        return self
+
+    def _shared_array(self, values):
+        # copia values a un bloque nuevo de memoria compartida
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        shared = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+        shared[...] = values
+        self.shared_blocks.append(block)
+        return shared
+
+    def share_population(self):
+        """Copia las columnas de la población a memoria compartida
+
+        Se agregan las filas ordenadas por franja (tile_rows) y la lista
+        de infectados ordenada por X con sus posiciones (halo_rows, halo_x),
+        que se llenan en cada paso. Los procesos de franja se (re)inician en
+        el siguiente paso.
+        """
+        self.close()
+        n = len(self.population)
+        self.population.columns = [
+            self._shared_array(column) for column in self.population.columns
+        ]
+        self.tile_rows = self._shared_array(np.zeros(n, dtype=np.intp))
+        self.halo_rows = self._shared_array(np.zeros(n, dtype=np.intp))
+        self.halo_x = self._shared_array(
+            np.zeros(n, dtype=self.population.columns[1].dtype)
+        )
+        self.owner = np.zeros(n, dtype=np.int32)
+        self.tiles_frame = None
+
+    def _start_workers(self):
+        arrays = self.population.columns + [self.tile_rows, self.halo_rows, self.halo_x]
+        specs = [
+            (block.name, array.dtype.str, len(array))
+            for block, array in zip(self.shared_blocks, arrays)
+        ]
+        context = multiprocessing.get_context()
+        for tile, rng in enumerate(self.spawn_rngs(self.tiles)):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=tile_worker,
+                args=(child, tile, specs, self.population.float_dtype, rng),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            self.workers.append((process, parent))
+
+        # las columnas compartidas se liberan aunque no se llame a close
+        self._finalizer = weakref.finalize(
+            self, _shutdown, self.workers, self.shared_blocks
+        )
+
+    def close(self):
+        """Detiene los procesos de franja y libera la memoria compartida
+
+        La población vuelve a arreglos propios del proceso principal.
+        """
+        if self.shared_blocks:
+            self.population.columns = [col.copy() for col in self.population.columns]
+            self.tile_rows = self.halo_rows = self.halo_x = None
+        if self._finalizer is not None:
+            self._finalizer()
+        else:
+            _shutdown([], self.shared_blocks)
+        self.workers = []
+        self.shared_blocks = []
+        self._finalizer = None
+        self.tiles_frame = None
+
+    def tile_edges(self):
+        """Límites en X de las franjas, por cuantiles de las posiciones"""
+        rebalance = self.Config.tile_rebalance
+        if self.edges is None or (rebalance and self.frame % rebalance == 0):
+            quantiles = np.linspace(0, 1, self.tiles + 1)[1:-1]
+            inner = np.quantile(self.population[:, 1], quantiles)
+            self.edges = np.concatenate(([-np.inf], inner, [np.inf]))
+        return self.edges
+
+    def assign_tiles(self):
+        """Asigna cada persona a una franja, una vez por paso
+
+        Llena owner con la franja de cada persona y tile_rows con las filas
+        ordenadas por franja (en orden creciente dentro de cada una);
+        tile_offsets marca dónde empieza cada franja. Se hace antes del
+        movimiento y vale para todo el paso: los procesos no leen X
+        mientras los demás la modifican.
+        """
+        if not self.shared_blocks:
+            self.share_population()
+        inner = self.tile_edges()[1:-1]
+        self.owner[:] = np.searchsorted(inner, self.population[:, 1], side="right")
+        self.tile_rows[:] = np.argsort(self.owner, kind="stable")
+        self.tile_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(self.owner, minlength=self.tiles)))
+        )
+        self.tiles_frame = self.frame
+
+    def _broadcast(self, command, params):
+        # envía la orden a todas las franjas y espera sus respuestas
+        if self.tiles_frame != self.frame:
+            self.assign_tiles()
+        if not self.workers:
+            self._start_workers()
+        params = dict(params, offsets=self.tile_offsets)
+        for _, conn in self.workers:
+            conn.send((command, params))
+        return [conn.recv() for _, conn in self.workers]
+
+    def move(self, rng, randomize=True):
+        self.assign_tiles()
+        self._broadcast(
+            "motion",
+            {
+                "xbounds": [self.Config.xbounds[0] + 0.02, self.Config.xbounds[1] - 0.02],
+                "ybounds": [self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02],
+                "speed": self.Config.speed,
+                "randomize": randomize,
+            },
+        )
+
+    def infect_step(self, rng):
+        # a las franjas solo van los parámetros del sorteo
+        Config = SimpleNamespace(
+            infection_range=self.Config.infection_range,
+            infection_chance=self.Config.infection_chance,
+            traveling_infects=self.Config.traveling_infects,
+            contact_backend=self.Config.contact_backend,
+            # los kernels de numba ya usan todos los núcleos, en cada franja
+            # se usa la versión de numpy
+            tick_backend="numpy",
+        )
+        per_susceptible = use_per_susceptible_draw(
+            self.Config, count_state(self.population, 1)
+        )
+
+        # infectados que contagian, ordenados por X una vez por paso; cada
+        # franja busca su halo en esta lista
+        if self.tiles_frame != self.frame:
+            self.assign_tiles()
+        infectious = state_indices(self.population, 1)
+        if not self.Config.traveling_infects:
+            infectious = infectious[self.population[:, 11][infectious] == 0]
+        x = self.population[:, 1][infectious]
+        order = np.argsort(x, kind="stable")
+        self.halo_rows[: len(infectious)] = infectious[order]
+        self.halo_x[: len(infectious)] = x[order]
+
+        results = self._broadcast(
+            "infect",
+            {
+                "Config": Config,
+                "per_susceptible": per_susceptible,
+                "infectious": len(infectious),
+            },
+        )
+
+        new_infections = np.concatenate([r[0] for r in results])
+        sources = np.concatenate([r[1] for r in results])
+        contacts = sum(r[2] for r in results)
+
+        # las camas y el aislamiento son globales, se asignan aquí
+        self.population, self.destinations, infections = admit_infections(
+            self.population,
+            self.Config,
+            self.frame,
+            new_infections,
+            sources,
+            contacts,
+            send_to_location=self.Config.self_isolate,
+            location_bounds=self.Config.isolation_bounds,
+            destinations=self.destinations,
+            location_no=1,
+            location_odds=self.Config.self_isolate_proportion,
+            return_outcomes=True,
+            rng=rng,
+        )
+        return infections
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.close()
@@ -0,0 +1,252 @@
+"""
+contiene el ejecutor de ensambles Monte Carlo: corre varias réplicas
+independientes de la simulación en un grupo de procesos y agrega las
+curvas S-I-R resultantes
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from config import config_error
+from jit_kernels import single_thread_worker
+from population import TRACKER_SERIES
+
+# nombre del escenario: (método de Configuration, si hay que reiniciar la población)
+SCENARIOS = {
+    "lockdown": ("set_lockdown", False),
+    "self_isolation": ("set_self_isolation", True),
+    "reduced_interaction": ("set_reduced_interaction", True),
+}
+
+
+def build_simulation(config_kwargs, scenario=None, scenario_kwargs=None):
+    """Crea una simulación headless con la configuración y el escenario dados
+
+    Keyword arguments
+    -----------------
+    config_kwargs : dict
+        argumentos para Configuration
+
+    scenario : str
+        None, 'lockdown', 'self_isolation' o 'reduced_interaction'
+
+    scenario_kwargs : dict
+        argumentos del método set_* del escenario
+    """
+
+    # importación local para que los procesos hijos carguen la simulación al usarla
+    from simulation import Simulation
+
+    kwargs = dict(config_kwargs)
+    kwargs.update(headless=True, visualise=False, save_plot=False)
+    sim = Simulation(**kwargs)
+    apply_scenario(sim, scenario, scenario_kwargs)
+    return sim
+
+
+def apply_scenario(sim, scenario=None, scenario_kwargs=None, reinitialize=True):
+    """Activa un escenario de intervención sobre una simulación existente
+
+    Con reinitialize=False no se reinicia la población aunque el escenario
+    lo pida, por ejemplo al bifurcar desde un punto de control.
+    """
+
+    if scenario is None:
+        return sim
+    if scenario not in SCENARIOS:
+        raise config_error(
+            "escenario %s no reconocido, use uno de %s"
+            % (scenario, ", ".join(SCENARIOS))
+        )
+
+    method, needs_init = SCENARIOS[scenario]
+    getattr(sim.Config, method)(**(scenario_kwargs or {}))
+    if reinitialize and needs_init:
+        sim.population_init()
+    return sim
+
+
+def run_replicate(task):
+    """Corre una réplica y devuelve sus series de Population_trackers
+
+    Keyword arguments
+    -----------------
+    task : tuple
+        (config_kwargs, scenario, scenario_kwargs, seed)
+    """
+
+    config_kwargs, scenario, scenario_kwargs, seed = task
+    sim = build_simulation(dict(config_kwargs, seed=seed), scenario, scenario_kwargs)
+    sim.run()
+
+    series = {
+        name: np.asarray(getattr(sim.pop_tracker, name), dtype=np.int64)
+        for name in TRACKER_SERIES
+    }
+    series["frames"] = sim.frame
+    return series
+
+
+def replicate_seeds(seed, replicates):
+    """Semillas independientes para cada réplica a partir de una semilla base"""
+    children = np.random.SeedSequence(seed).spawn(replicates)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def _init_worker(initializer):
+    # inicializador de los procesos del grupo
+    single_thread_worker()
+    if initializer is not None:
+        initializer()
+
+
+def map_tasks(function, tasks, processes=None, initializer=None):
+    """Ejecuta function sobre cada tarea en un grupo de procesos
+
+    Con processes=1 las tareas se corren en el proceso actual. En los
+    procesos del grupo los kernels de numba usan un solo hilo y se llama a
+    initializer (una función del nivel del módulo), que no se llama en el
+    proceso actual.
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks)) if len(tasks) > 0 else 1
+
+    if processes <= 1:
+        return [function(task) for task in tasks]
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(initializer,)
+    ) as executor:
+        return list(executor.map(function, tasks, chunksize=1))
+
+
+def pad_series(series_list):
+    """Apila series de distinto largo repitiendo el último valor de cada una
+
+    Las simulaciones se detienen al no quedar infectados, a partir de ese
+    momento los conteos ya no cambian.
+    """
+
+    length = max(len(s) for s in series_list)
+    stacked = np.zeros((len(series_list), length), dtype=np.float64)
+    for k, s in enumerate(series_list):
+        stacked[k, : len(s)] = s
+        stacked[k, len(s) :] = s[-1] if len(s) > 0 else 0
+    return stacked
+
+
+class EnsembleResult:
+    """Curvas S-I-R agregadas de un ensamble
+
+    Atributos
+    ---------
+    curves : dict
+        serie -> arreglo (réplicas, pasos) con cada réplica
+
+    mean : dict
+        serie -> media por paso
+
+    quantiles : dict
+        serie -> arreglo (len(q), pasos) con los cuantiles pedidos por paso
+
+    peak_infectious, peak_time, total_fatalities, frames : ndarray
+        estadísticas por réplica: máximo de infectados, paso del máximo,
+        fallecidos al final y pasos simulados
+    """
+
+    def __init__(self, runs, q=(0.05, 0.5, 0.95), seeds=None):
+        self.q = tuple(q)
+        self.seeds = seeds
+        self.curves = {
+            name: pad_series([run[name] for run in runs]) for name in TRACKER_SERIES
+        }
+        self.mean = {name: c.mean(axis=0) for name, c in self.curves.items()}
+        self.quantiles = {
+            name: np.quantile(c, self.q, axis=0) for name, c in self.curves.items()
+        }
+
+        infectious = self.curves["infectious"]
+        self.peak_infectious = infectious.max(axis=1)
+        self.peak_time = infectious.argmax(axis=1)
+        self.total_fatalities = self.curves["fatalities"][:, -1]
+        self.frames = np.array([run["frames"] for run in runs])
+
+    @property
+    def replicates(self):
+        return len(self.frames)
+
+    def peak_summary(self):
+        """Media y cuantiles de las estadísticas de pico por réplica"""
+        summary = {}
+        for name in ("peak_infectious", "peak_time", "total_fatalities", "frames"):
+            values = getattr(self, name)
+            summary[name] = {
+                "mean": float(values.mean()),
+                "quantiles": dict(
+                    zip(self.q, np.quantile(values, self.q).astype(float).tolist())
+                ),
+            }
+        return summary
+
+
+class Ensemble:
+    """Ejecutor de réplicas Monte Carlo de la simulación
+
+    Cada réplica usa su propia semilla (Config.seed), derivada de la semilla
+    base con numpy.random.SeedSequence, y corre en modo headless en un
+    proceso del grupo. Las réplicas son independientes, así que el tiempo total escala
+    con el número de núcleos.
+
+    Keyword arguments
+    -----------------
+    replicates : int
+        número de réplicas
+
+    seed : int
+        semilla base del ensamble
+
+    processes : int
+        número de procesos, por defecto los núcleos disponibles
+
+    scenario : str
+        escenario de intervención aplicado a todas las réplicas (ver SCENARIOS)
+
+    scenario_kwargs : dict
+        argumentos del método del escenario
+
+    quantiles : tuple
+        cuantiles calculados por paso y para las estadísticas de pico
+
+    **config_kwargs
+        argumentos para Configuration de cada réplica
+    """
+
+    def __init__(
+        self,
+        replicates=10,
+        seed=None,
+        processes=None,
+        scenario=None,
+        scenario_kwargs=None,
+        quantiles=(0.05, 0.5, 0.95),
+        **config_kwargs
+    ):
+        self.replicates = replicates
+        self.seed = seed
+        self.processes = processes
+        self.scenario = scenario
+        self.scenario_kwargs = scenario_kwargs
+        self.quantiles = quantiles
+        self.config_kwargs = config_kwargs
+
+    def run(self):
+        """Corre todas las réplicas y devuelve un EnsembleResult"""
+        seeds = replicate_seeds(self.seed, self.replicates)
+        tasks = [
+            (self.config_kwargs, self.scenario, self.scenario_kwargs, s) for s in seeds
+        ]
+        runs = map_tasks(run_replicate, tasks, self.processes)
+        return EnsembleResult(runs, self.quantiles, seeds)
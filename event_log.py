@@ -0,0 +1,188 @@
+"""
+contiene el registro de eventos de la simulación: un arreglo estructurado
+(paso, persona, evento, fuente) que se agrega en bloque desde infect y
+recover_or_die, se vuelca por tramos a un archivo binario y permite
+reconstruir después el árbol de transmisión
+"""
+
+import os
+
+import numpy as np
+
+from utils import check_folder
+
+# tipos de evento
+SEEDED = 0  # infectado al inicio (paciente cero), sin fuente
+INFECTED = 1  # contagiado por la persona de la columna source
+ADMITTED = 2  # recibe cama en el sistema sanitario
+ISOLATED = 3  # enviado al lugar de aislamiento
+RECOVERED = 4
+DIED = 5
+
+EVENT_NAMES = ("seeded", "infected", "admitted", "isolated", "recovered", "died")
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("frame", np.int32),
+        ("agent", np.int32),
+        ("event", np.int8),
+        ("source", np.int32),
+    ]
+)
+
+
+class EventLog:
+    """Registro de eventos en un búfer estructurado preasignado
+
+    append agrega de una vez todos los eventos de un tipo en un paso, así
+    el costo es proporcional al número de eventos. Sin path el búfer se
+    duplica al llenarse y guarda todo en memoria; con path, cada vez que
+    se llena se agrega al archivo binario (registros EVENT_DTYPE seguidos,
+    sin encabezado) y se reutiliza.
+
+    Keyword arguments
+    -----------------
+    path : str
+        archivo binario donde se vuelcan los eventos, None para memoria
+
+    chunk_size : int
+        eventos del búfer antes de volcarlo o agrandarlo
+    """
+
+    def __init__(self, path=None, chunk_size=65536):
+        self.path = path
+        self.chunk_size = max(1, int(chunk_size))
+        self._buffer = np.zeros(self.chunk_size, dtype=EVENT_DTYPE)
+        self._size = 0
+        self._flushed = 0
+
+        if path is not None:
+            folder = os.path.dirname(path)
+            if folder:
+                check_folder(folder)
+            # un registro nuevo reemplaza al archivo anterior
+            open(path, "wb").close()
+
+    def __len__(self):
+        return self._flushed + self._size
+
+    def append(self, frame, agents, event, sources=None):
+        """Agrega un evento del tipo dado para cada persona de agents
+
+        sources es la persona que originó cada evento (el infectado que
+        contagió), -1 si no corresponde.
+        """
+
+        n = len(agents)
+        if n == 0:
+            return
+        if self._size + n > len(self._buffer):
+            if self.path is not None:
+                self.flush()
+            if self._size + n > len(self._buffer):
+                grown = np.zeros(
+                    max(2 * len(self._buffer), self._size + n), dtype=EVENT_DTYPE
+                )
+                grown[: self._size] = self._buffer[: self._size]
+                self._buffer = grown
+
+        block = self._buffer[self._size : self._size + n]
+        block["frame"] = frame
+        block["agent"] = agents
+        block["event"] = event
+        block["source"] = -1 if sources is None else sources
+        self._size += n
+
+    def flush(self):
+        """Agrega al archivo los eventos del búfer"""
+        if self.path is None or self._size == 0:
+            return
+        with open(self.path, "ab") as f:
+            self._buffer[: self._size].tofile(f)
+        self._flushed += self._size
+        self._size = 0
+
+    def close(self):
+        self.flush()
+
+    def events(self):
+        """Todos los eventos registrados, del archivo y del búfer"""
+        pending = self._buffer[: self._size]
+        if self.path is None:
+            return pending.copy()
+        self.flush()
+        return read_events(self.path)
+
+    @classmethod
+    def from_events(cls, events, chunk_size=65536):
+        """Registro en memoria que continúa a partir de events"""
+        log = cls(None, max(chunk_size, len(events)))
+        log._buffer[: len(events)] = events
+        log._size = len(events)
+        return log
+
+
+def read_events(path):
+    """Eventos de un archivo escrito por EventLog, con memoria mapeada"""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode="r")
+
+
+def _as_events(events):
+    # acepta un EventLog, un arreglo de eventos o la ruta de un archivo
+    if isinstance(events, EventLog):
+        return events.events()
+    if isinstance(events, str):
+        return read_events(events)
+    return events
+
+
+def transmission_tree(events):
+    """Aristas del árbol de transmisión
+
+    Retorna tres arreglos: infectado, quién lo contagió (-1 para los
+    pacientes cero) y el paso del contagio, ordenados por paso.
+    """
+
+    events = _as_events(events)
+    rows = events[(events["event"] == INFECTED) | (events["event"] == SEEDED)]
+    rows = rows[np.argsort(rows["frame"], kind="stable")]
+    return (
+        np.asarray(rows["agent"]),
+        np.asarray(rows["source"]),
+        np.asarray(rows["frame"]),
+    )
+
+
+def secondary_cases(events, pop_size=None):
+    """Número de personas contagiadas por cada persona
+
+    Retorna (personas infectadas, casos secundarios de cada una).
+    """
+
+    agents, sources, _ = transmission_tree(events)
+    minlength = pop_size or (int(agents.max()) + 1 if len(agents) else 0)
+    counts = np.bincount(sources[sources >= 0], minlength=minlength)
+    return agents, counts[agents]
+
+
+def secondary_case_distribution(events):
+    """Frecuencia de cada número de casos secundarios entre los infectados
+
+    La posición k del arreglo es el número de infectados que contagiaron a
+    k personas; su media es el número reproductivo observado.
+    """
+
+    _, cases = secondary_cases(events)
+    return np.bincount(cases)
+
+
+def ancestry(events, agent):
+    """Cadena de contagio de agent hasta un paciente cero, desde agent"""
+    agents, sources, _ = transmission_tree(events)
+    infector = dict(zip(agents.tolist(), sources.tolist()))
+    chain = [agent]
+    while infector.get(chain[-1], -1) >= 0 and len(chain) <= len(infector):
+        chain.append(infector[chain[-1]])
+    return chain
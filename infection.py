@@ -5,77 +5,72 @@ nuevas infecciones, recuperaciones y muertes
 
 
 import numpy as np
-from path_planning import go_to_location
+from jit_kernels import contact_pairs_jit, resolve_tick_backend
+from path_planning import go_to_location_batch
+from population import count_treated, set_state, set_treatment, state_indices
+from random_streams import get_rng
+from spatial_index import build_contact_index
 
 
-def find_nearby(
-    population,
-    infection_zone,
-    traveling_infects=False,
-    kind="healthy",
-    infected_previous_step=[],
-):
-    """
+def contact_pairs(population, infectious, susceptible, Config):
+    """encuentra todos los pares (infectado, sano) en contacto
+
+    Un sano está en contacto con un infectado si está dentro de la zona
+    cuadrada de lado 2 * infection_range centrada en el infectado. El índice
+    espacial se construye una vez por paso sobre el grupo más grande y se
+    consulta con las posiciones del más pequeño. Con tick_backend 'numba' y
+    contact_backend 'grid' o 'auto' se usa en cambio la rejilla compilada
+    de jit_kernels; 'brute' y 'kdtree' siempre usan su índice.
+
     Argumentos clave
     -----------------
+    population : ndarray
+        matriz que contiene los datos sobre la población
 
-    kind : str (puede ser 'healthy' o 'infected')
-        determina si se devuelven individuos infectados o sanos 
-        dentro de la zona de infección
+    infectious : ndarray
+        índices de las personas que pueden contagiar
 
+    susceptible : ndarray
+        índices de las personas que se pueden contagiar
 
     Retorna
     -------
-    if kind='healthy', se devuelven los índices de agentes sanos dentro de la zona de 
-    infección. Esto se debe a que para cada agente sano, 
-    se debe evaluar la posibilidad de infectarse.
-
-    if kind='infected', solo se devuelve el número de infectados dentro de la zona de 
-    infección. Esto se debe a que, en esta situación, las probabilidades de que el 
-    agente sano esté en el centro de la zona de infección dependen de cuántos agentes 
-    infecciosos haya a su alrededor.
+    dos arreglos con el índice del infectado y el del sano de cada par
     """
 
-    if kind.lower() == "healthy":
-        indices = np.int32(
-            population[:, 0][
-                (infection_zone[0] < population[:, 1])
-                & (population[:, 1] < infection_zone[2])
-                & (infection_zone[1] < population[:, 2])
-                & (population[:, 2] < infection_zone[3])
-                & (population[:, 6] == 0)
-            ]
+    if len(infectious) == 0 or len(susceptible) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    if resolve_tick_backend(
+        Config.tick_backend
+    ) == "numba" and Config.contact_backend.lower() in ("auto", "grid"):
+        # rejilla compilada en paralelo, mismo orden de pares que la consulta directa
+        inf_idx, sus_idx = contact_pairs_jit(
+            population[infectious, 1:3],
+            population[susceptible, 1:3],
+            Config.infection_range,
+        )
+    elif len(infectious) <= len(susceptible):
+        index = build_contact_index(
+            population[susceptible, 1:3], Config.infection_range, Config.contact_backend
+        )
+        inf_idx, sus_idx = index.query_pairs(
+            population[infectious, 1:3], Config.infection_range
         )
-        return indices
-
-    elif kind.lower() == "infected":
-        if traveling_infects:
-            infected_number = len(
-                infected_previous_step[:, 6][
-                    (infection_zone[0] < infected_previous_step[:, 1])
-                    & (infected_previous_step[:, 1] < infection_zone[2])
-                    & (infection_zone[1] < infected_previous_step[:, 2])
-                    & (infected_previous_step[:, 2] < infection_zone[3])
-                    & (infected_previous_step[:, 6] == 1)
-                ]
-            )
-        else:
-            infected_number = len(
-                infected_previous_step[:, 6][
-                    (infection_zone[0] < infected_previous_step[:, 1])
-                    & (infected_previous_step[:, 1] < infection_zone[2])
-                    & (infection_zone[1] < infected_previous_step[:, 2])
-                    & (infected_previous_step[:, 2] < infection_zone[3])
-                    & (infected_previous_step[:, 6] == 1)
-                    & (infected_previous_step[:, 11] == 0)
-                ]
-            )
-        return infected_number
-
     else:
-        raise ValueError(
-            "type to find %s not understood! Must be either 'healthy' or 'ill'"
+        index = build_contact_index(
+            population[infectious, 1:3], Config.infection_range, Config.contact_backend
+        )
+        sus_idx, inf_idx = index.query_pairs(
+            population[susceptible, 1:3], Config.infection_range
         )
+        # ordenar por infectado como en la consulta directa
+        order = np.lexsort((sus_idx, inf_idx))
+        inf_idx = inf_idx[order]
+        sus_idx = sus_idx[order]
+
+    return infectious[inf_idx], susceptible[sus_idx]
 
 
 def infect(
@@ -87,12 +82,18 @@ def infect(
     destinations=[],
     location_no=1,
     location_odds=1.0,
+    return_outcomes=False,
+    rng=None,
 ):
     """encuentra nuevas infecciones
 
     Función que encuentra nuevas infecciones en un área alrededor de personas infectadas 
     definidas por infection_range, y la oportunidad de infertar a otros infection_chance
 
+    Todos los pares de contacto se evalúan a la vez: se tira el dado para cada
+    par en una sola llamada, cada sano cuenta como una única infección y las
+    camas libres se asignan en orden de infección hasta healthcare_capacity.
+
     Argumentos clave
     -----------------
     population : ndarray
@@ -134,121 +135,151 @@ def infect(
 
     traveling_infects : bool
         si las personas infectadas que se dirigen a un destino aún pueden infectar a otros en el camino hacia allí
+
+    return_outcomes : bool
+        si además se devuelve un diccionario con los nuevos infectados
+        ('infected'), quién contagió a cada uno ('sources'), los que
+        recibieron cama ('admitted'), los enviados al aislamiento
+        ('isolated') y el número de pares de contacto evaluados ('contacts')
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
     # marcar primero a los que ya están infectados
-    infected_previous_step = population[population[:, 6] == 1]
-    healthy_previous_step = population[population[:, 6] == 0]
-
-    new_infections = []
-
-    # si menos de la mitad están infectados, se divide en función de los infectados para acelerar el cálculo
-    if len(infected_previous_step) < (Config.pop_size // 2):
-        for patient in infected_previous_step:
-            # zona de infección para el paciente
-            infection_zone = [
-                patient[1] - Config.infection_range,
-                patient[2] - Config.infection_range,
-                patient[1] + Config.infection_range,
-                patient[2] + Config.infection_range,
-            ]
-
-            # personas sanas que rodean al paciente infectado
-            if Config.traveling_infects or patient[11] == 0:
-                indices = find_nearby(population, infection_zone, kind="healthy")
-            else:
-                indices = []
-
-            for idx in indices:
-                # tirar el dado para ver si una persona sana se infecta
-                if np.random.random() < Config.infection_chance:
-                    population[idx][6] = 1
-                    population[idx][8] = frame
-                    if (
-                        len(population[population[:, 10] == 1])
-                        <= Config.healthcare_capacity
-                    ):
-                        population[idx][10] = 1
-                        if send_to_location:
-                            # enviar a la ubicación si la tirada es positiva
-                            if np.random.uniform() <= location_odds:
-                                population[idx], destinations[idx] = go_to_location(
-                                    population[idx],
-                                    destinations[idx],
-                                    location_bounds,
-                                    dest_no=location_no,
-                                )
-                        else:
-                            pass
-                    new_infections.append(idx)
+    infectious = state_indices(population, 1)
+    susceptible = state_indices(population, 0)
+    per_susceptible = use_per_susceptible_draw(Config, len(infectious))
+
+    # los que van de camino a un destino solo infectan si traveling_infects
+    if not Config.traveling_infects:
+        infectious = infectious[population[infectious, 11] == 0]
+
+    new_infections, sources, contacts = draw_infections(
+        population, infectious, susceptible, Config, rng, per_susceptible
+    )
+    return admit_infections(
+        population,
+        Config,
+        frame,
+        new_infections,
+        sources,
+        contacts,
+        send_to_location=send_to_location,
+        location_bounds=location_bounds,
+        destinations=destinations,
+        location_no=location_no,
+        location_odds=location_odds,
+        return_outcomes=return_outcomes,
+        rng=rng,
+    )
+
+
+def use_per_susceptible_draw(Config, infected):
+    """si el paso usa el sorteo original por sano (ver draw_infections)
+
+    Solo con Config.pairwise_infection en False y, como en el recorrido
+    original, con al menos la mitad de la población infectada.
+    """
+    return not Config.pairwise_infection and infected >= Config.pop_size // 2
 
-    else:
-        # si más de la mitad están infectados, basado en personas sanas para acelerar el cálculo
-
-        for person in healthy_previous_step:
-            # Definir el rango de infección en torno a una persona sana.
-            infection_zone = [
-                person[1] - Config.infection_range,
-                person[2] - Config.infection_range,
-                person[1] + Config.infection_range,
-                person[2] + Config.infection_range,
-            ]
-
-            if (
-                person[6] == 0
-            ):  # si la persona aún no está infectada, averiguar si hay infectados cerca
-                # encontrar una persona sana cercana infectada
-                if Config.traveling_infects:
-                    poplen = find_nearby(
-                        population,
-                        infection_zone,
-                        traveling_infects=True,
-                        kind="infected",
-                    )
-                else:
-                    poplen = find_nearby(
-                        population,
-                        infection_zone,
-                        traveling_infects=True,
-                        kind="infected",
-                        infected_previous_step=infected_previous_step,
-                    )
-
-                if poplen > 0:
-                    if np.random.random() < (Config.infection_chance * poplen):
-                        # Tira el dado para ver si la persona sana se infectará
-                        population[np.int32(person[0])][6] = 1
-                        population[np.int32(person[0])][8] = frame
-                        if (
-                            len(population[population[:, 10] == 1])
-                            <= Config.healthcare_capacity
-                        ):
-                            population[np.int32(person[0])][10] = 1
-                            if send_to_location:
-                                # enviar al lugar y añadir al tratamiento si la tirada es positiva
-                                if np.random.uniform() < location_odds:
-                                    (
-                                        population[np.int32(person[0])],
-                                        destinations[np.int32(person[0])],
-                                    ) = go_to_location(
-                                        population[np.int32(person[0])],
-                                        destinations[np.int32(person[0])],
-                                        location_bounds,
-                                        dest_no=location_no,
-                                    )
-
-                        new_infections.append(np.int32(person[0]))
-
-    if len(new_infections) > 0 and Config.verbose:
-        print("\nat timestep %i these people got sick: %s" % (frame, new_infections))
-
-    if len(destinations) == 0:
-        return population
-    else:
-        return population, destinations
+
+def draw_infections(
+    population, infectious, susceptible, Config, rng, per_susceptible=False
+):
+    """sortea los contagios entre los pares (infectado, sano) en contacto
+
+    Por defecto se tira un dado por par, así un sano con k infectados cerca
+    se contagia con probabilidad 1 - (1 - infection_chance)^k. Con
+    per_susceptible cada sano en contacto tira una sola vez con
+    probabilidad infection_chance * k, como el recorrido original por sanos.
+
+    Retorna los nuevos infectados en el orden de su primer acierto, quién
+    contagió a cada uno y el número de pares evaluados.
+    """
+
+    # todos los pares (infectado, sano) en contacto en este paso
+    source, target = contact_pairs(population, infectious, susceptible, Config)
+
+    if per_susceptible:
+        # un dado por sano; la fuente es el primer infectado en contacto
+        targets, first_pair, k = np.unique(
+            target, return_index=True, return_counts=True
+        )
+        hits = rng.random(size=len(targets)) < Config.infection_chance * k
+        return targets[hits], source[first_pair[hits]], len(source)
+
+    # tirar el dado para todos los pares a la vez
+    hits = rng.random(size=len(source)) < Config.infection_chance
+
+    # cada sano se infecta una sola vez aunque varios pares acierten;
+    # se conserva el orden en que aparece el primer acierto
+    new_infections, first_hit = np.unique(target[hits], return_index=True)
+    order = np.argsort(first_hit, kind="stable")
+    new_infections = new_infections[order]
+    # quién contagió a cada uno: el infectado del primer par que acertó
+    sources = source[hits][first_hit[order]]
+
+    return new_infections, sources, len(source)
+
+
+def admit_infections(
+    population,
+    Config,
+    frame,
+    new_infections,
+    sources,
+    contacts,
+    send_to_location=False,
+    location_bounds=[],
+    destinations=[],
+    location_no=1,
+    location_odds=1.0,
+    return_outcomes=False,
+    rng=None,
+):
+    """aplica los contagios sorteados: estado, camas y aislamiento
+
+    Los argumentos y el valor de retorno son los de infect; new_infections,
+    sources y contacts son los de draw_infections.
+    """
+    rng = get_rng(rng)
+
+    set_state(population, new_infections, 1)
+    population[new_infections, 8] = frame
+
+    # asignar las camas libres en una sola pasada
+    free_beds = max(Config.healthcare_capacity - count_treated(population), 0)
+    admitted = new_infections[:free_beds]
+    set_treatment(population, admitted, 1)
+
+    sent = admitted[:0]
+    if send_to_location and len(admitted) > 0:
+        # enviar a la ubicación si la tirada es positiva
+        sent = admitted[rng.uniform(size=len(admitted)) <= location_odds]
+        population, destinations = go_to_location_batch(
+            population, destinations, sent, location_bounds, dest_no=location_no
+        )
+
+    # los índices de cada evento quedan en el registro de eventos (event_log)
+    if len(new_infections) > 0 and Config.verbose and not Config.headless:
+        print("\nat timestep %i %i people got sick" % (frame, len(new_infections)))
+
+    result = (population,) if len(destinations) == 0 else (population, destinations)
+    if return_outcomes:
+        outcomes = {
+            "infected": new_infections,
+            "sources": sources,
+            "admitted": admitted,
+            "isolated": sent,
+            "contacts": contacts,
+        }
+        result = result + (outcomes,)
+    return result[0] if len(result) == 1 else result
 
 
-def recover_or_die(population, frame, Config):
+def recover_or_die(population, frame, Config, return_outcomes=False, rng=None):
     """ver si recuperarse o morir
 
 
@@ -292,80 +323,55 @@ def recover_or_die(population, frame, Config):
 
     verbose : bool
         si se informa a la terminal de las recuperaciones y muertes de cada paso de la simulación
+
+    return_outcomes : bool
+        si además de la población se devuelve un diccionario con los índices
+        de los recuperados ('recovered') y fallecidos ('fatalities') del paso
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
     # Encontrar personas infectadas
-    infected_people = population[population[:, 6] == 1]
+    infected = state_indices(population, 1)
 
     # Define el vector de por cuanto tiempo la persona va a estar enferma
-    illness_duration_vector = frame - infected_people[:, 8]
+    illness_duration_vector = frame - population[infected, 8]
 
     recovery_odds_vector = (
         illness_duration_vector - Config.recovery_duration[0]
     ) / np.ptp(Config.recovery_duration)
     recovery_odds_vector = np.clip(recovery_odds_vector, a_min=0, a_max=None)
 
-    # Actualiza el estado de los riesgos de las personas
-    indices = infected_people[:, 0][recovery_odds_vector >= infected_people[:, 9]]
-
-    recovered = []
-    fatalities = []
-
-    # decide whether to die or recover
-    for idx in indices:
-        # Si la edad altera el riesgo
-        if Config.age_dependent_risk:
-            updated_mortality_chance = compute_mortality(
-                infected_people[infected_people[:, 0] == idx][:, 7][0],
-                Config.mortality_chance,
-                Config.risk_age,
-                Config.critical_age,
-                Config.critical_mortality_chance,
-                Config.risk_increase,
-            )
-        else:
-            updated_mortality_chance = Config.mortality_chance
-
-        if (
-            infected_people[infected_people[:, 0] == int(idx)][:, 10] == 0
-            and Config.treatment_dependent_risk
-        ):
-            # Si la persona no esta en tratamiento se aumenta el riesgo 
-            updated_mortality_chance = (
-                updated_mortality_chance * Config.no_treatment_factor
-            )
-        elif (
-            infected_people[infected_people[:, 0] == int(idx)][:, 10] == 1
-            and Config.treatment_dependent_risk
-        ):
-            # Si la persona se encuentra en tratamiento, disminuye el riesgo
-            updated_mortality_chance = (
-                updated_mortality_chance * Config.treatment_factor
-            )
-
-        if np.random.random() <= updated_mortality_chance:
-            # Muere
-            infected_people[:, 6][infected_people[:, 0] == idx] = 3
-            infected_people[:, 10][infected_people[:, 0] == idx] = 0
-            fatalities.append(
-                np.int32(infected_people[infected_people[:, 0] == idx][:, 0][0])
-            )
-        else:
-            # Recuperado: se vuelve inmune
-            infected_people[:, 6][infected_people[:, 0] == idx] = 2
-            infected_people[:, 10][infected_people[:, 0] == idx] = 0
-            recovered.append(
-                np.int32(infected_people[infected_people[:, 0] == idx][:, 0][0])
-            )
-
-    if len(fatalities) > 0 and Config.verbose:
-        print("\nat timestep %i these people died: %s" % (frame, fatalities))
-    if len(recovered) > 0 and Config.verbose:
-        print("\nat timestep %i these people recovered: %s" % (frame, recovered))
-
-    # Reinsertar a la población
-    population[population[:, 6] == 1] = infected_people
-
+    # Personas cuya enfermedad termina en este paso
+    indices = infected[recovery_odds_vector >= population[infected, 9]]
+
+    # Probabilidad de morir según edad y tratamiento, desde la tabla de la configuración
+    mortality_table = Config.get_mortality_table()
+    ages = np.clip(population[indices, 7], 0, mortality_table.shape[1] - 1)
+    mortality_chance = mortality_table[
+        np.int32(population[indices, 10] == 1), np.int32(ages)
+    ]
+
+    # decidir si muere o se recupera, una tirada por persona
+    dies = rng.random(size=len(indices)) <= mortality_chance
+    fatalities = indices[dies]
+    recovered = indices[~dies]
+
+    # Muere / Recuperado: se vuelve inmune
+    set_state(population, fatalities, 3)
+    set_state(population, recovered, 2)
+    set_treatment(population, indices, 0)
+
+    if Config.verbose and not Config.headless:
+        if len(fatalities) > 0:
+            print("\nat timestep %i %i people died" % (frame, len(fatalities)))
+        if len(recovered) > 0:
+            print("\nat timestep %i %i people recovered" % (frame, len(recovered)))
+
+    if return_outcomes:
+        return population, {"recovered": recovered, "fatalities": fatalities}
     return population
 
 
@@ -379,43 +385,51 @@ def compute_mortality(
 ):
     """Calcular la mortalidad basado en la edad
 
-   El riesgo se calcula en función de la edad. la edad en la que el riesgo empieza
-     a aumentar, y la edad crticial marca el momento en el que las 'critical_mortality_odds' 
-     se convierten en la nueva probabilidad de mortalidad.
+    El riesgo se calcula en función de la edad. la edad en la que el riesgo empieza
+      a aumentar, y la edad crticial marca el momento en el que las 'critical_mortality_odds'
+      se convierten en la nueva probabilidad de mortalidad.
 
-    Se puede establecer si el riesgo aumenta de forma lineal o cuadrática.
+     Se puede establecer si el riesgo aumenta de forma lineal o cuadrática.
 
-    Argumentos clave
-    -----------------
-    age : int
-        La edad de la persona
+     Argumentos clave
+     -----------------
+     age : int or ndarray
+         La edad de la persona, o un arreglo de edades para evaluar a
+         varias personas a la vez
 
-    mortality_chance : float
-        La probabilidad base de mortalidad
+     mortality_chance : float
+         La probabilidad base de mortalidad
 
-    risk_age : int
-        La edad a la que el riesgo empieza a aumentar
+     risk_age : int
+         La edad a la que el riesgo empieza a aumentar
 
-    critical_age : int
-        la edad en la que el riesgo de mortalidad es igual a la
-        critical_mortality_odds
+     critical_age : int
+         la edad en la que el riesgo de mortalidad es igual a la
+         critical_mortality_odds
 
-    critical_mortality_chance : float
-        las probabilidades de morir a la edad crítica
+     critical_mortality_chance : float
+         las probabilidades de morir a la edad crítica
 
-    risk_increase : str
-       define si el riesgo de mortalidad entre la edad de riesgo y la edad 
-       crítica aumenta de forma lineal o exponencial
+     risk_increase : str
+        define si el riesgo de mortalidad entre la edad de riesgo y la edad
+        crítica aumenta de forma lineal o exponencial
     """
 
-    if risk_age < age < critical_age:  # Si esta en el rango de edades
+    ages = np.asarray(age, dtype=np.float64)
+    risk = np.where(ages <= risk_age, mortality_chance, critical_mortality_chance)
+    in_range = (risk_age < ages) & (
+        ages < critical_age
+    )  # Si esta en el rango de edades
+
+    if np.any(in_range):
         if risk_increase == "linear":
             # Encontrar riesgo lineal
             step_increase = (critical_mortality_chance) / (
                 (critical_age - risk_age) + 1
             )
-            risk = critical_mortality_chance - ((critical_age - age) * step_increase)
-            return risk
+            risk[in_range] = critical_mortality_chance - (
+                (critical_age - ages[in_range]) * step_increase
+            )
         elif risk_increase == "quadratic":
             # define funcion exponencial entre risk_age y critical_age
             pw = 15
@@ -427,16 +441,21 @@ def compute_mortality(
             x = np.linspace(0, critical_age, critical_age)
             # Encuetra valores
             risk_values = ((x + a) ** pw) * b
-            return risk_values[np.int32(age - 1)]
-    elif age <= risk_age:
-        # Retorna la probabilidad de muerte
-        return mortality_chance
-    elif age >= critical_age:
-        # Returna la probabilidad critica de muerte 
-        return critical_mortality_chance
+            risk[in_range] = risk_values[np.int32(ages[in_range] - 1)]
+        else:
+            raise ValueError(
+                "risk_increase %s not understood! Must be either 'linear' or 'quadratic'"
+                % risk_increase
+            )
+
+    if risk.ndim == 0:
+        return float(risk)
+    return risk
 
 
-def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.2):
+def healthcare_infection_correction(
+    worker_population, healthcare_risk_factor=0.2, rng=None
+):
     """corrige la infección a la población sanitaria.
 
     Toma el factor de riesgo sanitario y ajusta el personal sanitario enfermo reduciendo (si < 0) o 
@@ -452,12 +471,16 @@ def healthcare_infection_correction(worker_population, healthcare_risk_factor=0.
         si es distinto de uno, define el cambio en las probabilidades de contraer una infección. 
         Puede utilizarse para simular que el personal sanitario dispone de protecciones adicionales 
         (< 1) o que corren más riesgo debido a la exposición, la fatiga u otros factores (> 1)
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
     if healthcare_risk_factor < 0:
         # Configurar 1 - healthcare_risk_factor no enfermos
         sick_workers = worker_population[:, 6][worker_population[:, 6] == 1]
-        cure_vector = np.random.uniform((len(sick_workers)))
+        cure_vector = rng.uniform((len(sick_workers)))
         sick_workers[:, 6][cure_vector >= healthcare_risk_factor] = 0
     elif healthcare_risk_factor > 0:
         # TODO: make proportion of extra workers sick
@@ -0,0 +1,175 @@
+"""
+contiene la instrumentación de la simulación: cronómetros por etapa de
+cada paso con el reloj monotónico, histogramas acumulados de duración,
+contadores y medidores, y su exportación a JSON o CSV
+"""
+
+import csv
+import json
+import time
+
+import numpy as np
+
+# número de cubetas de los histogramas: la cubeta b cuenta duraciones de
+# 2**(b-1) a 2**b nanosegundos
+HISTOGRAM_BUCKETS = 64
+
+# columnas de write_csv
+CSV_FIELDS = (
+    "kind", "name", "calls", "total", "mean", "p50", "p95", "p99", "last", "max"
+)
+
+
+class Instruments:
+    """Cronómetros, contadores y medidores de la simulación
+
+    En cada paso start_tick pone en marcha el reloj y cada lap(etapa)
+    suma a esa etapa el tiempo desde la marca anterior, así cada etapa
+    cuesta una sola lectura del reloj. Las duraciones se acumulan en un
+    histograma logarítmico por etapa.
+
+    count suma a un contador (por ejemplo pares de contacto evaluados) y
+    gauge registra el último valor y el máximo de un medidor (por ejemplo
+    camas ocupadas).
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.ticks = 0
+        self.phases = {}
+        self.counters = {}
+        self.gauges = {}
+        self._tick_start = 0
+        self._last = 0
+
+    def _add(self, phase, elapsed):
+        entry = self.phases.get(phase)
+        if entry is None:
+            entry = self.phases[phase] = [0, 0, [0] * HISTOGRAM_BUCKETS]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2][min(elapsed.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def start_tick(self):
+        self._tick_start = self._last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        """Suma a phase el tiempo desde la marca anterior"""
+        now = time.perf_counter_ns()
+        self._add(phase, now - self._last)
+        self._last = now
+
+    def end_tick(self):
+        """Cierra el paso y suma su duración total a la etapa 'tick'"""
+        now = time.perf_counter_ns()
+        self._add("tick", now - self._tick_start)
+        self._last = now
+        self.ticks += 1
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def gauge(self, name, value):
+        value = int(value)
+        previous = self.gauges.get(name)
+        peak = value if previous is None else max(previous[1], value)
+        self.gauges[name] = (value, peak)
+
+    def reset(self):
+        self.__init__()
+
+    def summary(self):
+        """Diccionario con el resumen de etapas, contadores y medidores
+
+        Los percentiles se estiman con el límite superior de la cubeta del
+        histograma, en segundos.
+        """
+
+        phases = {}
+        for phase, (calls, total, histogram) in self.phases.items():
+            cumulative = np.cumsum(histogram)
+            percentiles = {
+                name: float(2.0 ** np.searchsorted(cumulative, q * calls) / 1e9)
+                for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            }
+            phases[phase] = dict(
+                calls=calls,
+                total=total / 1e9,
+                mean=total / calls / 1e9,
+                histogram=list(histogram),
+                **percentiles
+            )
+
+        return {
+            "ticks": self.ticks,
+            "phases": phases,
+            "counters": dict(self.counters),
+            "gauges": {
+                name: {"last": last, "max": peak}
+                for name, (last, peak) in self.gauges.items()
+            },
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_csv(self, path):
+        """Una fila por etapa, contador y medidor"""
+        summary = self.summary()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, restval="")
+            writer.writeheader()
+            for phase, s in summary["phases"].items():
+                row = {k: v for k, v in s.items() if k != "histogram"}
+                writer.writerow(dict(row, kind="phase", name=phase))
+            for name, value in summary["counters"].items():
+                writer.writerow({"kind": "counter", "name": name, "total": value})
+            for name, g in summary["gauges"].items():
+                writer.writerow(dict(g, kind="gauge", name=name))
+
+    def export(self, path):
+        """Escribe el resumen en CSV si path termina en .csv, si no en JSON"""
+        if path.lower().endswith(".csv"):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+
+class NullInstruments:
+    """Instrumentación desactivada: todos los métodos son vacíos"""
+
+    enabled = False
+
+    def start_tick(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_tick(self):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def reset(self):
+        pass
+
+    def summary(self):
+        return {}
+
+    def export(self, path):
+        pass
+
+
+NULL_INSTRUMENTS = NullInstruments()
+
+
+def make_instruments(enabled):
+    """Instruments si enabled, si no la instrumentación vacía compartida"""
+    return Instruments() if enabled else NULL_INSTRUMENTS
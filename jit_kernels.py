@@ -0,0 +1,342 @@
+"""
+contiene los kernels compilados con numba para el paso de la simulación:
+movimiento con rebote en los límites y búsqueda de contactos en rejilla,
+fusionados y paralelos sobre las columnas de la población
+"""
+
+import math
+
+import numpy as np
+
+from config import config_error
+
+try:
+    from numba import njit, prange
+
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba es opcional, sin él se usa el camino de NumPy
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # sin numba los kernels quedan como funciones de Python puro
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+TICK_BACKENDS = ("auto", "numpy", "numba")
+
+
+def resolve_tick_backend(backend="auto"):
+    """Devuelve 'numpy' o 'numba' según la configuración y lo instalado
+
+    Keyword arguments
+    -----------------
+    backend : str
+        'numpy', 'numba' o 'auto' (numba si está instalado, si no NumPy)
+    """
+
+    backend = backend.lower()
+    if backend == "auto":
+        return "numba" if NUMBA_AVAILABLE else "numpy"
+    if backend == "numba" and not NUMBA_AVAILABLE:
+        raise config_error("tick_backend 'numba' requiere tener numba instalado")
+    if backend not in TICK_BACKENDS:
+        raise config_error(
+            "tick_backend %s no reconocido, use uno de %s"
+            % (backend, ", ".join(TICK_BACKENDS))
+        )
+    return backend
+
+
+def single_thread_worker():
+    """Limita los kernels de numba a un hilo en este proceso
+
+    Se usa como inicializador de los grupos de procesos: cada proceso ya
+    ocupa un núcleo, con un grupo de hilos por proceso se sobresuscriben.
+    Los resultados no cambian, los números aleatorios no dependen de los
+    hilos.
+    """
+    if NUMBA_AVAILABLE:
+        import numba
+
+        numba.set_num_threads(1)
+
+
+def _columns(population):
+    # columnas de la población, arreglos propios en Population o vistas de la matriz
+    if hasattr(population, "columns"):
+        return population.columns
+    return [population[:, k] for k in range(population.shape[1])]
+
+
+@njit(parallel=True, cache=True)
+def _motion_kernel(
+    x,
+    y,
+    heading_x,
+    heading_y,
+    speed,
+    state,
+    destination,
+    bounds,
+    uniforms,
+    normals,
+    randomize,
+    mean_speed,
+    heading_update_chance,
+    speed_update_chance,
+    heading_multiplication,
+    speed_multiplication,
+):
+    for i in prange(len(x)):
+        hx = heading_x[i]
+        hy = heading_y[i]
+        sp = speed[i]
+
+        # rebote en los límites para quienes no van a un destino
+        if destination[i] == 0:
+            if x[i] <= bounds[0] and hx < 0:
+                hx = min(max(0.5 + normals[0, i] * 0.5 / 3, 0.05), 1.0)
+            elif x[i] >= bounds[1] and hx > 0:
+                hx = min(max(-(0.5 + normals[0, i] * 0.5 / 3), -1.0), -0.05)
+            if y[i] <= bounds[2] and hy < 0:
+                hy = min(max(0.5 + normals[1, i] * 0.5 / 3, 0.05), 1.0)
+            elif y[i] >= bounds[3] and hy > 0:
+                hy = min(max(-(0.5 + normals[1, i] * 0.5 / 3), -1.0), -0.05)
+
+        # cambios aleatorios de dirección y velocidad
+        if randomize:
+            if uniforms[0, i] <= heading_update_chance:
+                hx = normals[0, i] / 3 * heading_multiplication
+            if uniforms[1, i] <= heading_update_chance:
+                hy = normals[1, i] / 3 * heading_multiplication
+            if uniforms[2, i] <= speed_update_chance:
+                sp = (
+                    mean_speed + normals[2, i] * mean_speed / 3
+                ) * speed_multiplication
+            sp = min(max(sp, 0.0001), 0.05)
+
+        # los fallecidos no se mueven
+        if state[i] == 3:
+            hx = 0.0
+            hy = 0.0
+
+        heading_x[i] = hx
+        heading_y[i] = hy
+        speed[i] = sp
+        x[i] += hx * sp
+        y[i] += hy * sp
+
+
+def update_motion_jit(
+    population,
+    xbounds,
+    ybounds,
+    rng,
+    speed=0.01,
+    randomize=True,
+    heading_update_chance=0.02,
+    speed_update_chance=0.02,
+    heading_multiplication=1,
+    speed_multiplication=1,
+):
+    """rebote en los límites, cambios aleatorios y avance en un solo kernel
+
+    Equivale a out_of_bounds sobre quienes no tienen destino activo, seguido
+    de update_randoms (si randomize), de detener a los fallecidos y de
+    update_positions, pero recorre la población una sola vez y en paralelo.
+    Los números aleatorios se sacan antes de rng, así que el resultado
+    depende solo de la semilla y no del número de hilos. Se sacan para toda
+    la población y no solo para quien cambia como en update_motion, así
+    que con la misma semilla el resultado difiere del camino de NumPy.
+
+    Keyword arguments
+    -----------------
+    population : Population or ndarray
+        Contiene toda la informacion de la población, se actualiza en el lugar
+
+    xbounds, ybounds : list or tuple
+        límites [min, max] en los que rebotan las personas sin destino
+
+    rng : numpy.random.Generator or RandomBlock
+        generador de los números aleatorios del paso
+
+    speed : float
+        velocidad media usada al sortear nuevas velocidades
+
+    randomize : bool
+        si se aplican los cambios aleatorios de update_randoms (en el encierro no)
+
+    heading_update_chance, speed_update_chance : float
+        probabilidad por paso de cambiar la dirección y la velocidad
+
+    heading_multiplication, speed_multiplication : int or float
+        factores de las direcciones y velocidades sorteadas
+    """
+
+    columns = _columns(population)
+    n = len(columns[0])
+    uniforms = rng.random(size=(3, n)) if randomize else np.ones((3, 0))
+    normals = rng.normal(size=(3, n))
+    bounds = np.array(
+        [xbounds[0], xbounds[1], ybounds[0], ybounds[1]], dtype=np.float64
+    )
+
+    _motion_kernel(
+        columns[1],
+        columns[2],
+        columns[3],
+        columns[4],
+        columns[5],
+        columns[6],
+        columns[11],
+        bounds,
+        uniforms,
+        normals,
+        randomize,
+        speed,
+        heading_update_chance,
+        speed_update_chance,
+        heading_multiplication,
+        speed_multiplication,
+    )
+    return population
+
+
+@njit(cache=True)
+def _build_cells(cell, n_cells):
+    # ordenamiento por conteo de los puntos según su celda
+    cell_start = np.zeros(n_cells + 1, dtype=np.int64)
+    for k in range(len(cell)):
+        cell_start[cell[k] + 1] += 1
+    for c in range(n_cells):
+        cell_start[c + 1] += cell_start[c]
+
+    fill = cell_start[:-1].copy()
+    order = np.empty(len(cell), dtype=np.int64)
+    for k in range(len(cell)):
+        order[fill[cell[k]]] = k
+        fill[cell[k]] += 1
+    return order, cell_start
+
+
+@njit(parallel=True, cache=True)
+def _contact_kernel(
+    centers, points, radius, origin, cell_size, nx, ny, order, cell_start, counts, out
+):
+    # con out vacío solo cuenta los pares de cada centro, si no los escribe
+    # en su tramo out[counts[i]:counts[i + 1]] ordenados por punto
+    write = len(out) > 0
+    for i in prange(len(centers)):
+        cx = centers[i, 0]
+        cy = centers[i, 1]
+        x0 = min(max(int(math.floor((cx - radius - origin[0]) / cell_size)), 0), nx - 1)
+        x1 = min(max(int(math.floor((cx + radius - origin[0]) / cell_size)), 0), nx - 1)
+        y0 = min(max(int(math.floor((cy - radius - origin[1]) / cell_size)), 0), ny - 1)
+        y1 = min(max(int(math.floor((cy + radius - origin[1]) / cell_size)), 0), ny - 1)
+
+        found = 0
+        start = counts[i] if write else 0
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                c = gx * ny + gy
+                for k in range(cell_start[c], cell_start[c + 1]):
+                    j = order[k]
+                    # misma zona estricta que _pairs_in_zone de spatial_index
+                    if (
+                        cx - radius < points[j, 0]
+                        and points[j, 0] < cx + radius
+                        and cy - radius < points[j, 1]
+                        and points[j, 1] < cy + radius
+                    ):
+                        if write:
+                            out[start + found] = j
+                        found += 1
+
+        if write:
+            out[start : start + found] = np.sort(out[start : start + found])
+        else:
+            counts[i] = found
+
+
+def contact_pairs_jit(centers, points, radius):
+    """todos los pares (centro, punto) con el punto en la zona del centro
+
+    Construye una rejilla sobre points y la recorre en paralelo desde cada
+    centro, en dos pasadas: la primera cuenta los pares de cada centro y la
+    segunda los escribe en su tramo. Los pares salen ordenados por centro y
+    luego por punto, el mismo orden que SpatialGrid.query_pairs.
+
+    Keyword arguments
+    -----------------
+    centers : ndarray
+        arreglo (M, 2) con las posiciones de los infectados
+
+    points : ndarray
+        arreglo (N, 2) con las posiciones de los sanos
+
+    radius : float
+        rango de infección
+
+    Retorna
+    -------
+    dos arreglos con el índice en centers y el índice en points de cada par
+    """
+
+    centers = np.ascontiguousarray(centers, dtype=np.float64).reshape(-1, 2)
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(centers) == 0 or len(points) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # celdas de lado al menos radius, con un máximo del orden de la raíz de N por eje
+    origin = points.min(axis=0)
+    extent = points.max(axis=0) - origin
+    max_cells = int(np.sqrt(len(points))) + 1
+    cell_size = max(radius, extent.max() / max_cells, 1e-12)
+    nx = int(extent[0] // cell_size) + 1
+    ny = int(extent[1] // cell_size) + 1
+
+    gx = np.minimum((points[:, 0] - origin[0]) // cell_size, nx - 1).astype(np.int64)
+    gy = np.minimum((points[:, 1] - origin[1]) // cell_size, ny - 1).astype(np.int64)
+    order, cell_start = _build_cells(gx * ny + gy, nx * ny)
+
+    counts = np.zeros(len(centers) + 1, dtype=np.int64)
+    empty = np.zeros(0, dtype=np.int64)
+    _contact_kernel(
+        centers,
+        points,
+        radius,
+        origin,
+        cell_size,
+        nx,
+        ny,
+        order,
+        cell_start,
+        counts,
+        empty,
+    )
+
+    found = counts[:-1].copy()
+    counts[1:] = np.cumsum(found)
+    counts[0] = 0
+    pairs = np.empty(counts[-1], dtype=np.int64)
+    if len(pairs) == 0:
+        return empty, empty
+    _contact_kernel(
+        centers,
+        points,
+        radius,
+        origin,
+        cell_size,
+        nx,
+        ny,
+        order,
+        cell_start,
+        counts,
+        pairs,
+    )
+
+    return np.repeat(np.arange(len(centers)), found), pairs
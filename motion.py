@@ -4,6 +4,8 @@ Contiene todos los metodos relacionados con la mobilidad
 
 import numpy as np
 
+from random_streams import get_rng
+
 
 def update_positions(population):
     """Actualiza la pocision de todas las personas
@@ -25,7 +27,7 @@ def update_positions(population):
     return population
 
 
-def out_of_bounds(population, xbounds, ybounds):
+def out_of_bounds(population, xbounds, ybounds, rng=None):
     """comprueba qué personas están a punto de salirse de los límites y corrige
 
     Función que actualiza las cabeceras de los individuos que están a punto de salir de los límites del mundo.
@@ -37,43 +39,144 @@ def out_of_bounds(population, xbounds, ybounds):
 
      xbounds, ybounds : list or tuple
          Contiene los limites superior e inferior [min, max]
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
-    # Actualiza la dirección cuando se encuentra en los limites
-    # Actualiza la dirección en X
-    # Determina la cantidad de elementos que necesitan ser actualizados
-
-    shp = population[:, 3][
-        (population[:, 1] <= xbounds[:, 0]) & (population[:, 3] < 0)
-    ].shape
-    population[:, 3][
-        (population[:, 1] <= xbounds[:, 0]) & (population[:, 3] < 0)
-    ] = np.clip(np.random.normal(loc=0.5, scale=0.5 / 3, size=shp), a_min=0.05, a_max=1)
-
-    shp = population[:, 3][
-        (population[:, 1] >= xbounds[:, 1]) & (population[:, 3] > 0)
-    ].shape
-    population[:, 3][
-        (population[:, 1] >= xbounds[:, 1]) & (population[:, 3] > 0)
-    ] = np.clip(
-        -np.random.normal(loc=0.5, scale=0.5 / 3, size=shp), a_min=-1, a_max=-0.05
-    )
+    rng = get_rng(rng)
+
+    # Actualiza la dirección cuando se encuentra en los limites,
+    # cada máscara se evalúa una sola vez
+    rows = np.arange(len(population))
+    _reflect(population[:, 1], population[:, 3], rows, xbounds, rng)
+    _reflect(population[:, 2], population[:, 4], rows, ybounds, rng)
+
+    return population
+
+
+def _axis_bounds(bounds, rows):
+    # límites [min, max] comunes o por persona (arreglo (N, 2)) para las filas dadas
+    bounds = np.asarray(bounds, dtype=np.float64)
+    if bounds.ndim == 2:
+        return bounds[rows, 0], bounds[rows, 1]
+    return bounds[0], bounds[1]
+
+
+def _reflect(position, heading, rows, bounds, rng):
+    # rebote en un eje: quien está en el límite y avanza hacia afuera gira hacia adentro
+    low, high = _axis_bounds(bounds, rows)
+    pos = position[rows]
+    head = heading[rows]
+    under = rows[(pos <= low) & (head < 0)]
+    over = rows[(pos >= high) & (head > 0)]
 
-    # Actualiza la dirección en Y
-    shp = population[:, 4][
-        (population[:, 2] <= ybounds[:, 0]) & (population[:, 4] < 0)
-    ].shape
-    population[:, 4][
-        (population[:, 2] <= ybounds[:, 0]) & (population[:, 4] < 0)
-    ] = np.clip(np.random.normal(loc=0.5, scale=0.5 / 3, size=shp), a_min=0.05, a_max=1)
-
-    shp = population[:, 4][
-        (population[:, 2] >= ybounds[:, 1]) & (population[:, 4] > 0)
-    ].shape
-    population[:, 4][
-        (population[:, 2] >= ybounds[:, 1]) & (population[:, 4] > 0)
-    ] = np.clip(
-        -np.random.normal(loc=0.5, scale=0.5 / 3, size=shp), a_min=-1, a_max=-0.05
+    heading[under] = np.clip(
+        rng.normal(loc=0.5, scale=0.5 / 3, size=len(under)), a_min=0.05, a_max=1
     )
+    heading[over] = np.clip(
+        -rng.normal(loc=0.5, scale=0.5 / 3, size=len(over)), a_min=-1, a_max=-0.05
+    )
+
+
+def _sample_rows(rng, rows, chance):
+    # cada fila con probabilidad chance, sorteando solo los aciertos
+    count = rng.binomial(len(rows), chance)
+    return rows[rng.choice(len(rows), size=count, replace=False, shuffle=False)]
+
+
+def update_motion(
+    population,
+    xbounds,
+    ybounds,
+    speed=0.01,
+    randomize=True,
+    heading_update_chance=0.02,
+    speed_update_chance=0.02,
+    heading_multiplication=1,
+    speed_multiplication=1,
+    rows=None,
+    rng=None,
+):
+    """rebote en los límites, cambios aleatorios y avance en una sola etapa
+
+    Reemplaza a out_of_bounds, update_randoms y update_positions: actualiza
+    dirección, velocidad y posición en el lugar, sin copiar filas de la
+    población. Las personas fallecidas quedan con dirección 0 y, como las
+    de velocidad 0 (por ejemplo en el encierro), no se mueven. Solo rebotan quienes no tienen un destino activo,
+    y los cambios aleatorios se sortean solo para las personas que cambian.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        Contiene toda la informacion de la población
+
+    xbounds, ybounds : list, tuple or ndarray
+        límites [min, max] comunes a todos, o arreglo (N, 2) con los límites
+        de cada persona
+
+    speed : float
+        velocidad media usada al sortear nuevas velocidades
+
+    randomize : bool
+        si se aplican los cambios aleatorios de dirección y velocidad
+
+    heading_update_chance, speed_update_chance : float
+        probabilidad por paso de cambiar la dirección y la velocidad
+
+    heading_multiplication, speed_multiplication : int or float
+        factores de las direcciones y velocidades sorteadas
+
+    rows : ndarray
+        índices de las personas a mover, por defecto toda la población (por
+        ejemplo las de una franja del mundo en domain.TiledSimulation)
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
+    """
+    rng = get_rng(rng)
+
+    x = population[:, 1]
+    y = population[:, 2]
+    heading_x = population[:, 3]
+    heading_y = population[:, 4]
+    speeds = population[:, 5]
+
+    if rows is None:
+        dead = np.flatnonzero(population[:, 6] == 3)
+        rows = np.flatnonzero((population[:, 6] != 3) & (speeds != 0))
+    else:
+        dead = rows[population[:, 6][rows] == 3]
+        rows = rows[(population[:, 6][rows] != 3) & (speeds[rows] != 0)]
+
+    # los fallecidos quedan sin dirección
+    heading_x[dead] = 0
+    heading_y[dead] = 0
+
+    # rebote para quienes no van a un destino
+    free = rows[population[rows, 11] == 0]
+    _reflect(x, heading_x, free, xbounds, rng)
+    _reflect(y, heading_y, free, ybounds, rng)
+
+    if randomize:
+        for heading in (heading_x, heading_y):
+            changed = _sample_rows(rng, rows, heading_update_chance)
+            heading[changed] = (
+                rng.normal(loc=0, scale=1 / 3, size=len(changed))
+                * heading_multiplication
+            )
+        changed = _sample_rows(rng, rows, speed_update_chance)
+        speeds[changed] = (
+            rng.normal(loc=speed, scale=speed / 3, size=len(changed))
+            * speed_multiplication
+        )
+
+    # con toda la población en movimiento se trabaja sobre columnas completas
+    if len(rows) == len(x):
+        rows = slice(None)
+    if randomize:
+        speeds[rows] = np.clip(speeds[rows], a_min=0.0001, a_max=0.05)
+    x[rows] += heading_x[rows] * speeds[rows]
+    y[rows] += heading_y[rows] * speeds[rows]
 
     return population
 
@@ -86,6 +189,7 @@ def update_randoms(
     speed_update_chance=0.02,
     heading_multiplication=1,
     speed_multiplication=1,
+    rng=None,
 ):
     """actualiza estados aleatorios como el rumbo y la velocidad
 
@@ -113,26 +217,30 @@ def update_randoms(
 
     speed : int or float
         velocidad media de los miembros de la población, las velocidades se tomarán de una distribución gaussiana con media 'velocidad' y sd 'velocidad / 3'
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
     # Actualiza la dirección aleatoriamente
     # x
-    update = np.random.random(size=(pop_size,))
+    update = rng.random(size=(pop_size,))
     shp = update[update <= heading_update_chance].shape
     population[:, 3][update <= heading_update_chance] = (
-        np.random.normal(loc=0, scale=1 / 3, size=shp) * heading_multiplication
+        rng.normal(loc=0, scale=1 / 3, size=shp) * heading_multiplication
     )
     # y
-    update = np.random.random(size=(pop_size,))
+    update = rng.random(size=(pop_size,))
     shp = update[update <= heading_update_chance].shape
     population[:, 4][update <= heading_update_chance] = (
-        np.random.normal(loc=0, scale=1 / 3, size=shp) * heading_multiplication
+        rng.normal(loc=0, scale=1 / 3, size=shp) * heading_multiplication
     )
     # Aleatoriza la velocidad
-    update = np.random.random(size=(pop_size,))
+    update = rng.random(size=(pop_size,))
     shp = update[update <= heading_update_chance].shape
     population[:, 5][update <= heading_update_chance] = (
-        np.random.normal(loc=speed, scale=speed / 3, size=shp) * speed_multiplication
+        rng.normal(loc=speed, scale=speed / 3, size=shp) * speed_multiplication
     )
 
     population[:, 5] = np.clip(population[:, 5], a_min=0.0001, a_max=0.05)
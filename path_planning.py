@@ -4,7 +4,8 @@ Contine metodos relacionados a la planeacion de rutasa hacia el destino
 
 import numpy as np
 
-from motion import get_motion_parameters, update_randoms
+from motion import get_motion_parameters
+from random_streams import get_rng
 
 
 def go_to_location(patient, destination, location_bounds, dest_no=1):
@@ -42,6 +43,67 @@ def go_to_location(patient, destination, location_bounds, dest_no=1):
     return patient, destination
 
 
+def go_to_location_batch(population, destinations, ids, location_bounds, dest_no=1):
+    """Envía a varios pacientes a la ubicación deseada
+
+    Versión vectorizada de go_to_location que actualiza directamente las filas
+    de la población y de la matriz de destinos.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        El arreglo que contiene la información de la población
+
+    destinations : ndarray
+        El arreglo que contiene la información de los destinos
+
+    ids : ndarray
+        Índices de los pacientes que se envían a la ubicación
+
+    location_bounds : list or tuple
+        Define los limites en los que los pacientes se pueden mover
+
+    dest_no : int
+        Define el numero del destino al cual se debe llegar
+    """
+
+    x_center, y_center, x_wander, y_wander = get_motion_parameters(
+        location_bounds[0], location_bounds[1], location_bounds[2], location_bounds[3]
+    )
+    population[ids, 13] = x_wander
+    population[ids, 14] = y_wander
+
+    destinations[ids, (dest_no - 1) * 2] = x_center
+    destinations[ids, ((dest_no - 1) * 2) + 1] = y_center
+
+    population[ids, 11] = dest_no
+
+    return population, destinations
+
+
+def destination_coordinates(population, destinations, rows):
+    """Coordenadas del destino activo de cada persona
+
+    Toma de cada fila la pareja de columnas de la matriz de destinos que
+    indica su destino activo (columna 11 de la población), con una sola
+    indexación sin importar cuántos destinos distintos haya.
+
+    Keyword arguments
+    -----------------
+    population : ndarray
+        El arreglo que contiene la información de la población
+
+    destinations : ndarray
+        El arreglo que contiene la información de los destinos
+
+    rows : ndarray
+        Índices de las personas, todas con un destino activo
+    """
+
+    column = (population[rows, 11].astype(np.intp) - 1) * 2
+    return destinations[rows, column], destinations[rows, column + 1]
+
+
 def set_destination(population, destinations):
     """Configurar el destino de la pobalción
 
@@ -56,30 +118,21 @@ def set_destination(population, destinations):
         El arreglo que contiene la información de los destinos
     """
 
-    # Cuantos destinos estan activos
-    active_dests = np.unique(population[:, 11][population[:, 11] != 0])
+    # Quienes van de camino a su destino
+    rows = np.flatnonzero((population[:, 11] != 0) & (population[:, 12] == 0))
+    dest_x, dest_y = destination_coordinates(population, destinations, rows)
 
-    # Configurar Destino
-    for d in active_dests:
-        dest_x = destinations[:, int((d - 1) * 2)]
-        dest_y = destinations[:, int(((d - 1) * 2) + 1)]
-
-        # Calcular nuevas direcciones
-        head_x = dest_x - population[:, 1]
-        head_y = dest_y - population[:, 2]
-
-        population[:, 3][(population[:, 11] == d) & (population[:, 12] == 0)] = head_x[
-            (population[:, 11] == d) & (population[:, 12] == 0)
-        ]
-        population[:, 4][(population[:, 11] == d) & (population[:, 12] == 0)] = head_y[
-            (population[:, 11] == d) & (population[:, 12] == 0)
-        ]
-        population[:, 5][(population[:, 11] == d) & (population[:, 12] == 0)] = 0.02
+    # Calcular nuevas direcciones
+    population[:, 3][rows] = dest_x - population[:, 1][rows]
+    population[:, 4][rows] = dest_y - population[:, 2][rows]
+    population[:, 5][rows] = 0.02
 
     return population
 
 
-def check_at_destination(population, destinations, wander_factor=1.5, speed=0.01):
+def check_at_destination(
+    population, destinations, wander_factor=1.5, speed=0.01, rng=None
+):
     """comprobar quién se encuentra ya en su destino
 
     Toma subconjunto de población con destino activo y comprueba quién se encuentra en las coordenadas requeridas. Actualiza en destino para las personas en destino.
@@ -94,52 +147,44 @@ def check_at_destination(population, destinations, wander_factor=1.5, speed=0.01
 
     wander_factor : int or float
         define a qué distancia fuera del "rango de recorrido" se alcanza el destino se activa
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
+
+    # Quienes van de camino a su destino
+    rows = np.flatnonzero((population[:, 11] != 0) & (population[:, 12] == 0))
+    dest_x, dest_y = destination_coordinates(population, destinations, rows)
 
-    # Cuantos destinos estan activos
-    active_dests = np.unique(population[:, 11][(population[:, 11] != 0)])
-
-    # Ver quien esta en el destino
-    for d in active_dests:
-        dest_x = destinations[:, int((d - 1) * 2)]
-        dest_y = destinations[:, int(((d - 1) * 2) + 1)]
-
-        # ver quién ha llegado al destino y filtrar quién ya estaba allí
-        at_dest = population[
-            (np.abs(population[:, 1] - dest_x) < (population[:, 13] * wander_factor))
-            & (np.abs(population[:, 2] - dest_y) < (population[:, 14] * wander_factor))
-            & (population[:, 12] == 0)
-        ]
-
-        if len(at_dest) > 0:
-            # Marcar como llegado
-            at_dest[:, 12] = 1
-            # insertar cabeceras y velocidades aleatorias para los de destino
-            at_dest = update_randoms(
-                at_dest,
-                pop_size=len(at_dest),
-                speed=speed,
-                heading_update_chance=1,
-                speed_update_chance=1,
-            )
-
-            # Re insertar a la población
-            population[
-                (
-                    np.abs(population[:, 1] - dest_x)
-                    < (population[:, 13] * wander_factor)
-                )
-                & (
-                    np.abs(population[:, 2] - dest_y)
-                    < (population[:, 14] * wander_factor)
-                )
-                & (population[:, 12] == 0)
-            ] = at_dest
+    # ver quién ha llegado al destino
+    arrived = rows[
+        (
+            np.abs(population[:, 1][rows] - dest_x)
+            < (population[:, 13][rows] * wander_factor)
+        )
+        & (
+            np.abs(population[:, 2][rows] - dest_y)
+            < (population[:, 14][rows] * wander_factor)
+        )
+    ]
+
+    if len(arrived) > 0:
+        # Marcar como llegado
+        population[:, 12][arrived] = 1
+        # insertar cabeceras y velocidades aleatorias para los de destino
+        population[:, 3][arrived] = rng.normal(loc=0, scale=1 / 3, size=len(arrived))
+        population[:, 4][arrived] = rng.normal(loc=0, scale=1 / 3, size=len(arrived))
+        population[:, 5][arrived] = np.clip(
+            rng.normal(loc=speed, scale=speed / 3, size=len(arrived)),
+            a_min=0.0001,
+            a_max=0.05,
+        )
 
     return population
 
 
-def keep_at_destination(population, destinations, wander_factor=1):
+def keep_at_destination(population, destinations, wander_factor=1, rng=None):
     """mantiene a los que han llegado, al alcance de los vagabundos
 
     Función que mantiene a los que han sido marcados como llegados a su destino dentro de sus respectivos rangos de vagabundeo
@@ -154,58 +199,33 @@ def keep_at_destination(population, destinations, wander_factor=1):
 
     wander_factor : int or float
         define a qué distancia fuera del "rango de recorrido" se alcanza el destino se activa
-    """
-
-    active_dests = np.unique(
-        population[:, 11][(population[:, 11] != 0) & (population[:, 12] == 1)]
-    )
 
-    for d in active_dests:
-        dest_x = destinations[:, int((d - 1) * 2)][
-            (population[:, 12] == 1) & (population[:, 11] == d)
-        ]
-        dest_y = destinations[:, int(((d - 1) * 2) + 1)][
-            (population[:, 12] == 1) & (population[:, 11] == d)
-        ]
-
-        arrived = population[(population[:, 12] == 1) & (population[:, 11] == d)]
-
-        ids = np.int32(arrived[:, 0])  # find unique IDs of arrived persons
-
-        shp = arrived[:, 3][
-            arrived[:, 1] > (dest_x + (arrived[:, 13] * wander_factor))
-        ].shape
-
-        arrived[:, 3][
-            arrived[:, 1] > (dest_x + (arrived[:, 13] * wander_factor))
-        ] = -np.random.normal(loc=0.5, scale=0.5 / 3, size=shp)
-
-        shp = arrived[:, 3][
-            arrived[:, 1] < (dest_x - (arrived[:, 13] * wander_factor))
-        ].shape
-        arrived[:, 3][
-            arrived[:, 1] < (dest_x - (arrived[:, 13] * wander_factor))
-        ] = np.random.normal(loc=0.5, scale=0.5 / 3, size=shp)
-        shp = arrived[:, 4][
-            arrived[:, 2] > (dest_y + (arrived[:, 14] * wander_factor))
-        ].shape
-        arrived[:, 4][
-            arrived[:, 2] > (dest_y + (arrived[:, 14] * wander_factor))
-        ] = -np.random.normal(loc=0.5, scale=0.5 / 3, size=shp)
-        shp = arrived[:, 4][
-            arrived[:, 2] < (dest_y - (arrived[:, 14] * wander_factor))
-        ].shape
-        arrived[:, 4][
-            arrived[:, 2] < (dest_y - (arrived[:, 14] * wander_factor))
-        ] = np.random.normal(loc=0.5, scale=0.5 / 3, size=shp)
-
-        # Reducir velocidad
-        arrived[:, 5] = np.random.normal(
-            loc=0.005, scale=0.005 / 3, size=arrived[:, 5].shape
-        )
-
-        # Reinsertar en la población
-        population[(population[:, 12] == 1) & (population[:, 11] == d)] = arrived
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
+    """
+    rng = get_rng(rng)
+
+    # Quienes ya llegaron a su destino
+    rows = np.flatnonzero((population[:, 11] != 0) & (population[:, 12] == 1))
+    dest_x, dest_y = destination_coordinates(population, destinations, rows)
+
+    x = population[:, 1][rows]
+    y = population[:, 2][rows]
+    range_x = population[:, 13][rows] * wander_factor
+    range_y = population[:, 14][rows] * wander_factor
+
+    # devolver hacia el destino a quienes salen de su rango
+    for heading, position, center, wander in (
+        (population[:, 3], x, dest_x, range_x),
+        (population[:, 4], y, dest_y, range_y),
+    ):
+        over = rows[position > center + wander]
+        heading[over] = -rng.normal(loc=0.5, scale=0.5 / 3, size=len(over))
+        under = rows[position < center - wander]
+        heading[under] = rng.normal(loc=0.5, scale=0.5 / 3, size=len(under))
+
+    # Reducir velocidad
+    population[:, 5][rows] = rng.normal(loc=0.005, scale=0.005 / 3, size=len(rows))
 
     return population
 
@@ -8,15 +8,355 @@ import os
 import numpy as np
 
 from motion import get_motion_parameters
+from random_streams import get_rng
 from utils import check_folder
 
+# Número de estados posibles (0=Sano, 1=Enfermo, 2=Inmune, 3=Muerto, 4=Inmune pero infectado)
+N_STATES = 5
+
+# Columnas de la población en el orden de la matriz original y su tipo;
+# None indica el tipo flotante elegido para la cinemática
+POPULATION_COLUMNS = (
+    ("id", np.int32),
+    ("x", None),
+    ("y", None),
+    ("heading_x", None),
+    ("heading_y", None),
+    ("speed", None),
+    ("state", np.int8),
+    ("age", np.int16),
+    ("infected_since", np.int32),
+    ("recovery_vector", None),
+    ("in_treatment", np.int8),
+    ("destination", np.int16),
+    ("at_destination", np.int8),
+    ("wander_range_x", None),
+    ("wander_range_y", None),
+)
+
+
+def _column_property(index):
+    # acceso por nombre a una columna, la asignación se hace en el mismo arreglo
+    def getter(self):
+        return self.columns[index]
+
+    def setter(self, value):
+        self.columns[index][...] = value
+        self._column_written(index)
+
+    return property(getter, setter, doc=POPULATION_COLUMNS[index][0])
+
+
+class Population:
+    """Almacén columnar de la población con tipos por columna
+
+    Cada columna de la antigua matriz (N, 15) de float64 se guarda como un
+    arreglo propio: estado y banderas en int8, IDs y tiempos en int32 y la
+    cinemática en float32 o float64. Las columnas se pueden leer por nombre
+    (population.state, population.x, ...) o con la indexación de la matriz
+    original, de modo que las funciones de motion.py, path_planning.py e
+    infection.py siguen funcionando sin cambios:
+
+    population[:, 6]             columna completa, es el arreglo almacenado
+    population[mask, 6]          copia de la columna filtrada
+    population[mask, 1:3]        matriz float64 con las columnas pedidas
+    population[mask]             matriz float64 (k, 15) con las filas pedidas
+    population[mask] = rows      escribe filas con el formato de la matriz
+
+    Los cambios de estado y de tratamiento se hacen con set_state y
+    set_treatment, que mantienen los conteos por estado (y opcionalmente los
+    índices de cada estado) en O(cambios); count, treated e indices los leen
+    en O(1). Si las columnas 6 o 10 se escriben por otra vía (asignación por
+    índice o por nombre) los conteos se recalculan en la siguiente lectura;
+    las escrituras sobre la columna devuelta por population[:, 6] no se
+    detectan, en ese caso hay que llamar a recount.
+
+    Keyword arguments
+    -----------------
+    pop_size : int
+        Tamaño de la población
+
+    float_dtype : str or dtype
+        tipo de las columnas flotantes, 'float64' o 'float32'
+
+    track_indices : bool
+        si se mantiene además un arreglo de índices por estado
+    """
+
+    id = _column_property(0)
+    x = _column_property(1)
+    y = _column_property(2)
+    heading_x = _column_property(3)
+    heading_y = _column_property(4)
+    speed = _column_property(5)
+    state = _column_property(6)
+    age = _column_property(7)
+    infected_since = _column_property(8)
+    recovery_vector = _column_property(9)
+    in_treatment = _column_property(10)
+    destination = _column_property(11)
+    at_destination = _column_property(12)
+    wander_range_x = _column_property(13)
+    wander_range_y = _column_property(14)
+
+    def __init__(self, pop_size, float_dtype=np.float64, track_indices=False):
+        self.float_dtype = np.dtype(float_dtype)
+        self.track_indices = track_indices
+        self.columns = [
+            np.zeros(pop_size, dtype=self.float_dtype if dtype is None else dtype)
+            for _, dtype in POPULATION_COLUMNS
+        ]
+        self.recount()
+
+    @classmethod
+    def from_matrix(cls, matrix, float_dtype=np.float64, track_indices=False):
+        """Crea la población a partir de una matriz (N, 15)"""
+        population = cls(len(matrix), float_dtype, track_indices)
+        population[:] = matrix
+        return population
+
+    def recount(self):
+        """Recalcula desde las columnas los conteos y los índices por estado"""
+        state = self.columns[6]
+        self._state_counts = np.bincount(state, minlength=N_STATES).astype(np.int64)
+        self._treated = int(np.count_nonzero(self.columns[10] == 1))
+
+        if self.track_indices:
+            # members[s][:count[s]] son los índices en estado s, position[i]
+            # es la posición de i dentro de members[estado de i]
+            self._members = np.zeros((N_STATES, len(state)), dtype=np.int64)
+            self._position = np.zeros(len(state), dtype=np.int64)
+            for s in range(N_STATES):
+                rows = np.flatnonzero(state == s)
+                self._members[s, : len(rows)] = rows
+                self._position[rows] = np.arange(len(rows))
+        self._counts_valid = True
+
+    def _column_written(self, index):
+        # una escritura fuera de set_state / set_treatment invalida los conteos
+        if index in (6, 10):
+            self._counts_valid = False
+
+    def count(self, state):
+        """Número de personas en el estado dado"""
+        if not self._counts_valid:
+            self.recount()
+        return int(self._state_counts[state])
+
+    @property
+    def state_counts(self):
+        """Arreglo con el número de personas en cada estado"""
+        if not self._counts_valid:
+            self.recount()
+        return self._state_counts.copy()
+
+    @property
+    def treated(self):
+        """Número de personas en tratamiento"""
+        if not self._counts_valid:
+            self.recount()
+        return self._treated
+
+    def indices(self, state):
+        """Índices ordenados de las personas en el estado dado
+
+        Con track_indices el costo es proporcional al número de personas en
+        ese estado; sin él se recorre la columna de estado.
+        """
+        if not self.track_indices:
+            return np.flatnonzero(self.columns[6] == state)
+        if not self._counts_valid:
+            self.recount()
+        return np.sort(self._members[state, : self._state_counts[state]])
+
+    def set_state(self, rows, new_state):
+        """Cambia el estado de las filas dadas actualizando los conteos
+
+        Keyword arguments
+        -----------------
+        rows : ndarray
+            índices (sin repetir) de las personas que cambian de estado
+
+        new_state : int
+            estado nuevo
+        """
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        if len(rows) == 0:
+            return
+        if not self._counts_valid:
+            self.recount()
+
+        old_states = self.columns[6][rows]
+        if self.track_indices:
+            for s in np.unique(old_states):
+                leaving = rows[old_states == s]
+                self._remove_members(s, leaving)
+                self._state_counts[s] -= len(leaving)
+            self._add_members(new_state, rows)
+        else:
+            self._state_counts -= np.bincount(old_states, minlength=N_STATES)
+        self._state_counts[new_state] += len(rows)
+        self.columns[6][rows] = new_state
+
+    def set_treatment(self, rows, value):
+        """Marca (1) o desmarca (0) en tratamiento a las filas dadas"""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        if len(rows) == 0:
+            return
+        if not self._counts_valid:
+            self.recount()
+
+        self._treated += int(value == 1) * len(rows) - int(
+            np.count_nonzero(self.columns[10][rows] == 1)
+        )
+        self.columns[10][rows] = value
+
+    def _remove_members(self, state, rows):
+        # borrado por intercambio: los huecos que quedan antes del nuevo final
+        # se llenan con los miembros del final que no se borran
+        members = self._members[state]
+        count = self._state_counts[state]
+        new_count = count - len(rows)
+
+        removed = np.zeros(count - new_count, dtype=bool)
+        positions = self._position[rows]
+        tail = positions >= new_count
+        removed[positions[tail] - new_count] = True
+
+        holes = positions[~tail]
+        movers = members[new_count:count][~removed]
+        members[holes] = movers
+        self._position[movers] = holes
+
+    def _add_members(self, state, rows):
+        count = self._state_counts[state]
+        self._members[state, count : count + len(rows)] = rows
+        self._position[rows] = np.arange(count, count + len(rows))
+
+    @property
+    def shape(self):
+        return (len(self.columns[0]), len(self.columns))
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def nbytes(self):
+        return sum(col.nbytes for col in self.columns)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def copy(self):
+        population = Population(0, self.float_dtype, self.track_indices)
+        population.columns = [col.copy() for col in self.columns]
+        population.recount()
+        return population
+
+    def as_matrix(self, rows=slice(None), cols=slice(None)):
+        """Vista de compatibilidad: matriz float64 con las filas y columnas pedidas"""
+        selected = range(len(self.columns))[cols]
+        return np.column_stack(
+            [self.columns[c][rows].astype(np.float64, copy=False) for c in selected]
+        )
+
+    def __array__(self, dtype=None, copy=None):
+        matrix = self.as_matrix()
+        return matrix if dtype is None else matrix.astype(dtype, copy=False)
+
+    def _split_key(self, key):
+        if isinstance(key, tuple) and len(key) == 2:
+            return key
+        return key, slice(None)
+
+    def __getitem__(self, key):
+        rows, cols = self._split_key(key)
+
+        if isinstance(cols, (int, np.integer)):
+            column = self.columns[cols]
+            if isinstance(rows, slice) and rows == slice(None):
+                # la columna completa es el propio arreglo, se puede escribir en él
+                return column
+            return column[rows]
+
+        if isinstance(rows, (int, np.integer)):
+            # una sola fila, como en la matriz original, también con índice negativo
+            row = range(len(self))[rows]
+            return self.as_matrix(slice(row, row + 1), cols)[0]
+        return self.as_matrix(rows, cols)
+
+    def __setitem__(self, key, value):
+        rows, cols = self._split_key(key)
+
+        if isinstance(cols, (int, np.integer)):
+            self.columns[cols][rows] = value
+            self._column_written(cols)
+            return
+
+        selected = range(len(self.columns))[cols]
+        value = np.asarray(value)
+        for k, c in enumerate(selected):
+            if value.ndim == 0:
+                self.columns[c][rows] = value
+            else:
+                self.columns[c][rows] = value[..., k]
+            self._column_written(c)
+
+
+def set_state(population, rows, new_state):
+    """Cambia el estado de las filas dadas
+
+    Con un almacén Population los conteos por estado se actualizan en
+    O(cambios); con una matriz se escribe directamente la columna 6.
+    """
+    if isinstance(population, Population):
+        population.set_state(rows, new_state)
+    else:
+        population[rows, 6] = new_state
+
+
+def set_treatment(population, rows, value):
+    """Marca o desmarca en tratamiento (columna 10) a las filas dadas"""
+    if isinstance(population, Population):
+        population.set_treatment(rows, value)
+    else:
+        population[rows, 10] = value
+
+
+def count_state(population, state):
+    """Número de personas en el estado dado"""
+    if isinstance(population, Population):
+        return population.count(state)
+    return int(np.count_nonzero(population[:, 6] == state))
+
+
+def count_treated(population):
+    """Número de personas en tratamiento"""
+    if isinstance(population, Population):
+        return population.treated
+    return int(np.count_nonzero(population[:, 10] == 1))
+
+
+def state_indices(population, state):
+    """Índices ordenados de las personas en el estado dado"""
+    if isinstance(population, Population):
+        return population.indices(state)
+    return np.flatnonzero(population[:, 6] == state)
+
 
 def initialize_population(
-    Config, mean_age=45, max_age=105, xbounds=[0, 1], ybounds=[0, 1]
+    Config,
+    mean_age=45,
+    max_age=105,
+    xbounds=[0, 1],
+    ybounds=[0, 1],
+    rng=None,
 ):
     """Inicializa la poblacion para la simulación
 
-    La matriz de poblacion para esta simulación contiene las siguientes columnas:
+    La poblacion para esta simulación es un almacén columnar (Population) que
+    se indexa como una matriz con las siguientes columnas:
 
     0 : ID Unico
     1 : Coordenada X actual
@@ -50,40 +390,46 @@ def initialize_population(
 
     ybounds : 2d array
         Limites del eje Y
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
-    # Inicializa la matriz de población
-    population = np.zeros((Config.pop_size, 15))
+    # Inicializa el almacén columnar de la población
+    population = Population(
+        Config.pop_size, Config.population_float_dtype, Config.track_state_indices
+    )
 
     # Inicializa los Ids unicos
-    population[:, 0] = [x for x in range(Config.pop_size)]
+    population[:, 0] = np.arange(Config.pop_size)
 
     # Inicializa coordenadas aleatorias
-    population[:, 1] = np.random.uniform(
+    population[:, 1] = rng.uniform(
         low=xbounds[0] + 0.05, high=xbounds[1] - 0.05, size=(Config.pop_size,)
     )
-    population[:, 2] = np.random.uniform(
+    population[:, 2] = rng.uniform(
         low=ybounds[0] + 0.05, high=ybounds[1] - 0.05, size=(Config.pop_size,)
     )
 
     # Inicializa la direccion de -1 a 1
-    population[:, 3] = np.random.normal(loc=0, scale=1 / 3, size=(Config.pop_size,))
-    population[:, 4] = np.random.normal(loc=0, scale=1 / 3, size=(Config.pop_size,))
+    population[:, 3] = rng.normal(loc=0, scale=1 / 3, size=(Config.pop_size,))
+    population[:, 4] = rng.normal(loc=0, scale=1 / 3, size=(Config.pop_size,))
 
     # Inicializa la velocidad de la población
-    population[:, 5] = np.random.normal(Config.speed, Config.speed / 3)
+    population[:, 5] = rng.normal(Config.speed, Config.speed / 3)
 
     # Inicializa las edades de la población
     std_age = (max_age - mean_age) / 3
     population[:, 7] = np.int32(
-        np.random.normal(loc=mean_age, scale=std_age, size=(Config.pop_size,))
+        rng.normal(loc=mean_age, scale=std_age, size=(Config.pop_size,))
     )
 
     population[:, 7] = np.clip(
         population[:, 7], a_min=0, a_max=max_age
     )  # La edad minima no puede estar por debajo de 0
 
-    population[:, 9] = np.random.normal(loc=0.5, scale=0.5 / 3, size=(Config.pop_size,))
+    population[:, 9] = rng.normal(loc=0.5, scale=0.5 / 3, size=(Config.pop_size,))
 
     return population
 
@@ -108,7 +454,15 @@ def initialize_destination_matrix(pop_size, total_destinations):
 
 
 def set_destination_bounds(
-    population, destinations, xmin, ymin, xmax, ymax, dest_no=1, teleport=True
+    population,
+    destinations,
+    xmin,
+    ymin,
+    xmax,
+    ymax,
+    dest_no=1,
+    teleport=True,
+    rng=None,
 ):
     """Todas las personas deben estar dentro de los limites
 
@@ -130,12 +484,16 @@ def set_destination_bounds(
 
     teleport : bool
         Si se debe teletransportar inmediatamente
+
+    rng : numpy.random.Generator
+        generador de números aleatorios, por defecto el de random_streams
     """
+    rng = get_rng(rng)
 
     # Teletransporte
     if teleport:
-        population[:, 1] = np.random.uniform(low=xmin, high=xmax, size=len(population))
-        population[:, 2] = np.random.uniform(low=ymin, high=ymax, size=len(population))
+        population[:, 1] = rng.uniform(low=xmin, high=xmax, size=len(population))
+        population[:, 2] = rng.uniform(low=ymin, high=ymax, size=len(population))
 
     # Obtener paramrtros
     x_center, y_center, x_wander, y_wander = get_motion_parameters(
@@ -197,6 +555,10 @@ def save_population(population, tstep=0, folder="data_tstep"):
     np.save("%s/population_%i.npy" % (folder, tstep), population)
 
 
+# series de Population_trackers que se guardan y se agregan
+TRACKER_SERIES = ("susceptible", "infectious", "recovered", "fatalities")
+
+
 class Population_trackers:
     """ Clase para rastrar los parametros de la población
 
@@ -215,9 +577,9 @@ class Population_trackers:
 
     def update_counts(self, population):
         pop_size = population.shape[0]
-        self.infectious.append(len(population[population[:, 6] == 1]))
-        self.recovered.append(len(population[population[:, 6] == 2]))
-        self.fatalities.append(len(population[population[:, 6] == 3]))
+        self.infectious.append(count_state(population, 1))
+        self.recovered.append(count_state(population, 2))
+        self.fatalities.append(count_state(population, 3))
 
         if self.reinfect:
             self.susceptible.append(
@@ -0,0 +1,112 @@
+"""
+contiene los generadores de números aleatorios de la simulación:
+flujos PCG64 con semilla, flujos independientes derivados para procesos
+paralelos y bloques de números pre-generados por paso
+"""
+
+import numpy as np
+
+# generador usado por las funciones cuando no reciben uno propio
+DEFAULT_RNG = np.random.default_rng()
+
+
+def get_rng(rng=None):
+    """Devuelve rng, o el generador por defecto si es None"""
+    return DEFAULT_RNG if rng is None else rng
+
+
+def make_rng(seed=None):
+    """Crea un generador PCG64 y su SeedSequence a partir de una semilla
+
+    Retorna (generador, seed_sequence); la SeedSequence permite derivar
+    después flujos independientes con spawn_rngs.
+    """
+    seed_sequence = (
+        seed
+        if isinstance(seed, np.random.SeedSequence)
+        else np.random.SeedSequence(seed)
+    )
+    return np.random.Generator(np.random.PCG64(seed_sequence)), seed_sequence
+
+
+def spawn_rngs(seed_sequence, n):
+    """Deriva n generadores estadísticamente independientes
+
+    Útil para procesos paralelos o zonas espaciales que necesitan su propio
+    flujo sin compartir el del generador principal.
+    """
+    return [np.random.Generator(np.random.PCG64(s)) for s in seed_sequence.spawn(n)]
+
+
+class RandomBlock:
+    """Bloque de números aleatorios pre-generados
+
+    Genera de una vez bloques de uniformes y normales estándar y los
+    entrega por tramos. Expone random, uniform y normal con la misma firma
+    que numpy.random.Generator, así que puede pasarse como rng a las
+    funciones de la simulación. refill vuelve a llenar el bloque, por
+    ejemplo al comienzo de cada paso.
+
+    Keyword arguments
+    -----------------
+    rng : numpy.random.Generator
+        generador del que se sacan los bloques
+
+    block_size : int
+        cantidad de uniformes y de normales de cada bloque
+    """
+
+    def __init__(self, rng, block_size):
+        self.rng = rng
+        self.block_size = int(block_size)
+        self.refill()
+
+    def refill(self, block_size=None):
+        """Genera un bloque nuevo de uniformes y normales"""
+        if block_size is not None:
+            self.block_size = int(block_size)
+        self._uniforms = self.rng.random(self.block_size)
+        self._normals = self.rng.standard_normal(self.block_size)
+        self._next_uniform = 0
+        self._next_normal = 0
+
+    def _take_uniforms(self, n):
+        if self._next_uniform + n > len(self._uniforms):
+            self._uniforms = self.rng.random(max(self.block_size, n))
+            self._next_uniform = 0
+        values = self._uniforms[self._next_uniform : self._next_uniform + n]
+        self._next_uniform += n
+        return values
+
+    def _take_normals(self, n):
+        if self._next_normal + n > len(self._normals):
+            self._normals = self.rng.standard_normal(max(self.block_size, n))
+            self._next_normal = 0
+        values = self._normals[self._next_normal : self._next_normal + n]
+        self._next_normal += n
+        return values
+
+    def random(self, size=None):
+        n = 1 if size is None else int(np.prod(size))
+        values = self._take_uniforms(n)
+        return values[0] if size is None else values.reshape(size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.random(size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        n = 1 if size is None else int(np.prod(size))
+        values = self._take_normals(n)
+        values = values[0] if size is None else values.reshape(size)
+        return loc + scale * values
+
+    def binomial(self, n, p, size=None):
+        # sorteos poco frecuentes, se delegan al generador
+        return self.rng.binomial(n, p, size)
+
+    def choice(self, a, size=None, replace=True, shuffle=True):
+        return self.rng.choice(a, size=size, replace=replace, shuffle=shuffle)
+
+    def spawn(self, n):
+        """Flujos independientes derivados del generador del bloque"""
+        return self.rng.spawn(n)
@@ -0,0 +1,228 @@
+"""
+contiene el dibujado de videos fuera de línea: lee las instantáneas y las
+series guardadas en un almacén de snapshot_store, dibuja los cuadros en un
+grupo de procesos con el backend Agg y los une en una animación
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from async_writer import save_figure
+from config import Configuration, config_error
+from population import TRACKER_SERIES
+from ensemble import map_tasks
+from snapshot_store import SnapshotReader
+
+# columnas del almacén que se necesitan para dibujar
+RENDER_COLUMNS = ("x", "y", "state")
+
+
+class _SeriesView:
+    # series de Population_trackers hasta un paso, como las lee LiveRenderer
+    def __init__(self, series, frame):
+        empty = np.zeros(0, dtype=np.int64)
+        for name in TRACKER_SERIES:
+            setattr(self, name, series.get(name, empty)[: frame + 1])
+
+
+def use_agg_backend():
+    """Inicializador de los procesos de dibujo: sin ventana, Agg dibuja en memoria"""
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend("Agg")
+
+
+def frame_file(folder, index):
+    return os.path.join(folder, "%06i.png" % index)
+
+
+def render_frames(task):
+    """Dibuja un tramo de cuadros consecutivos en este proceso
+
+    El backend no se cambia aquí: en los procesos del grupo lo fija
+    use_agg_backend, y en el proceso actual (processes=1) se dibuja fuera de
+    pantalla con el backend que ya tenga.
+
+    Keyword arguments
+    -----------------
+    task : tuple
+        (carpeta del almacén, argumentos de Configuration, carpeta de
+        cuadros, lista de (número de cuadro, paso))
+    """
+
+    import matplotlib.pyplot as plt
+
+    from visualiser import LiveRenderer
+
+    store_path, config_kwargs, folder, frames = task
+    reader = SnapshotReader(store_path)
+    Config = Configuration(**config_kwargs)
+    Config.pop_size = reader.pop_size
+    Config.render_every = 1
+    Config.save_plot = False
+
+    try:
+        series = reader.series()
+    except FileNotFoundError:
+        series = {}
+
+    # un tramo consecutivo se lee del almacén de una sola vez
+    steps, data = reader.read(RENDER_COLUMNS, frames[0][1], frames[-1][1] + 1)
+    population = np.zeros((reader.pop_size, 7))
+
+    renderer = LiveRenderer(Config, show=False)
+    for index, frame in frames:
+        row = int(np.searchsorted(steps, frame))
+        population[:, 1] = data["x"][row]
+        population[:, 2] = data["y"][row]
+        population[:, 6] = data["state"][row]
+        renderer.draw_tstep(population, _SeriesView(series, frame), frame)
+        save_figure(renderer.fig, frame_file(folder, index), redraw=not renderer.blit)
+
+    plt.close(renderer.fig)
+    return len(frames)
+
+
+def _write_gif(folder, count, output, fps):
+    # encabezado, un bloque por cuadro con su propia paleta y el cierre,
+    # con las utilidades de GifImagePlugin para escribir GIF por partes
+    from PIL import GifImagePlugin, Image
+
+    duration = int(1000 / fps)
+    with open(output, "wb") as f:
+        for k in range(count):
+            with Image.open(frame_file(folder, k)) as image:
+                frame = image.convert("RGB").quantize()
+            if k == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0})
+                f.write(b"".join(header))
+            f.write(
+                b"".join(
+                    GifImagePlugin.getdata(
+                        frame, duration=duration, include_color_table=True
+                    )
+                )
+            )
+        f.write(b";")
+    return output
+
+
+def stitch_frames(folder, count, output, fps=30):
+    """Une los cuadros 000000.png, 000001.png, ... de folder en output
+
+    Los .gif se arman con Pillow cuadro por cuadro, sin cargar todos los
+    cuadros en memoria; los demás formatos (por ejemplo .mp4) necesitan
+    ffmpeg, que también los lee de a uno desde el disco.
+    """
+
+    if output.lower().endswith(".gif"):
+        return _write_gif(folder, count, output, fps)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise config_error("ffmpeg no está instalado, use un archivo .gif")
+    subprocess.run(
+        [
+            ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-framerate",
+            str(fps),
+            "-i",
+            os.path.join(folder, "%06d.png"),
+            # los códecs de video necesitan ancho y alto pares
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt",
+            "yuv420p",
+            output,
+        ],
+        check=True,
+    )
+    return output
+
+
+def render_video(
+    store_path,
+    output,
+    fps=30,
+    every=1,
+    start=None,
+    stop=None,
+    processes=None,
+    frames_folder=None,
+    **config_kwargs
+):
+    """Dibuja un video a partir de un almacén de instantáneas
+
+    La simulación puede correr en modo headless con save_pop activo y el
+    video se dibuja después, repartiendo los cuadros entre los núcleos.
+
+    Keyword arguments
+    -----------------
+    store_path : str
+        carpeta del almacén (Config.save_pop_folder)
+
+    output : str
+        archivo de salida, .gif o un formato de ffmpeg como .mp4
+
+    fps : int
+        cuadros por segundo del video
+
+    every : int
+        se dibuja una de cada every instantáneas guardadas
+
+    start, stop : int
+        rango de pasos de simulación a dibujar
+
+    processes : int
+        número de procesos, por defecto los núcleos disponibles
+
+    frames_folder : str
+        carpeta donde se dejan los cuadros, por defecto una temporal que se
+        borra al terminar
+
+    **config_kwargs
+        argumentos de Configuration de la simulación (límites del plot,
+        estilo, aislamiento, ...) para que los cuadros se vean como en vivo
+    """
+
+    reader = SnapshotReader(store_path)
+    steps = reader.frames
+    if start is not None:
+        steps = steps[steps >= start]
+    if stop is not None:
+        steps = steps[steps < stop]
+    steps = steps[::every]
+    if len(steps) == 0:
+        raise config_error("no hay instantáneas en el rango pedido")
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    # varios tramos por proceso para repartir mejor la carga
+    batches = np.array_split(
+        np.arange(len(steps)), min(len(steps), max(1, processes) * 4)
+    )
+
+    folder = frames_folder or tempfile.mkdtemp(prefix="frames_")
+    os.makedirs(folder, exist_ok=True)
+    try:
+        tasks = [
+            (
+                store_path,
+                config_kwargs,
+                folder,
+                [(int(k), int(steps[k])) for k in batch],
+            )
+            for batch in batches
+        ]
+        map_tasks(render_frames, tasks, processes, initializer=use_agg_backend)
+        return stitch_frames(folder, len(steps), output, fps)
+    finally:
+        if frames_folder is None:
+            shutil.rmtree(folder, ignore_errors=True)
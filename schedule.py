@@ -0,0 +1,194 @@
+"""
+contiene el horario diario de la población: en qué momento del día cada
+persona cambia de destino activo (por ejemplo de la casa al trabajo)
+"""
+
+import numpy as np
+
+from config import config_error
+from motion import get_motion_parameters
+
+
+class Schedule:
+    """Itinerarios diarios de la población
+
+    Cada evento es (momento del día, persona, destino). Los eventos se
+    guardan ordenados por momento del día, con un arreglo de desplazamientos
+    que da el tramo de cada momento, así que apply solo toca a las personas
+    que cambian de destino en ese paso y no recorre toda la población.
+
+    Los destinos son las parejas de columnas de la matriz de destinos de la
+    simulación (initialize_destination_matrix); el destino 0 deja a la
+    persona libre. El destino 1 es el que usan el autoaislamiento y
+    set_destination_bounds, conviene usar desde el 2 para el horario.
+
+    Keyword arguments
+    -----------------
+    pop_size : int
+        tamaño de la población
+
+    total_destinations : int
+        número de destinos de la matriz de destinos
+
+    day_length : int
+        pasos de simulación que dura un día, debe coincidir con
+        Config.day_length de la simulación (ver from_config)
+    """
+
+    def __init__(self, pop_size, total_destinations, day_length=100):
+        self.pop_size = pop_size
+        self.total_destinations = total_destinations
+        self.day_length = day_length
+
+        # rango de recorrido de cada persona en cada destino, como la matriz de destinos
+        self.wander = np.zeros((pop_size, total_destinations * 2))
+
+        self._pending = []
+        self.times = np.zeros(0, dtype=np.int32)
+        self.agents = np.zeros(0, dtype=np.int32)
+        self.dests = np.zeros(0, dtype=np.int16)
+        self.offsets = np.zeros(day_length + 1, dtype=np.int64)
+
+    @classmethod
+    def from_config(cls, Config):
+        """Horario con el tamaño, los destinos y el largo del día de Config"""
+        return cls(Config.pop_size, Config.total_destinations, Config.day_length)
+
+    def __len__(self):
+        self._compile()
+        return len(self.agents)
+
+    def _check_destination(self, dest_no, first=0):
+        # first=0 en los eventos, donde 0 deja a la persona libre
+        dest_no = np.asarray(dest_no)
+        if np.any(dest_no < first) or np.any(dest_no > self.total_destinations):
+            raise config_error(
+                "destino fuera de rango, el horario tiene %i destinos"
+                % self.total_destinations
+            )
+
+    def set_location(self, destinations, ids, dest_no, bounds):
+        """Define dónde queda un destino para un grupo de personas
+
+        Keyword arguments
+        -----------------
+        destinations : ndarray
+            matriz de destinos de la simulación
+
+        ids : ndarray
+            índices de las personas
+
+        dest_no : int
+            número del destino (desde 1)
+
+        bounds : list or ndarray
+            límites [xmin, ymin, xmax, ymax] comunes, o arreglo (len(ids), 4)
+            con los límites de cada persona (por ejemplo una casa por persona)
+        """
+
+        # el destino 0 no tiene ubicación, sería la columna -2 (el último)
+        self._check_destination(dest_no, first=1)
+        ids = np.asarray(ids, dtype=np.intp)
+        bounds = np.asarray(bounds, dtype=np.float64)
+        x_center, y_center, x_wander, y_wander = get_motion_parameters(
+            bounds[..., 0], bounds[..., 1], bounds[..., 2], bounds[..., 3]
+        )
+
+        column = (dest_no - 1) * 2
+        destinations[ids, column] = x_center
+        destinations[ids, column + 1] = y_center
+        self.wander[ids, column] = x_wander
+        self.wander[ids, column + 1] = y_wander
+
+    def add_events(self, ids, time_of_day, dest_no):
+        """Agrega eventos de cambio de destino
+
+        Keyword arguments
+        -----------------
+        ids : ndarray
+            índices de las personas
+
+        time_of_day : int or ndarray
+            paso del día (0 a day_length - 1) del cambio, común o por persona
+
+        dest_no : int or ndarray
+            destino que se activa, 0 para quedar libre, común o por persona
+        """
+
+        self._check_destination(dest_no)
+        ids = np.asarray(ids, dtype=np.int32)
+        times = np.broadcast_to(np.asarray(time_of_day) % self.day_length, ids.shape)
+        dests = np.broadcast_to(dest_no, ids.shape)
+        self._pending.append((times.astype(np.int32), ids, dests.astype(np.int16)))
+
+    def commute(
+        self,
+        destinations,
+        ids,
+        home_no,
+        work_no,
+        home_bounds,
+        work_bounds,
+        leave_home,
+        leave_work,
+    ):
+        """Ida y vuelta diaria entre la casa y el trabajo
+
+        Define los dos destinos con set_location y agrega los eventos de
+        salida de cada uno; leave_home y leave_work pueden ser comunes o por
+        persona.
+        """
+
+        self.set_location(destinations, ids, home_no, home_bounds)
+        self.set_location(destinations, ids, work_no, work_bounds)
+        self.add_events(ids, leave_home, work_no)
+        self.add_events(ids, leave_work, home_no)
+
+    def _compile(self):
+        # une los eventos pendientes y los ordena por momento del día
+        if len(self._pending) == 0:
+            return
+
+        times = np.concatenate([self.times] + [p[0] for p in self._pending])
+        agents = np.concatenate([self.agents] + [p[1] for p in self._pending])
+        dests = np.concatenate([self.dests] + [p[2] for p in self._pending])
+        self._pending = []
+
+        # orden estable: para una misma persona y momento gana el último evento
+        order = np.argsort(times, kind="stable")
+        self.times = times[order]
+        self.agents = agents[order]
+        self.dests = dests[order]
+        self.offsets = np.searchsorted(self.times, np.arange(self.day_length + 1))
+
+    def due(self, frame):
+        """Personas y destinos de los eventos del paso frame"""
+        self._compile()
+        t = frame % self.day_length
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return self.agents[start:end], self.dests[start:end]
+
+    def apply(self, population, frame):
+        """Activa los destinos de los eventos del paso frame
+
+        Las personas fallecidas o en tratamiento no siguen el horario.
+        """
+
+        agents, dests = self.due(frame)
+        if len(agents) == 0:
+            return population
+
+        keep = (population[agents, 6] != 3) & (population[agents, 10] == 0)
+        agents = agents[keep]
+        dests = dests[keep]
+
+        population[:, 11][agents] = dests
+        population[:, 12][agents] = 0
+
+        # rango de recorrido del nuevo destino
+        going = dests > 0
+        column = (dests[going].astype(np.intp) - 1) * 2
+        population[:, 13][agents[going]] = self.wander[agents[going], column]
+        population[:, 14][agents[going]] = self.wander[agents[going], column + 1]
+
+        return population
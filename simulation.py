@@ -1,20 +1,31 @@
+import copy
 import os
 import sys
+import time
 
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
+from async_writer import BackgroundWriter
+from checkpoint import Checkpoint, isolate_fork, load_checkpoint, variant_scenario
 from config import Configuration, config_error
+from event_log import (
+    ADMITTED,
+    DIED,
+    INFECTED,
+    ISOLATED,
+    RECOVERED,
+    SEEDED,
+    EventLog,
+)
+from instrumentation import make_instruments
 from infection import (
     infect,
     recover_or_die,
 )
-from motion import (
-    update_positions,
-    out_of_bounds,
-    update_randoms,
-)
+from jit_kernels import resolve_tick_backend, update_motion_jit
+from motion import update_motion
 from path_planning import (
     set_destination,
     check_at_destination,
@@ -26,8 +37,14 @@ from population import (
     save_data,
     save_population,
     Population_trackers,
+    count_state,
+    count_treated,
+    set_state,
+    set_treatment,
 )
-from visualiser import build_fig, draw_tstep, plot_sir
+from random_streams import RandomBlock, make_rng, spawn_rngs
+from snapshot_store import SnapshotStore
+from visualiser import LiveRenderer, plot_sir
 
 
 class Simulation:
@@ -36,13 +53,60 @@ class Simulation:
         self.Config = Configuration(*args, **kwargs)
         self.frame = 0
 
+        # Generador aleatorio propio (PCG64) a partir de Config.seed
+        self.rng, self.seed_sequence = make_rng(self.Config.seed)
+        self.Config.rng = self.rng
+        self.tick_backend = resolve_tick_backend(self.Config.tick_backend)
+        self.random_block = None
+        if self.Config.random_block_size > 0:
+            self.random_block = RandomBlock(self.rng, self.Config.random_block_size)
+
         # Inicializarla poblacion por defecto
         self.population_init()
 
         self.pop_tracker = Population_trackers()
 
         # Inicializar los vectores de destino
-        self.destinations = initialize_destination_matrix(self.Config.pop_size, 1)
+        self.destinations = initialize_destination_matrix(
+            self.Config.pop_size, self.Config.total_destinations
+        )
+
+        # horario diario opcional, ver set_schedule
+        self.schedule = None
+
+        # visualización en vivo, se crea en el primer paso visualizado
+        self.renderer = None
+
+        # almacén de instantáneas, se abre con la primera que se guarda; una
+        # simulación nueva empieza un almacén nuevo, una restaurada lo continúa
+        self.pop_store = None
+        self.resume_store = False
+
+        # escritor en segundo plano, se crea con la primera escritura
+        self.writer = None
+
+        # tiempos por etapa y contadores, vacíos salvo con Config.instrument
+        self.instruments = make_instruments(self.Config.instrument)
+
+        # registro de eventos (contagios, ingresos, recuperaciones, muertes)
+        self.events = None
+        if self.Config.event_log:
+            self.events = EventLog(
+                self.Config.event_log_path, self.Config.event_log_chunk
+            )
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint, mmap=True):
+        """Crea una simulación a partir de un punto de control
+
+        checkpoint es un Checkpoint o la carpeta de uno; no se inicializa una
+        población nueva.
+        """
+        sim = cls.__new__(cls)
+        sim.pop_store = None
+        sim.writer = None
+        sim.events = None
+        return sim.restore(checkpoint, mmap=mmap)
 
     def population_init(self):
         """Re-Inicializa la poblacion"""
@@ -52,58 +116,151 @@ class Simulation:
             self.Config.max_age,
             self.Config.xbounds,
             self.Config.ybounds,
+            rng=self.rng,
         )
 
+    def set_schedule(self, schedule):
+        """Activa un horario diario (schedule.Schedule) para la población"""
+        if schedule is not None and (
+            schedule.pop_size != self.Config.pop_size
+            or schedule.total_destinations * 2 != self.destinations.shape[1]
+        ):
+            raise config_error(
+                "el horario no coincide con la población o la matriz de destinos"
+            )
+        if schedule is not None and schedule.day_length != self.Config.day_length:
+            raise config_error(
+                "el horario dura %i pasos por día y Config.day_length %i"
+                % (schedule.day_length, self.Config.day_length)
+            )
+        self.schedule = schedule
+
+    def checkpoint(self, path=None):
+        """Punto de control con el estado actual de la simulación
+
+        Si se entrega path se escribe además en esa carpeta, desde donde
+        restore y from_checkpoint lo abren con memoria mapeada.
+        """
+        checkpoint = Checkpoint.capture(self)
+        if path is not None:
+            checkpoint.save(path)
+        return checkpoint
+
+    def restore(self, checkpoint, mmap=True):
+        """Vuelve al estado de un punto de control (Checkpoint o carpeta)
+
+        Antes se cierran el almacén de instantáneas, el escritor en segundo
+        plano y el registro de eventos de la ejecución actual, con sus
+        escrituras pendientes.
+        """
+        self.close_store()
+        self.close_writer()
+        if self.events is not None:
+            self.events.close()
+        load_checkpoint(checkpoint, mmap=mmap).restore(self)
+        self.tick_backend = resolve_tick_backend(self.Config.tick_backend)
+        self.renderer = None
+        self.resume_store = True
+        self.instruments = make_instruments(self.Config.instrument)
+        return self
+
+    def fork(self, variants, checkpoint=None):
+        """Simulaciones de varias intervenciones desde un mismo punto de control
+
+        Keyword arguments
+        -----------------
+        variants : list
+            cada variante es None (sin intervención), el nombre de un
+            escenario de ensemble.SCENARIOS ('lockdown', 'self_isolation',
+            'reduced_interaction') o una tupla (escenario, argumentos)
+
+        checkpoint : Checkpoint or str
+            punto de control de partida, por defecto el estado actual
+
+        Las variantes parten del mismo estado aleatorio y no reinician la
+        población; cada una guarda sus salidas aparte (ver
+        checkpoint.isolate_fork). Retorna una simulación por variante.
+        """
+
+        # importación local: ensemble importa simulation al construir réplicas
+        from ensemble import apply_scenario
+
+        if checkpoint is None:
+            checkpoint = self.checkpoint()
+        checkpoint = load_checkpoint(checkpoint)
+
+        forks = []
+        for k, variant in enumerate(variants):
+            sim = isolate_fork(type(self).from_checkpoint(checkpoint), k)
+            scenario, scenario_kwargs = variant_scenario(variant)
+            apply_scenario(sim, scenario, scenario_kwargs, reinitialize=False)
+            forks.append(sim)
+        return forks
+
+    def set_instrumentation(self, enabled=True):
+        """Activa o desactiva la medición de etapas y contadores de tstep"""
+        self.Config.instrument = enabled
+        if enabled != self.instruments.enabled:
+            self.instruments = make_instruments(enabled)
+        return self.instruments
+
+    def spawn_rngs(self, n):
+        """Generadores independientes derivados de la semilla de la simulación"""
+        return spawn_rngs(self.seed_sequence, n)
+
     def tstep(self):
         """
         Toma un instante de tiempo en la simulación
         """
 
-        if self.frame == 0 and self.Config.visualise:
-            # Mostrar ventana
-            self.fig, self.spec, self.ax1, self.ax2 = build_fig(self.Config)
+        if self.renderer is None and self.Config.visualise and not self.Config.headless:
+            # Mostrar ventana, fuera de la medición del paso
+            self.renderer = LiveRenderer(self.Config)
+
+        instruments = self.instruments
+        instruments.start_tick()
+
+        # números aleatorios del paso: bloque pre-generado o el generador directo
+        if self.random_block is not None:
+            self.random_block.refill()
+            rng = self.random_block
+        else:
+            rng = self.rng
+        instruments.lap("randoms")
+
+        # Cambios de destino del horario en este paso
+        if self.schedule is not None:
+            self.schedule.apply(self.population, self.frame)
 
         # Verificar que el destino este activo
         # Definir vectores de movimiento
-        active_dests = len(self.population[self.population[:, 11] != 0])
+        active_dests = np.count_nonzero(self.population[:, 11] != 0)
 
-        if active_dests > 0 and len(self.population[self.population[:, 12] == 0]) > 0:
+        if active_dests > 0 and np.count_nonzero(self.population[:, 12] == 0) > 0:
             self.population = set_destination(self.population, self.destinations)
             self.population = check_at_destination(
                 self.population,
                 self.destinations,
                 wander_factor=self.Config.wander_factor_dest,
                 speed=self.Config.speed,
+                rng=rng,
             )
 
-        if active_dests > 0 and len(self.population[self.population[:, 12] == 1]) > 0:
+        if active_dests > 0 and np.count_nonzero(self.population[:, 12] == 1) > 0:
             self.population = keep_at_destination(
-                self.population, self.destinations, self.Config.wander_factor
-            )
-
-        # Fuera de limites
-        # Se definen arreglos de limites
-        if len(self.population[:, 11] == 0) > 0:
-            _xbounds = np.array(
-                [[self.Config.xbounds[0] + 0.02, self.Config.xbounds[1] - 0.02]]
-                * len(self.population[self.population[:, 11] == 0])
-            )
-            _ybounds = np.array(
-                [[self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02]]
-                * len(self.population[self.population[:, 11] == 0])
-            )
-            self.population[self.population[:, 11] == 0] = out_of_bounds(
-                self.population[self.population[:, 11] == 0], _xbounds, _ybounds
+                self.population, self.destinations, self.Config.wander_factor, rng=rng
             )
+        instruments.lap("destinations")
 
-        # Variables aleatorias
+        # Variables aleatorias: en el encierro no se sortean nuevas direcciones
+        randomize = True
         if self.Config.lockdown:
             if len(self.pop_tracker.infectious) == 0:
                 mx = 0
             else:
                 mx = np.max(self.pop_tracker.infectious)
 
-            if len(self.population[self.population[:, 6] == 1]) >= len(
+            if count_state(self.population, 1) >= len(
                 self.population
             ) * self.Config.lockdown_percentage or mx >= (
                 len(self.population) * self.Config.lockdown_percentage
@@ -114,135 +271,288 @@ class Simulation:
                 )
                 # Ajustar la velocidad a 0 para las personas que cumplen la condición
                 self.population[:, 5][self.Config.lockdown_vector == 0] = 0
-            else:
-                # Actualizar valores aleatorios
-                self.population = update_randoms(
-                    self.population, self.Config.pop_size, self.Config.speed
-                )
-        else:
-            # Actualizar valores aleatorios
-            self.population = update_randoms(
-                self.population, self.Config.pop_size, self.Config.speed
-            )
-
-        # Para estados (dead) pone la velocidad en 0
-        self.population[:, 3:5][self.population[:, 6] == 3] = 0
+                randomize = False
 
-        # Actualizar pocisiones
-        self.population = update_positions(self.population)
+        self.move(rng, randomize)
+        instruments.lap("motion")
 
         # Infectar
-        self.population, self.destinations = infect(
-            self.population,
-            self.Config,
-            self.frame,
-            send_to_location=self.Config.self_isolate,
-            location_bounds=self.Config.isolation_bounds,
-            destinations=self.destinations,
-            location_no=1,
-            location_odds=self.Config.self_isolate_proportion,
-        )
+        infections = self.infect_step(rng)
+        instruments.lap("infect")
 
         # Se decide el futuro de la persona
-        self.population = recover_or_die(self.population, self.frame, self.Config)
+        self.population, outcomes = recover_or_die(
+            self.population, self.frame, self.Config, return_outcomes=True, rng=rng
+        )
+        instruments.lap("recover_or_die")
 
-        # Envia los curados de vuelta a la población
-        self.population[:, 11][self.population[:, 6] == 2] = 0
+        if self.events is not None:
+            self.events.append(
+                self.frame, infections["infected"], INFECTED, infections["sources"]
+            )
+            self.events.append(self.frame, infections["admitted"], ADMITTED)
+            self.events.append(self.frame, infections["isolated"], ISOLATED)
+            self.events.append(self.frame, outcomes["recovered"], RECOVERED)
+            self.events.append(self.frame, outcomes["fatalities"], DIED)
+        instruments.lap("events")
+
+        # Envia los curados de vuelta a la población (sale del aislamiento, destino 1)
+        self.population[:, 11][
+            (self.population[:, 6] == 2) & (self.population[:, 11] == 1)
+        ] = 0
 
         # Actualiza las estadisticas de la población
         self.pop_tracker.update_counts(self.population)
+        instruments.lap("trackers")
 
         # Mostrar gráfico
-        if self.Config.visualise:
-            draw_tstep(
-                self.Config,
+        if self.Config.visualise and not self.Config.headless:
+            self.renderer.draw_tstep(
                 self.population,
                 self.pop_tracker,
                 self.frame,
-                self.fig,
-                self.spec,
-                self.ax1,
-                self.ax2,
+                writer=self.get_writer() if self.Config.save_plot else None,
             )
+        instruments.lap("render")
+
+        if instruments.enabled:
+            instruments.count("contacts", infections["contacts"])
+            instruments.count("infections", len(infections["infected"]))
+            instruments.count("admissions", len(infections["admitted"]))
+            instruments.count("recoveries", len(outcomes["recovered"]))
+            instruments.count("fatalities", len(outcomes["fatalities"]))
+            instruments.gauge("in_treatment", count_treated(self.population))
+            instruments.gauge("infectious", self.pop_tracker.infectious[-1])
+            instruments.lap("counters")
 
         # Reportes por consola
-        sys.stdout.write("\r")
-        sys.stdout.write(
-            "%i: Sanos: %i, Infectados: %i, Inmune: %i, En tratamiento: %i, \
+        if not self.Config.headless:
+            sys.stdout.write("\r")
+            sys.stdout.write(
+                "%i: Sanos: %i, Infectados: %i, Inmune: %i, En tratamiento: %i, \
 Fallecidos: %i, of Total: %i"
-            % (
-                self.frame,
-                self.pop_tracker.susceptible[-1],
-                self.pop_tracker.infectious[-1],
-                self.pop_tracker.recovered[-1],
-                len(self.population[self.population[:, 10] == 1]),
-                self.pop_tracker.fatalities[-1],
-                self.Config.pop_size,
+                % (
+                    self.frame,
+                    self.pop_tracker.susceptible[-1],
+                    self.pop_tracker.infectious[-1],
+                    self.pop_tracker.recovered[-1],
+                    count_treated(self.population),
+                    self.pop_tracker.fatalities[-1],
+                    self.Config.pop_size,
+                )
             )
-        )
+        instruments.lap("report")
 
         # Guardar informacion si se requiere
         if self.Config.save_pop and (self.frame % self.Config.save_pop_freq) == 0:
-            save_population(self.population, self.frame, self.Config.save_pop_folder)
+            self.save_snapshot()
+        instruments.lap("io")
         self.callback()
+        instruments.end_tick()
 
         # Actualizar frame
         self.frame += 1
 
+    def move(self, rng, randomize=True):
+        """Rebote en los límites, cambios aleatorios y avance de la población"""
+        if self.tick_backend == "numba":
+            # límites, valores aleatorios y posiciones en un solo kernel compilado
+            update_motion_jit(
+                self.population,
+                [self.Config.xbounds[0] + 0.02, self.Config.xbounds[1] - 0.02],
+                [self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02],
+                rng,
+                speed=self.Config.speed,
+                randomize=randomize,
+            )
+        else:
+            # límites, valores aleatorios y posiciones en una sola etapa
+            update_motion(
+                self.population,
+                [self.Config.xbounds[0] + 0.02, self.Config.xbounds[1] - 0.02],
+                [self.Config.ybounds[0] + 0.02, self.Config.ybounds[1] - 0.02],
+                speed=self.Config.speed,
+                randomize=randomize,
+                rng=rng,
+            )
+
+    def infect_step(self, rng):
+        """Sortea los contagios del paso y devuelve sus resultados (ver infect)"""
+        self.population, self.destinations, infections = infect(
+            self.population,
+            self.Config,
+            self.frame,
+            send_to_location=self.Config.self_isolate,
+            location_bounds=self.Config.isolation_bounds,
+            destinations=self.destinations,
+            location_no=1,
+            location_odds=self.Config.self_isolate_proportion,
+            return_outcomes=True,
+            rng=rng,
+        )
+        return infections
+
+    def save_snapshot(self):
+        """Guarda la población del paso actual en Config.save_pop_folder
+
+        Con Config.save_pop_format 'store' la instantánea se agrega al
+        almacén por bloques (snapshot_store); con 'npy' se escribe un
+        archivo por paso.
+        """
+        if self.Config.save_pop_format == "npy":
+            self.write(
+                save_population,
+                self.population.copy(),
+                self.frame,
+                self.Config.save_pop_folder,
+            )
+            return
+        if self.Config.save_pop_format != "store":
+            raise config_error(
+                "formato de guardado %s no reconocido, use 'store' o 'npy'"
+                % self.Config.save_pop_format
+            )
+
+        if self.pop_store is None:
+            self.pop_store = SnapshotStore(
+                self.Config.save_pop_folder,
+                self.Config.pop_size,
+                self.population.float_dtype,
+                chunk_size=self.Config.save_pop_chunk,
+                compress=self.Config.save_pop_compress,
+                resume=self.resume_store,
+            )
+            # los pasos guardados después del punto de control se reemplazan
+            self.pop_store.truncate(self.frame)
+            self.resume_store = True
+        self.write(self.pop_store.append, self.population.copy(), self.frame)
+
+    def get_writer(self):
+        """Escritor en segundo plano, None si Config.async_writes es falso"""
+        if self.writer is None and self.Config.async_writes:
+            self.writer = BackgroundWriter(self.Config.max_pending_writes)
+        return self.writer
+
+    def write(self, function, *args):
+        """Ejecuta una escritura en el escritor en segundo plano o aquí mismo
+
+        Los argumentos deben ser copias que la simulación no vuelve a
+        modificar.
+        """
+        writer = self.get_writer()
+        if writer is None:
+            function(*args)
+        else:
+            writer.submit(function, *args)
+
+    def close_store(self):
+        """Escribe las series y cierra el almacén de instantáneas"""
+        if self.pop_store is not None:
+            self.write(self.pop_store.write_series, copy.deepcopy(self.pop_tracker))
+            self.write(self.pop_store.close)
+            self.pop_store = None
+
+    def close_writer(self):
+        """Termina las escrituras pendientes y cierra el escritor"""
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
+
     def callback(self):
         if self.frame == 50:
-            print("\ninfecting patient zero")
-            self.population[0][6] = 1
-            self.population[0][8] = 50
-            self.population[0][10] = 1
+            if not self.Config.headless:
+                print("\ninfecting patient zero")
+            set_state(self.population, [0], 1)
+            self.population[0, 8] = 50
+            set_treatment(self.population, [0], 1)
+            if self.events is not None:
+                self.events.append(self.frame, [0], SEEDED)
+                self.events.append(self.frame, [0], ADMITTED)
+
+    def report_progress(self, start_time, start_frame):
+        """Escribe una línea de progreso, usado en el modo headless"""
+        elapsed = time.monotonic() - start_time
+        rate = (self.frame - start_frame) / elapsed if elapsed > 0 else 0.0
+        sys.stdout.write(
+            "%i: Infectados: %i, Inmune: %i, Fallecidos: %i (%.1f pasos/s)\n"
+            % (
+                self.frame,
+                self.pop_tracker.infectious[-1],
+                self.pop_tracker.recovered[-1],
+                self.pop_tracker.fatalities[-1],
+                rate,
+            )
+        )
+        sys.stdout.flush()
 
     def run(self):
-        """Correr Simulación"""
+        """Correr Simulación
+
+        Con Config.headless no se visualiza ni se escribe nada en cada paso;
+        si Config.progress_interval es mayor que cero se reporta el progreso
+        cada progress_interval segundos de reloj.
+        """
 
         i = 0
 
-        while i < self.Config.simulation_steps:
-            try:
-                self.tstep()
-            except KeyboardInterrupt:
-                print("\nCTRL-C caught, exiting")
-                sys.exit(1)
-
-            # Si no quedan personas infectadas
-            # Inicialmente sin infectados
-            if self.Config.endif_no_infections and self.frame >= 500:
-                if (
-                    len(
-                        self.population[
-                            (self.population[:, 6] == 1) | (self.population[:, 6] == 4)
-                        ]
-                    )
-                    == 0
-                ):
-                    i = self.Config.simulation_steps
-
-        if self.Config.save_data:
-            save_data(self.population, self.pop_tracker)
+        start_time = time.monotonic()
+        start_frame = self.frame
+        report_interval = self.Config.progress_interval if self.Config.headless else 0
+        next_report = start_time + report_interval
+
+        try:
+            while i < self.Config.simulation_steps:
+                try:
+                    self.tstep()
+                except KeyboardInterrupt:
+                    print("\nCTRL-C caught, exiting")
+                    sys.exit(1)
+                i += 1
+
+                if report_interval and time.monotonic() >= next_report:
+                    self.report_progress(start_time, start_frame)
+                    next_report = time.monotonic() + report_interval
+
+                # Si no quedan personas infectadas
+                # Inicialmente sin infectados
+                if self.Config.endif_no_infections and self.frame >= 500:
+                    if (
+                        count_state(self.population, 1)
+                        + count_state(self.population, 4)
+                        == 0
+                    ):
+                        i = self.Config.simulation_steps
+
+            self.close_store()
+
+            if self.Config.save_data:
+                self.write(
+                    save_data, self.population.copy(), copy.deepcopy(self.pop_tracker)
+                )
+        finally:
+            # también con CTRL-C: se terminan las escrituras y se vuelca el registro
+            self.close_store()
+            self.close_writer()
+            if self.events is not None:
+                self.events.close()
+
+        if self.Config.instrument_path:
+            self.instruments.export(self.Config.instrument_path)
+
+        if self.Config.headless:
+            return
 
         # Al finalizar la simulación, resumen.
         print("\n-----stopping-----\n")
         print("Instantes de tiempo simulados: %i" % self.frame)
-        print("Total fallecidos: %i" % len(self.population[self.population[:, 6] == 3]))
-        print(
-            "Total recuperados: %i" % len(self.population[self.population[:, 6] == 2])
-        )
-        print("Total infectados: %i" % len(self.population[self.population[:, 6] == 1]))
+        print("Total fallecidos: %i" % count_state(self.population, 3))
+        print("Total recuperados: %i" % count_state(self.population, 2))
+        print("Total infectados: %i" % count_state(self.population, 1))
         print(
             "Total infecciones: %i"
-            % len(
-                self.population[
-                    (self.population[:, 6] == 1) | (self.population[:, 6] == 4)
-                ]
-            )
-        )
-        print(
-            "Total NO infectados: %i" % len(self.population[self.population[:, 6] == 0])
+            % (count_state(self.population, 1) + count_state(self.population, 4))
         )
+        print("Total NO infectados: %i" % count_state(self.population, 0))
 
     def plot_sir(
         self, size=(6, 3), include_fatalities=False, title="S-I-R plot of simulation"
@@ -252,7 +562,7 @@ Fallecidos: %i, of Total: %i"
 
 if __name__ == "__main__":
     # initialize
-    sim = Simulation()
+    sim = Simulation(seed=None)  # un entero hace la simulación reproducible
 
     # ! Pasos en la simulación
     sim.Config.simulation_steps = 20000
@@ -0,0 +1,339 @@
+"""
+contiene el almacén de instantáneas de la población: un solo directorio con
+las instantáneas agrupadas en bloques (chunks) que se agregan a medida que
+corre la simulación, y un lector que las recorta por rango de pasos o por
+columna sin cargar todo el almacén
+"""
+
+import json
+import os
+
+import numpy as np
+
+from config import config_error
+from population import POPULATION_COLUMNS, TRACKER_SERIES, Population
+from utils import check_folder
+
+# archivos del almacén además de los bloques
+META_FILE = "meta.json"
+SERIES_FILE = "series.npz"
+
+
+def snapshot_dtype(pop_size, float_dtype=np.float64):
+    """Tipo de un registro del almacén: una columna de la población por campo
+
+    Cada campo es un arreglo de pop_size valores, así las columnas de una
+    instantánea quedan contiguas en el disco y se pueden leer por separado.
+    """
+    float_dtype = np.dtype(float_dtype)
+    return np.dtype(
+        [
+            (name, float_dtype if dtype is None else dtype, (pop_size,))
+            for name, dtype in POPULATION_COLUMNS
+        ]
+    )
+
+
+def _chunk_file(path, chunk_no, compress):
+    return os.path.join(
+        path, "chunk_%05i.%s" % (chunk_no, "npz" if compress else "npy")
+    )
+
+
+def _clear_store(path):
+    # borra solo los archivos del almacén, no el resto de la carpeta
+    for name in os.listdir(path):
+        if name in (META_FILE, SERIES_FILE) or (
+            name.startswith("chunk_") and name.endswith((".npy", ".npz"))
+        ):
+            os.remove(os.path.join(path, name))
+
+
+def _read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+class SnapshotStore:
+    """Almacén de instantáneas que se agrega paso a paso
+
+    Las instantáneas se agrupan en bloques de chunk_size registros. Sin
+    compresión cada bloque es un .npy preasignado que se abre con memoria
+    mapeada y se escribe en su lugar; con compresión el bloque se guarda en
+    memoria y se escribe como .npz comprimido al llenarse o al llamar a
+    flush. Los pasos guardados y el formato quedan en meta.json. Los pasos
+    deben ser crecientes. Si la carpeta ya tiene un almacén se borra, salvo
+    con resume, que agrega las instantáneas nuevas al final del existente.
+
+    Keyword arguments
+    -----------------
+    path : str
+        carpeta del almacén
+
+    pop_size : int
+        tamaño de la población
+
+    float_dtype : str or dtype
+        tipo de las columnas flotantes
+
+    chunk_size : int
+        instantáneas por bloque
+
+    compress : bool
+        si los bloques se comprimen
+
+    resume : bool
+        si se continúa el almacén existente en lugar de empezar uno nuevo,
+        por ejemplo al seguir una simulación desde un punto de control
+    """
+
+    def __init__(
+        self,
+        path,
+        pop_size,
+        float_dtype=np.float64,
+        chunk_size=64,
+        compress=False,
+        resume=False,
+    ):
+        self.path = path
+        check_folder(path)
+
+        exists = os.path.isfile(os.path.join(path, META_FILE))
+        if exists and not resume:
+            # una corrida nueva no se mezcla con la anterior
+            _clear_store(path)
+        elif exists:
+            # se continúa un almacén existente con su propio formato
+            meta = _read_meta(path)
+            if meta["pop_size"] != pop_size:
+                raise config_error(
+                    "el almacén %s es de una población de %i personas"
+                    % (path, meta["pop_size"])
+                )
+            float_dtype = meta["float_dtype"]
+            chunk_size = meta["chunk_size"]
+            compress = meta["compress"]
+            self.frames = meta["frames"]
+        else:
+            self.frames = []
+
+        self.pop_size = pop_size
+        self.float_dtype = np.dtype(float_dtype)
+        self.chunk_size = int(chunk_size)
+        self.compress = bool(compress)
+        self.dtype = snapshot_dtype(pop_size, self.float_dtype)
+
+        self._chunk = None
+        self._chunk_no = None
+        self._write_meta()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _write_meta(self):
+        meta = {
+            "pop_size": self.pop_size,
+            "float_dtype": self.float_dtype.name,
+            "chunk_size": self.chunk_size,
+            "compress": self.compress,
+            "columns": list(self.dtype.names),
+            "frames": self.frames,
+        }
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump(meta, f)
+
+    def _open_chunk(self, chunk_no):
+        path = _chunk_file(self.path, chunk_no, self.compress)
+        exists = os.path.isfile(path)
+
+        if self.compress:
+            chunk = np.zeros(self.chunk_size, dtype=self.dtype)
+            if exists:
+                # bloque incompleto de una corrida anterior
+                with np.load(path) as data:
+                    for name in self.dtype.names:
+                        chunk[name][: len(data[name])] = data[name]
+        elif exists:
+            chunk = np.load(path, mmap_mode="r+")
+        else:
+            chunk = np.lib.format.open_memmap(
+                path, mode="w+", dtype=self.dtype, shape=(self.chunk_size,)
+            )
+
+        self._chunk = chunk
+        self._chunk_no = chunk_no
+
+    def truncate(self, frame):
+        """Descarta las instantáneas desde el paso frame en adelante
+
+        Al continuar desde un punto de control, los pasos guardados después
+        de él por la corrida original se reemplazan por los nuevos.
+        """
+        keep = int(np.searchsorted(self.frames, frame))
+        if keep == len(self.frames):
+            return
+        self.flush()
+        self._chunk = None
+        self._chunk_no = None
+        del self.frames[keep:]
+        self._write_meta()
+
+    def append(self, population, frame):
+        """Agrega una instantánea de la población (Population o matriz)"""
+        if self.frames and frame <= self.frames[-1]:
+            raise config_error(
+                "el paso %i no es posterior al último del almacén (%i)"
+                % (frame, self.frames[-1])
+            )
+        row = len(self.frames) % self.chunk_size
+        chunk_no = len(self.frames) // self.chunk_size
+        if self._chunk_no != chunk_no:
+            self._open_chunk(chunk_no)
+
+        for c, name in enumerate(self.dtype.names):
+            self._chunk[name][row] = population[:, c]
+        self.frames.append(int(frame))
+
+        if row + 1 == self.chunk_size:
+            self.flush()
+            self._chunk = None
+            self._chunk_no = None
+
+    def write_series(self, pop_tracker):
+        """Guarda las series de Population_trackers junto a las instantáneas"""
+        np.savez(
+            os.path.join(self.path, SERIES_FILE),
+            **{
+                name: np.asarray(getattr(pop_tracker, name), dtype=np.int64)
+                for name in TRACKER_SERIES
+            }
+        )
+
+    def flush(self):
+        """Escribe el bloque actual y el índice de pasos"""
+        if self._chunk is not None:
+            rows = len(self.frames) - self._chunk_no * self.chunk_size
+            if self.compress:
+                np.savez_compressed(
+                    _chunk_file(self.path, self._chunk_no, True),
+                    **{name: self._chunk[name][:rows] for name in self.dtype.names}
+                )
+            else:
+                self._chunk.flush()
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+        self._chunk = None
+        self._chunk_no = None
+
+
+class SnapshotReader:
+    """Lector de un almacén escrito con SnapshotStore
+
+    Solo se abren los bloques del rango pedido; los bloques sin compresión
+    se leen con memoria mapeada y de ellos solo las columnas pedidas.
+
+    Keyword arguments
+    -----------------
+    path : str
+        carpeta del almacén
+    """
+
+    def __init__(self, path):
+        if not os.path.isfile(os.path.join(path, META_FILE)):
+            raise config_error("%s no contiene un almacén de instantáneas" % path)
+
+        meta = _read_meta(path)
+        self.path = path
+        self.pop_size = meta["pop_size"]
+        self.float_dtype = np.dtype(meta["float_dtype"])
+        self.chunk_size = meta["chunk_size"]
+        self.compress = meta["compress"]
+        self.frames = np.asarray(meta["frames"], dtype=np.int64)
+        self.dtype = snapshot_dtype(self.pop_size, self.float_dtype)
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def columns(self):
+        return self.dtype.names
+
+    def _column_name(self, column):
+        # las columnas se piden por nombre o por su índice en la matriz original
+        if isinstance(column, (int, np.integer)):
+            return self.dtype.names[column]
+        if column not in self.dtype.names:
+            raise config_error("columna %s no reconocida" % column)
+        return column
+
+    def _load_chunk(self, chunk_no):
+        path = _chunk_file(self.path, chunk_no, self.compress)
+        if self.compress:
+            return np.load(path)
+        return np.load(path, mmap_mode="r")
+
+    def read(self, columns=None, start=None, stop=None):
+        """Columnas de las instantáneas con start <= paso < stop
+
+        Keyword arguments
+        -----------------
+        columns : list
+            nombres o índices de columna, por defecto todas
+
+        start, stop : int
+            rango de pasos de simulación, por defecto todo el almacén
+
+        Retorna (pasos, diccionario columna -> arreglo (instantáneas, pop_size))
+        """
+
+        names = [
+            self._column_name(c)
+            for c in (self.dtype.names if columns is None else columns)
+        ]
+        lo = 0 if start is None else int(np.searchsorted(self.frames, start))
+        hi = len(self.frames)
+        if stop is not None:
+            hi = max(lo, int(np.searchsorted(self.frames, stop)))
+
+        out = {
+            name: np.empty((hi - lo, self.pop_size), dtype=self.dtype[name].base)
+            for name in names
+        }
+        size = self.chunk_size
+        for chunk_no in range(lo // size, (hi - 1) // size + 1 if hi > lo else 0):
+            a = max(lo, chunk_no * size)
+            b = min(hi, (chunk_no + 1) * size)
+            data = self._load_chunk(chunk_no)
+            for name in names:
+                out[name][a - lo : b - lo] = data[name][
+                    a - chunk_no * size : b - chunk_no * size
+                ]
+            if self.compress:
+                data.close()
+
+        return self.frames[lo:hi], out
+
+    def column(self, column, start=None, stop=None):
+        """Una columna de las instantáneas del rango de pasos dado"""
+        name = self._column_name(column)
+        return self.read([name], start, stop)[1][name]
+
+    def snapshot(self, frame):
+        """Población guardada en el paso frame"""
+        row = int(np.searchsorted(self.frames, frame))
+        if row == len(self.frames) or self.frames[row] != frame:
+            raise config_error("el paso %i no está en el almacén" % frame)
+
+        _, data = self.read(start=frame, stop=frame + 1)
+        population = Population(0, self.float_dtype)
+        population.columns = [data[name][0] for name in self.dtype.names]
+        population.recount()
+        return population
+
+    def series(self):
+        """Series de Population_trackers guardadas con write_series"""
+        with np.load(os.path.join(self.path, SERIES_FILE)) as data:
+            return {name: data[name] for name in data.files}
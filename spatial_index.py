@@ -0,0 +1,263 @@
+"""
+contiene los índices espaciales usados para encontrar contactos
+entre agentes sin recorrer toda la población
+"""
+
+import math
+
+import numpy as np
+
+from config import config_error
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # SciPy es opcional, sin él se usa la rejilla
+    cKDTree = None
+
+CONTACT_BACKENDS = ("auto", "brute", "grid", "kdtree")
+
+
+def _pairs_in_zone(points, centers, ci, pj, radius):
+    # filtro exacto de pares (centro, punto) con la zona centro +- radius
+    cx = centers[ci, 0]
+    cy = centers[ci, 1]
+    px = points[pj, 0]
+    py = points[pj, 1]
+    inside = (
+        (cx - radius < px)
+        & (px < cx + radius)
+        & (cy - radius < py)
+        & (py < cy + radius)
+    )
+    return ci[inside], pj[inside]
+
+
+class SpatialGrid:
+    """Índice de rejilla uniforme (cell-list) sobre un conjunto de puntos
+
+    Ordena los puntos por celda una sola vez, de modo que cada consulta
+    solo revisa las celdas que se solapan con la zona buscada en lugar de
+    toda la población.
+
+    Keyword arguments
+    -----------------
+    points : ndarray
+        arreglo (N, 2) con las coordenadas x, y de cada punto
+
+    cell_size : float
+        lado de cada celda, normalmente el infection_range de la configuración
+
+    max_cells : int
+        límite de celdas por eje, por defecto del orden de la raíz de N para
+        que construir la rejilla siga siendo O(N) cuando el rango es muy
+        pequeño comparado con el mundo
+    """
+
+    def __init__(self, points, cell_size, max_cells=None):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.points = points
+        self.size = len(points)
+
+        if self.size == 0:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        else:
+            self.origin = points.min(axis=0)
+            extent = points.max(axis=0) - self.origin
+
+        if max_cells is None:
+            max_cells = int(np.sqrt(self.size)) + 1
+
+        # El tamaño de celda nunca baja del rango pedido
+        cell_size = max(float(cell_size), float(extent.max()) / max_cells, 1e-12)
+        self.cell_size = cell_size
+        self.nx = int(extent[0] // cell_size) + 1
+        self.ny = int(extent[1] // cell_size) + 1
+
+        # Ordenar los puntos por celda (índice lineal ix * ny + iy)
+        cells = self.cell_of(points)
+        self.order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=self.nx * self.ny)
+        self.cell_start = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.cell_start[1:])
+
+    def cell_of(self, points):
+        """Devuelve el índice lineal de la celda de cada punto"""
+        ix, iy = self._cell_coords(points[:, 0], points[:, 1])
+        return ix * self.ny + iy
+
+    def _cell_coords(self, x, y):
+        ix = np.clip(
+            np.floor((x - self.origin[0]) / self.cell_size), 0, self.nx - 1
+        ).astype(np.int64)
+        iy = np.clip(
+            np.floor((y - self.origin[1]) / self.cell_size), 0, self.ny - 1
+        ).astype(np.int64)
+        return ix, iy
+
+    def query_pairs(self, centers, radius):
+        """Todos los pares (centro, punto) con el punto dentro de la zona del centro
+
+        Recorre las celdas vecinas de todos los centros a la vez con
+        operaciones de arreglo.
+
+        Keyword arguments
+        -----------------
+        centers : ndarray
+            arreglo (M, 2) con las coordenadas de los centros de cada zona
+
+        radius : float
+            semiancho de la zona cuadrada alrededor de cada centro
+
+        Retorna dos arreglos con el índice del centro y el índice del punto
+        de cada par, ordenados por centro y luego por punto.
+        """
+
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if self.size == 0 or len(centers) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        # celdas sin recortar: los centros fuera de la rejilla no tienen vecinos inválidos
+        cx = np.floor((centers[:, 0] - self.origin[0]) / self.cell_size).astype(
+            np.int64
+        )
+        cy = np.floor((centers[:, 1] - self.origin[1]) / self.cell_size).astype(
+            np.int64
+        )
+        reach = int(math.ceil(radius / self.cell_size))
+
+        center_chunks = []
+        point_chunks = []
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                ix = cx + dx
+                iy = cy + dy
+                valid = np.flatnonzero(
+                    (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+                )
+                cell = ix[valid] * self.ny + iy[valid]
+                start = self.cell_start[cell]
+                counts = self.cell_start[cell + 1] - start
+                total = counts.sum()
+                if total == 0:
+                    continue
+                # expandir cada centro por el número de puntos de su celda
+                ci = np.repeat(valid, counts)
+                offsets = np.arange(total) - np.repeat(
+                    np.cumsum(counts) - counts, counts
+                )
+                center_chunks.append(ci)
+                point_chunks.append(self.order[np.repeat(start, counts) + offsets])
+
+        if len(center_chunks) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        ci = np.concatenate(center_chunks)
+        pj = np.concatenate(point_chunks)
+        # mismo orden que los demás índices: por centro y luego por punto
+        order = np.lexsort((pj, ci))
+        return _pairs_in_zone(self.points, centers, ci[order], pj[order], radius)
+
+
+class BruteForceIndex:
+    """Índice trivial: cada consulta recorre todos los puntos
+
+    Compara cada centro con todos los puntos y sirve como referencia para
+    los demás índices.
+    """
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.size = len(self.points)
+
+    def query_pairs(self, centers, radius, block_size=1000000):
+        """Todos los pares (centro, punto) comparando cada centro con todos los puntos"""
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        pts = self.points
+        # procesar los centros por bloques para acotar la memoria de las máscaras
+        step = max(1, block_size // max(self.size, 1))
+        center_chunks = []
+        point_chunks = []
+        for first in range(0, len(centers), step):
+            c = centers[first : first + step]
+            inside = (
+                (c[:, 0:1] - radius < pts[:, 0])
+                & (pts[:, 0] < c[:, 0:1] + radius)
+                & (c[:, 1:2] - radius < pts[:, 1])
+                & (pts[:, 1] < c[:, 1:2] + radius)
+            )
+            ci, pj = np.nonzero(inside)
+            center_chunks.append(ci + first)
+            point_chunks.append(pj)
+
+        if len(center_chunks) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(center_chunks), np.concatenate(point_chunks)
+
+
+class KDTreeIndex:
+    """Índice KD-tree (scipy.spatial.cKDTree) sobre un conjunto de puntos
+
+    Las consultas usan la norma infinito, que coincide con las zonas de
+    infección cuadradas; el resultado se filtra igual que en la rejilla.
+    """
+
+    def __init__(self, points, cell_size=None):
+        if cKDTree is None:
+            raise config_error("el backend 'kdtree' requiere scipy")
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.size = len(self.points)
+        self.tree = cKDTree(self.points) if self.size > 0 else None
+
+    def query_pairs(self, centers, radius):
+        """Todos los pares (centro, punto) con el punto dentro de la zona del centro"""
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        if self.tree is None or len(centers) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        neighbours = self.tree.query_ball_point(
+            centers, radius * (1 + 1e-9) + 1e-12, p=np.inf, return_sorted=True
+        )
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64)
+        ci = np.repeat(np.arange(len(centers)), counts)
+        if counts.sum() == 0:
+            return ci, np.zeros(0, dtype=np.int64)
+        pj = np.concatenate(neighbours).astype(np.int64)
+        return _pairs_in_zone(self.points, centers, ci, pj, radius)
+
+
+def build_contact_index(points, cell_size, backend="auto"):
+    """Construye el índice de contactos pedido en la configuración
+
+    Keyword arguments
+    -----------------
+    points : ndarray
+        arreglo (N, 2) con las coordenadas x, y de cada punto
+
+    cell_size : float
+        rango de infección, define el tamaño de celda de la rejilla
+
+    backend : str
+        'brute', 'grid', 'kdtree' o 'auto' (kdtree si scipy está instalado,
+        si no la rejilla)
+    """
+
+    backend = backend.lower()
+    if backend == "auto":
+        backend = "kdtree" if cKDTree is not None else "grid"
+
+    if backend == "brute":
+        return BruteForceIndex(points)
+    elif backend == "grid":
+        return SpatialGrid(points, cell_size)
+    elif backend == "kdtree":
+        return KDTreeIndex(points)
+    else:
+        raise config_error(
+            "contact_backend %s no reconocido, use uno de %s"
+            % (backend, ", ".join(CONTACT_BACKENDS))
+        )
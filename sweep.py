@@ -0,0 +1,188 @@
+"""
+contiene el motor de barridos de parámetros: genera puntos sobre los
+argumentos de Configuration (rejilla o hipercubo latino), los reparte
+entre procesos y reúne las métricas de cada corrida en una tabla
+"""
+
+import csv
+import inspect
+from itertools import product
+
+import numpy as np
+
+from config import Configuration
+from ensemble import SCENARIOS, map_tasks, replicate_seeds, run_replicate
+
+# columnas de métricas de cada corrida
+METRICS = (
+    "peak_infections",
+    "peak_time",
+    "total_fatalities",
+    "total_recovered",
+    "time_to_extinction",
+    "frames",
+)
+
+
+def grid_points(**axes):
+    """Producto cartesiano de los valores de cada parámetro
+
+    Ejemplo: grid_points(infection_chance=[0.01, 0.03], speed=[0.005, 0.01])
+    devuelve 4 diccionarios de argumentos.
+    """
+
+    names = list(axes)
+    return [dict(zip(names, values)) for values in product(*axes.values())]
+
+
+def latin_hypercube_points(samples, bounds, seed=None, integer=()):
+    """Muestra de hipercubo latino sobre rangos de parámetros
+
+    Keyword arguments
+    -----------------
+    samples : int
+        número de puntos
+
+    bounds : dict
+        parámetro -> (mínimo, máximo)
+
+    seed : int
+        semilla de la muestra
+
+    integer : list or tuple
+        parámetros que se redondean a entero (por ejemplo healthcare_capacity)
+    """
+
+    rng = np.random.default_rng(seed)
+    names = list(bounds)
+    # un valor por estrato en cada eje, estratos permutados de forma independiente
+    strata = np.column_stack([rng.permutation(samples) for _ in names])
+    unit = (strata + rng.random((samples, len(names)))) / samples
+
+    points = []
+    for row in unit:
+        point = {}
+        for name, u in zip(names, row):
+            low, high = bounds[name]
+            value = low + u * (high - low)
+            point[name] = int(round(value)) if name in integer else float(value)
+        points.append(point)
+    return points
+
+
+def run_metrics(series):
+    """Métricas resumen de las series de una corrida"""
+    infectious = np.asarray(series["infectious"])
+
+    if len(infectious) == 0:
+        return dict.fromkeys(METRICS, 0)
+
+    # la extinción es el primer paso sin infectados después del primer caso
+    started = np.flatnonzero(infectious > 0)
+    extinction = np.nan
+    if len(started) > 0:
+        ended = np.flatnonzero(infectious[started[0] :] == 0)
+        if len(ended) > 0:
+            extinction = int(started[0] + ended[0])
+
+    return {
+        "peak_infections": int(infectious.max()),
+        "peak_time": int(infectious.argmax()),
+        "total_fatalities": int(series["fatalities"][-1]),
+        "total_recovered": int(series["recovered"][-1]),
+        "time_to_extinction": extinction,
+        "frames": int(series["frames"]),
+    }
+
+
+def _sweep_task(task):
+    # tarea de un proceso: una réplica de un punto del barrido
+    point_index, replicate, replicate_task = task
+    return point_index, replicate, run_metrics(run_replicate(replicate_task))
+
+
+def _scenario_kwargs(scenario, point, scenario_kwargs):
+    # los parámetros del punto que acepta el método del escenario también se le pasan
+    kwargs = dict(scenario_kwargs or {})
+    if scenario is not None:
+        method = getattr(Configuration, SCENARIOS[scenario][0])
+        accepted = inspect.signature(method).parameters
+        kwargs.update({k: v for k, v in point.items() if k in accepted})
+    return kwargs
+
+
+def run_sweep(
+    points,
+    replicates=1,
+    seed=None,
+    processes=None,
+    scenario=None,
+    scenario_kwargs=None,
+    **base_kwargs
+):
+    """Corre todas las réplicas de todos los puntos del barrido
+
+    Cada (punto, réplica) es una tarea independiente del grupo de procesos,
+    de modo que el barrido ocupa todos los núcleos aunque haya pocos puntos.
+
+    Keyword arguments
+    -----------------
+    points : list
+        lista de diccionarios de argumentos de Configuration, por ejemplo de
+        grid_points o latin_hypercube_points
+
+    replicates : int
+        réplicas por punto
+
+    seed : int
+        semilla base, cada tarea recibe una semilla propia
+
+    processes : int
+        número de procesos, por defecto los núcleos disponibles
+
+    scenario : str
+        escenario aplicado a cada corrida (ver ensemble.SCENARIOS); los
+        parámetros del punto que acepte su método, como lockdown_compliance
+        para 'lockdown', se le pasan también
+
+    scenario_kwargs : dict
+        argumentos fijos del método del escenario
+
+    **base_kwargs
+        argumentos de Configuration comunes a todos los puntos
+
+    Retorna
+    -------
+    lista de filas (diccionarios) con los parámetros del punto, el número de
+    réplica, la semilla y las métricas de METRICS
+    """
+
+    seeds = replicate_seeds(seed, len(points) * replicates)
+    tasks = []
+    for p, point in enumerate(points):
+        config_kwargs = dict(base_kwargs)
+        config_kwargs.update(point)
+        kwargs = _scenario_kwargs(scenario, point, scenario_kwargs)
+        for r in range(replicates):
+            s = seeds[p * replicates + r]
+            tasks.append((p, r, (config_kwargs, scenario, kwargs, s)))
+
+    rows = []
+    for p, r, metrics in map_tasks(_sweep_task, tasks, processes):
+        row = dict(points[p])
+        row.update(point=p, replicate=r, seed=seeds[p * replicates + r])
+        row.update(metrics)
+        rows.append(row)
+    return rows
+
+
+def write_csv(rows, path):
+    """Escribe la tabla del barrido en un archivo CSV"""
+    fields = []
+    for row in rows:
+        fields += [k for k in row if k not in fields]
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
@@ -0,0 +1,97 @@
+"""
+pruebas de checkpoint: restaurar un punto de control reproduce la
+trayectoria número a número y las bifurcaciones no tocan el almacén de
+instantáneas de la corrida original
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from checkpoint import run_forks
+from simulation import Simulation
+from snapshot_store import SnapshotReader
+
+CONFIG = dict(
+    pop_size=1000,
+    seed=7,
+    headless=True,
+    visualise=False,
+    tick_backend="numpy",
+    endif_no_infections=False,
+)
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_restore_reproduces_trajectory(tmp_path, on_disk):
+    sim = Simulation(**CONFIG)
+    # después del paso 50, en el que se infecta al paciente cero
+    for _ in range(60):
+        sim.tstep()
+    checkpoint = sim.checkpoint(str(tmp_path / "cp") if on_disk else None)
+    for _ in range(40):
+        sim.tstep()
+
+    restored = Simulation.from_checkpoint(
+        str(tmp_path / "cp") if on_disk else checkpoint
+    )
+    for _ in range(40):
+        restored.tstep()
+
+    assert restored.frame == sim.frame
+    for c in range(len(sim.population.columns)):
+        np.testing.assert_array_equal(restored.population[:, c], sim.population[:, c])
+    np.testing.assert_array_equal(restored.destinations, sim.destinations)
+    np.testing.assert_array_equal(
+        restored.pop_tracker.infectious, sim.pop_tracker.infectious
+    )
+
+
+def _store_run(tmp_path):
+    # corrida original que guarda una instantánea cada 5 pasos
+    folder = str(tmp_path / "pop")
+    sim = Simulation(
+        save_pop=True,
+        save_pop_folder=folder,
+        save_pop_freq=5,
+        simulation_steps=60,
+        **CONFIG
+    )
+    sim.run()
+    frames, data = SnapshotReader(folder).read(["x", "state"])
+    np.testing.assert_array_equal(frames, np.arange(0, 60, 5))
+    return sim, folder, data
+
+
+def _check_stores(folder, data, forks):
+    # la corrida original queda intacta
+    frames, after = SnapshotReader(folder).read(["x", "state"])
+    np.testing.assert_array_equal(frames, np.arange(0, 60, 5))
+    for name in ("x", "state"):
+        np.testing.assert_array_equal(after[name], data[name])
+
+    # cada variante tiene su propio almacén desde el punto de control
+    for k in range(forks):
+        reader = SnapshotReader(os.path.join(folder, "fork_%02i" % k))
+        np.testing.assert_array_equal(reader.frames, np.arange(60, 80, 5))
+
+
+def test_fork_keeps_stores_apart(tmp_path):
+    sim, folder, data = _store_run(tmp_path)
+
+    for fork in sim.fork([None, "lockdown"]):
+        fork.Config.simulation_steps = 20
+        fork.run()
+
+    _check_stores(folder, data, 2)
+
+
+def test_run_forks_keeps_stores_apart(tmp_path):
+    sim, folder, data = _store_run(tmp_path)
+    path = str(tmp_path / "cp")
+    sim.checkpoint(path)
+
+    run_forks(path, [None, "lockdown"], steps=20, processes=2)
+
+    _check_stores(folder, data, 2)
@@ -0,0 +1,108 @@
+"""
+pruebas de domain.TiledSimulation contra Simulation: con el movimiento sin
+cambios aleatorios, sin rebotes y con infection_chance 1 el resultado no
+depende de los generadores, así que debe ser idéntico con cualquier número
+de franjas
+"""
+
+import numpy as np
+import pytest
+
+from domain import TiledSimulation
+from population import set_state
+from simulation import Simulation
+
+CONFIG = dict(
+    pop_size=4000,
+    seed=3,
+    headless=True,
+    visualise=False,
+    save_pop=False,
+    tick_backend="numpy",
+    infection_range=0.05,
+    infection_chance=1.0,
+    healthcare_capacity=0,
+)
+
+
+def _pair(tiles):
+    # la misma población en las dos simulaciones, lejos de los límites
+    base = Simulation(**CONFIG)
+    tiled = TiledSimulation(tiles=tiles, **CONFIG)
+
+    rng = np.random.default_rng(0)
+    n = CONFIG["pop_size"]
+    x = rng.uniform(0.5, 1.5, n)
+    y = rng.uniform(0.5, 1.5, n)
+    for sim in (base, tiled):
+        sim.population[:, 1] = x
+        sim.population[:, 2] = y
+        for c in (3, 4, 5):
+            sim.population[:, c] = base.population[:, c]
+        set_state(sim.population, np.arange(0, n, 50), 1)
+    return base, tiled
+
+
+def _step(sim, infect=True):
+    rng = np.random.default_rng(1)
+    sim.move(rng, randomize=False)
+    if infect:
+        sim.infect_step(rng)
+    sim.frame += 1
+
+
+@pytest.mark.parametrize("tiles", [1, 4])
+def test_motion_matches_untiled(tiles):
+    base, tiled = _pair(tiles)
+    try:
+        for _ in range(5):
+            _step(base, infect=False)
+            _step(tiled, infect=False)
+
+        # cada persona se mueve una sola vez por paso, también en los bordes
+        for c in (1, 2):
+            np.testing.assert_array_equal(tiled.population[:, c], base.population[:, c])
+    finally:
+        tiled.close()
+
+
+@pytest.mark.parametrize("tiles", [1, 4])
+def test_infections_match_untiled(tiles):
+    base, tiled = _pair(tiles)
+    try:
+        for _ in range(5):
+            _step(base)
+            _step(tiled)
+            np.testing.assert_array_equal(tiled.population[:, 6], base.population[:, 6])
+
+        assert np.count_nonzero(base.population[:, 6] == 1) > CONFIG["pop_size"] // 50
+    finally:
+        tiled.close()
+
+
+def test_tiles_partition_population():
+    _, tiled = _pair(4)
+    try:
+        _step(tiled, infect=False)
+        counts = np.bincount(tiled.owner, minlength=4)
+        assert counts.sum() == CONFIG["pop_size"]
+        assert np.all(counts > 0)
+    finally:
+        tiled.close()
+
+
+def test_fork_keeps_tiled_engine():
+    base, tiled = _pair(2)
+    try:
+        _step(tiled)
+        forks = tiled.fork([None])
+        try:
+            assert isinstance(forks[0], TiledSimulation)
+            _step(base)
+            _step(base)
+            _step(forks[0])
+            np.testing.assert_array_equal(forks[0].population[:, 6], base.population[:, 6])
+        finally:
+            forks[0].close()
+    finally:
+        tiled.close()
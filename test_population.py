@@ -0,0 +1,65 @@
+"""
+pruebas de Population: los conteos por estado y de tratamiento que
+mantienen set_state y set_treatment coinciden en cada paso con los que se
+recalculan desde las columnas
+"""
+
+import numpy as np
+import pytest
+
+from population import N_STATES, Population
+from simulation import Simulation
+
+
+@pytest.mark.parametrize("track_indices", [False, True])
+def test_incremental_counts_match_recount(track_indices):
+    # contagios, camas llenas y recuperaciones en pocos pasos
+    sim = Simulation(
+        pop_size=800,
+        seed=9,
+        headless=True,
+        visualise=False,
+        infection_range=0.06,
+        recovery_duration=(20, 60),
+        healthcare_capacity=30,
+        track_state_indices=track_indices,
+    )
+    seen = np.zeros(N_STATES, dtype=bool)
+    for _ in range(200):
+        sim.tstep()
+        population = sim.population
+        # los conteos se mantienen sin recalcular
+        assert population._counts_valid
+
+        state = population[:, 6]
+        counts = np.bincount(state, minlength=N_STATES)
+        np.testing.assert_array_equal(population.state_counts, counts)
+        assert population.treated == np.count_nonzero(population[:, 10] == 1)
+        if track_indices:
+            for s in range(N_STATES):
+                np.testing.assert_array_equal(
+                    population.indices(s), np.flatnonzero(state == s)
+                )
+        seen |= counts > 0
+
+    # el recorrido pasó por sanos, infectados y recuperados
+    assert seen[[0, 1, 2]].all()
+
+
+def test_negative_row_matches_matrix():
+    sim = Simulation(pop_size=50, seed=1, headless=True, visualise=False)
+    matrix = np.asarray(sim.population)
+    np.testing.assert_array_equal(sim.population[-1], matrix[-1])
+    np.testing.assert_array_equal(sim.population[-50], matrix[0])
+    with pytest.raises(IndexError):
+        sim.population[50]
+    with pytest.raises(IndexError):
+        sim.population[-51]
+
+
+def test_copy_keeps_counts():
+    sim = Simulation(pop_size=100, seed=1, headless=True, visualise=False)
+    sim.population.set_state([1, 2, 3], 1)
+    copy = sim.population.copy()
+    assert isinstance(copy, Population)
+    np.testing.assert_array_equal(copy.state_counts, sim.population.state_counts)
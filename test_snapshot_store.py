@@ -0,0 +1,99 @@
+"""
+pruebas de snapshot_store: lo que se agrega con SnapshotStore se lee igual
+con SnapshotReader, también después de truncar y continuar el almacén
+"""
+
+import numpy as np
+import pytest
+
+from config import config_error
+from simulation import Simulation
+from snapshot_store import SnapshotReader, SnapshotStore
+
+POP_SIZE = 300
+
+
+def _snapshots(frames, seed=5):
+    # instantáneas de una simulación real en los pasos pedidos
+    sim = Simulation(pop_size=POP_SIZE, seed=seed, headless=True, visualise=False)
+    snapshots = {}
+    while sim.frame <= max(frames):
+        if sim.frame in frames:
+            snapshots[sim.frame] = sim.population.copy()
+        sim.tstep()
+    return snapshots
+
+
+def _open(path, resume=False, compress=False):
+    return SnapshotStore(
+        str(path), POP_SIZE, chunk_size=4, compress=compress, resume=resume
+    )
+
+
+def _check(path, snapshots):
+    reader = SnapshotReader(str(path))
+    frames, data = reader.read()
+    np.testing.assert_array_equal(frames, sorted(snapshots))
+    for k, frame in enumerate(frames):
+        population = snapshots[frame]
+        for c, name in enumerate(reader.columns):
+            np.testing.assert_array_equal(data[name][k], population[:, c])
+        np.testing.assert_array_equal(
+            reader.snapshot(frame).state_counts, population.state_counts
+        )
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_append_round_trip(tmp_path, compress):
+    snapshots = _snapshots(range(0, 60, 5))
+    store = _open(tmp_path, compress=compress)
+    for frame, population in snapshots.items():
+        store.append(population, frame)
+    store.close()
+
+    _check(tmp_path, snapshots)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_truncate_and_resume(tmp_path, compress):
+    first = _snapshots(range(0, 60, 5))
+    store = _open(tmp_path, compress=compress)
+    for frame, population in first.items():
+        store.append(population, frame)
+    store.close()
+
+    # otra corrida continúa desde el paso 30 y reemplaza lo posterior
+    second = _snapshots(range(30, 80, 5), seed=6)
+    store = _open(tmp_path, resume=True, compress=compress)
+    store.truncate(30)
+    for frame, population in second.items():
+        store.append(population, frame)
+    store.close()
+
+    expected = {f: p for f, p in first.items() if f < 30}
+    expected.update(second)
+    _check(tmp_path, expected)
+
+
+def test_new_store_replaces_previous(tmp_path):
+    snapshots = _snapshots(range(0, 20, 5))
+    store = _open(tmp_path)
+    for frame, population in snapshots.items():
+        store.append(population, frame)
+    store.close()
+
+    store = _open(tmp_path)
+    assert len(store) == 0
+    store.append(snapshots[10], 10)
+    store.close()
+
+    _check(tmp_path, {10: snapshots[10]})
+
+
+def test_rejects_frames_out_of_order(tmp_path):
+    snapshots = _snapshots([0, 5])
+    store = _open(tmp_path)
+    store.append(snapshots[5], 5)
+    with pytest.raises(config_error):
+        store.append(snapshots[0], 0)
+    store.close()
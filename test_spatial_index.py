@@ -0,0 +1,95 @@
+"""
+pruebas de los índices de contacto: brute, grid y kdtree (y la rejilla de
+numba si está instalado) devuelven los mismos pares en el mismo orden, así
+que el mismo paso sortea los mismos contagios con cualquiera de ellos
+"""
+
+import numpy as np
+import pytest
+
+from infection import contact_pairs, draw_infections
+from population import set_state, state_indices
+from simulation import Simulation
+
+
+def _backends():
+    backends = [("brute", "numpy"), ("grid", "numpy")]
+    try:
+        import scipy  # noqa: F401
+
+        backends.append(("kdtree", "numpy"))
+    except ImportError:
+        pass
+    try:
+        import numba  # noqa: F401
+
+        backends.append(("grid", "numba"))
+    except ImportError:
+        pass
+    return backends
+
+
+def _simulation(infected_every):
+    # población real con una fracción de infectados repartida al azar
+    sim = Simulation(
+        pop_size=3000, seed=11, headless=True, visualise=False, infection_range=0.04
+    )
+    rng = np.random.default_rng(2)
+    infected = rng.permutation(3000)[: 3000 // infected_every]
+    set_state(sim.population, infected, 1)
+    return sim
+
+
+def _pairs(sim, contact_backend, tick_backend):
+    sim.Config.contact_backend = contact_backend
+    sim.Config.tick_backend = tick_backend
+    infectious = state_indices(sim.population, 1)
+    susceptible = state_indices(sim.population, 0)
+    return contact_pairs(sim.population, infectious, susceptible, sim.Config)
+
+
+# pocos infectados (índice sobre los sanos) y muchos (índice sobre los infectados)
+@pytest.mark.parametrize("infected_every", [20, 2])
+def test_backends_return_same_pairs(infected_every):
+    sim = _simulation(infected_every)
+    source, target = _pairs(sim, "brute", "numpy")
+    assert len(source) > 0
+
+    # pares únicos, en contacto y ordenados por infectado y luego por sano
+    x = sim.population[:, 1]
+    y = sim.population[:, 2]
+    r = sim.Config.infection_range
+    assert np.all(np.abs(x[source] - x[target]) < r)
+    assert np.all(np.abs(y[source] - y[target]) < r)
+    order = np.lexsort((target, source))
+    np.testing.assert_array_equal(order, np.arange(len(source)))
+
+    for backend in _backends():
+        other_source, other_target = _pairs(sim, *backend)
+        np.testing.assert_array_equal(other_source, source)
+        np.testing.assert_array_equal(other_target, target)
+
+
+def test_backends_draw_same_infections():
+    sim = _simulation(20)
+    infectious = state_indices(sim.population, 1)
+    susceptible = state_indices(sim.population, 0)
+
+    results = []
+    for contact_backend, tick_backend in [("brute", "numpy")] + _backends():
+        sim.Config.contact_backend = contact_backend
+        sim.Config.tick_backend = tick_backend
+        results.append(
+            draw_infections(
+                sim.population,
+                infectious,
+                susceptible,
+                sim.Config,
+                np.random.default_rng(4),
+            )
+        )
+
+    for new_infections, sources, contacts in results[1:]:
+        np.testing.assert_array_equal(new_infections, results[0][0])
+        np.testing.assert_array_equal(sources, results[0][1])
+        assert contacts == results[0][2]
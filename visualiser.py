@@ -4,8 +4,10 @@ Contiene todos los metodos para las tareas de visualización
 
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from matplotlib.colors import to_rgb
 import numpy as np
 
+from async_writer import save_figure
 from environment import build_hospital
 from utils import check_folder
 
@@ -32,88 +34,274 @@ def build_fig(Config, figsize=(5, 7)):
     return fig, spec, ax1, ax2
 
 
-def draw_tstep(Config, population, pop_tracker, frame, fig, spec, ax1, ax2):
-    # Construir gráfica y visualizar 
-
-    # Estilo del la gráfica
-    set_style(Config)
-
-    # Paleta de colores
-    palette = Config.get_palette()
-
-    spec = fig.add_gridspec(ncols=1, nrows=2, height_ratios=[5, 2])
-    ax1.clear()
-    ax2.clear()
-
-    ax1.set_xlim(Config.x_plot[0], Config.x_plot[1])
-    ax1.set_ylim(Config.y_plot[0], Config.y_plot[1])
-
-    if Config.self_isolate and Config.isolation_bounds != None:
-        build_hospital(
-            Config.isolation_bounds[0],
-            Config.isolation_bounds[2],
-            Config.isolation_bounds[1],
-            Config.isolation_bounds[3],
-            ax1
+def density_bins(Config):
+    """Número de píxeles (ancho, alto) de la imagen de densidad
+
+    Config.density_resolution píxeles en X y los de Y según la proporción
+    del área dibujada.
+    """
+    width = Config.x_plot[1] - Config.x_plot[0]
+    height = Config.y_plot[1] - Config.y_plot[0]
+    nx = int(Config.density_resolution)
+    ny = max(1, int(round(nx * height / width)))
+    return nx, ny
+
+
+def density_image(Config, x, y, state, colors, background, bins):
+    """Imagen RGB de la población por estado
+
+    Las personas se agrupan en los píxeles del área x_plot / y_plot con un
+    solo bincount sobre (estado, píxel). El color de cada píxel es la
+    mezcla de los colores de los estados presentes, ponderada por el número
+    de personas de cada uno, y su intensidad sobre el fondo crece con el
+    logaritmo de la densidad.
+
+    Keyword arguments
+    -----------------
+    x, y, state : ndarray
+        columnas de posición y estado de la población
+
+    colors : ndarray
+        colores RGB (4, 3) de sano, infectado, inmune y fallecido
+
+    background : ndarray
+        color RGB del fondo de los ejes
+
+    bins : tuple
+        píxeles (ancho, alto), ver density_bins
+    """
+
+    nx, ny = bins
+    col = (x - Config.x_plot[0]) * (nx / (Config.x_plot[1] - Config.x_plot[0]))
+    row = (y - Config.y_plot[0]) * (ny / (Config.y_plot[1] - Config.y_plot[0]))
+    col = col.astype(np.intp)
+    row = row.astype(np.intp)
+    state = state.astype(np.intp)
+
+    # solo los cuatro estados de la paleta y las personas dentro del área
+    inside = (col >= 0) & (col < nx) & (row >= 0) & (row < ny) & (state < 4)
+    index = (state[inside] * ny + row[inside]) * nx + col[inside]
+    counts = np.bincount(index, minlength=4 * ny * nx).reshape(4, ny * nx)
+
+    total = counts.sum(axis=0)
+    occupied = total > 0
+    mix = np.zeros((ny * nx, 3))
+    mix[occupied] = (counts[:, occupied].T @ colors) / total[occupied, None]
+
+    alpha = np.log1p(total) / np.log1p(max(total.max(), 1))
+    image = background * (1 - alpha[:, None]) + mix * alpha[:, None]
+    return image.reshape(ny, nx, 3)
+
+
+class LiveRenderer:
+    """Visualización en vivo con artistas persistentes
+
+    La figura, los ejes, el hospital, la línea de capacidad sanitaria y la
+    leyenda se construyen una sola vez; en cada paso solo se actualizan las
+    posiciones de los cuatro grupos de la población (set_offsets), el texto
+    y las curvas S-I-R (set_data). Con un lienzo que permite blitting se
+    restaura el fondo guardado y se dibujan solo esos artistas.
+
+    Las curvas guardan a lo sumo Config.history_points puntos: al llenarse
+    se descarta uno de cada dos y se duplica el paso entre puntos, así el
+    costo de cada cuadro no crece con la duración de la simulación. Solo
+    se dibuja un cuadro cada Config.render_every pasos.
+
+    Con Config.render_mode 'density' (o 'auto' y más de
+    Config.density_threshold personas) la población no se dibuja con un
+    punto por persona sino como una imagen de densidad (density_image), y
+    el costo de cada cuadro depende del número de píxeles.
+
+    Keyword arguments
+    -----------------
+    Config : Configuration
+        configuración de la simulación
+
+    show : bool
+        si se muestra la ventana, falso al dibujar fuera de pantalla
+    """
+
+    def __init__(self, Config, show=True):
+        self.Config = Config
+        self.palette = Config.get_palette()
+        self.fig, self.spec, self.ax1, self.ax2 = build_fig(Config)
+        self.blit = getattr(self.fig.canvas, "supports_blit", False)
+
+        ax1, ax2 = self.ax1, self.ax2
+        ax1.set_xlim(Config.x_plot[0], Config.x_plot[1])
+        ax1.set_ylim(Config.y_plot[0], Config.y_plot[1])
+
+        if Config.self_isolate and Config.isolation_bounds != None:
+            build_hospital(
+                Config.isolation_bounds[0],
+                Config.isolation_bounds[2],
+                Config.isolation_bounds[1],
+                Config.isolation_bounds[3],
+                ax1
+            )
+
+        mode = Config.render_mode
+        if mode not in ("auto", "points", "density"):
+            raise ValueError("render_mode debe ser 'auto', 'points' o 'density'")
+        self.density = mode == "density" or (
+            mode == "auto" and Config.pop_size > Config.density_threshold
         )
 
-    # Segmentos de población
-    healthy = population[population[:, 6] == 0][:, 1:3]
-    ax1.scatter(healthy[:, 0], healthy[:, 1], color=palette[0], s=2, label="healthy")
-
-    infected = population[population[:, 6] == 1][:, 1:3]
-    ax1.scatter(infected[:, 0], infected[:, 1], color=palette[1], s=2, label="infected")
-
-    immune = population[population[:, 6] == 2][:, 1:3]
-    ax1.scatter(immune[:, 0], immune[:, 1], color=palette[2], s=2, label="immune")
-
-    fatalities = population[population[:, 6] == 3][:, 1:3]
-    ax1.scatter(fatalities[:, 0], fatalities[:, 1], color=palette[3], s=2, label="dead")
-
-    ax1.text(
-        Config.x_plot[0],
-        Config.y_plot[1] + ((Config.y_plot[1] - Config.y_plot[0]) / 100),
-        "Instante de tiempo: %i, Total: %i, Sanos: %i Infectados: %i Inmune: %i Fallecidos: %i"
-        % (
-            frame,
-            len(population),
-            len(healthy),
-            len(infected),
-            len(immune),
-            len(fatalities),
-        ),
-        fontsize=6,
-    )
-
-    ax2.set_title("Numero de infectados")
-    ax2.set_ylim(0, Config.pop_size + 200)
-
-    if Config.treatment_dependent_risk:
-        ax2.plot(
-            [Config.healthcare_capacity for x in range(len(pop_tracker.infectious))],
-            "r:",
-            label="Capacidad sanitaria",
+        self.scatters = []
+        self.image = None
+        if self.density:
+            self.colors = np.array([to_rgb(c) for c in self.palette])
+            self.background_color = np.array(to_rgb(ax1.get_facecolor()))
+            self.bins = density_bins(Config)
+            self.image = ax1.imshow(
+                np.zeros(self.bins[::-1] + (3,)),
+                extent=(*Config.x_plot, *Config.y_plot),
+                origin="lower",
+                interpolation="nearest",
+                aspect="auto",
+                animated=self.blit,
+            )
+        else:
+            labels = ["healthy", "infected", "immune", "dead"]
+            self.scatters = [
+                ax1.scatter([], [], color=color, s=2, label=label, animated=self.blit)
+                for color, label in zip(self.palette, labels)
+            ]
+        self.text = ax1.text(
+            Config.x_plot[0],
+            Config.y_plot[1] + ((Config.y_plot[1] - Config.y_plot[0]) / 100),
+            "",
+            fontsize=6,
+            animated=self.blit,
         )
 
-    if Config.plot_mode.lower() == "sir":
-        ax2.plot(pop_tracker.susceptible, color=palette[0], label="Susceptible")
-        ax2.plot(pop_tracker.infectious, color=palette[1], label="Infecciones")
-        ax2.plot(pop_tracker.recovered, color=palette[2], label="Recuperados")
-        ax2.plot(pop_tracker.fatalities, color=palette[3], label="Fallecidos")
-    else:
-        raise ValueError("Valor incorrecto use 'sir' para ver los datos completos")
-
-    ax2.legend(loc="best", fontsize=6)
-
-    plt.draw()
-    plt.pause(0.0001)
-
-    if Config.save_plot:
-        try:
-            plt.savefig("%s/%i.png" % (Config.plot_path, frame))
-        except:
-            check_folder(Config.plot_path)
-            plt.savefig("%s/%i.png" % (Config.plot_path, frame))
+        ax2.set_ylim(0, Config.pop_size + 200)
+        # el eje del tiempo se duplica cuando la simulación lo alcanza
+        self.xmax = max(1, min(Config.simulation_steps, 1000))
+        ax2.set_xlim(0, self.xmax)
+
+        if Config.treatment_dependent_risk:
+            ax2.axhline(
+                Config.healthcare_capacity,
+                color="r",
+                linestyle=":",
+                label="Capacidad sanitaria",
+            )
+
+        if Config.plot_mode.lower() != "sir":
+            raise ValueError("Valor incorrecto use 'sir' para ver los datos completos")
+
+        self.series = ["susceptible", "infectious", "recovered", "fatalities"]
+        series_labels = ["Susceptible", "Infecciones", "Recuperados", "Fallecidos"]
+        self.lines = [
+            ax2.plot([], [], color=color, label=label, animated=self.blit)[0]
+            for color, label in zip(self.palette, series_labels)
+        ]
+        ax2.legend(loc="best", fontsize=6)
+
+        # historia submuestreada de las curvas
+        self.stride = 1
+        self.history_x = []
+        self.history = [[] for _ in self.series]
+
+        self.background = None
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+        if show:
+            plt.show(block=False)
+
+    def _on_draw(self, event):
+        # un redibujado completo (inicio, cambio de tamaño) renueva el fondo
+        if self.blit:
+            self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _update_history(self, pop_tracker):
+        length = len(pop_tracker.infectious)
+        start = self.history_x[-1] + self.stride if self.history_x else 0
+        for t in range(start, length, self.stride):
+            self.history_x.append(t)
+            for values, name in zip(self.history, self.series):
+                values.append(getattr(pop_tracker, name)[t])
+
+        # una llamada puede agregar muchos puntos (render_every grande, o tras
+        # restaurar), se submuestrea hasta volver a quedar bajo el límite
+        while len(self.history_x) > max(self.Config.history_points, 1):
+            self.stride *= 2
+            self.history_x = self.history_x[::2]
+            self.history = [values[::2] for values in self.history]
+
+        for line, values in zip(self.lines, self.history):
+            line.set_data(self.history_x, values)
+
+        if length > self.xmax:
+            while length > self.xmax:
+                self.xmax *= 2
+            self.ax2.set_xlim(0, self.xmax)
+            # los límites cambiaron, el fondo guardado ya no sirve
+            self.background = None
+
+    def draw_tstep(self, population, pop_tracker, frame, writer=None):
+        """Actualiza los artistas con el paso frame y dibuja el cuadro
+
+        writer: BackgroundWriter opcional que escribe la imagen con save_plot
+        """
+
+        if frame % self.Config.render_every != 0:
+            return
+
+        state = population[:, 6]
+        x = population[:, 1]
+        y = population[:, 2]
+        if self.density:
+            self.image.set_data(
+                density_image(
+                    self.Config,
+                    x,
+                    y,
+                    state,
+                    self.colors,
+                    self.background_color,
+                    self.bins,
+                )
+            )
+            counts = np.bincount(state.astype(np.intp), minlength=4)
+        else:
+            counts = []
+            for s, scatter in enumerate(self.scatters):
+                mask = state == s
+                scatter.set_offsets(np.column_stack((x[mask], y[mask])))
+                counts.append(np.count_nonzero(mask))
+
+        self.text.set_text(
+            "Instante de tiempo: %i, Total: %i, Sanos: %i Infectados: %i Inmune: %i Fallecidos: %i"
+            % (frame, len(population), counts[0], counts[1], counts[2], counts[3])
+        )
+        self._update_history(pop_tracker)
+
+        canvas = self.fig.canvas
+        if not self.blit:
+            canvas.draw_idle()
+        else:
+            if self.background is None:
+                canvas.draw()
+                self.background = canvas.copy_from_bbox(self.fig.bbox)
+            canvas.restore_region(self.background)
+            artists = self.scatters + self.lines + [self.text]
+            if self.image is not None:
+                artists.append(self.image)
+            for artist in artists:
+                self.fig.draw_artist(artist)
+            canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+        if self.Config.save_plot:
+            check_folder(self.Config.plot_path)
+            # con blitting el búfer del lienzo ya tiene el cuadro completo
+            save_figure(
+                self.fig,
+                "%s/%i.png" % (self.Config.plot_path, frame),
+                writer,
+                redraw=not self.blit,
+            )
 
 
 def plot_sir(